@@ -1,4 +1,10 @@
-from .index import get_db_connection
-
-def get_db():
-    return get_db_connection()
+from .index import (
+    close_db,
+    get_db,
+    get_db_connection,
+    get_pool,
+    get_pool_stats,
+    init_app,
+    pooled_connection,
+)
+from .pool import ConnectionPool, PoolTimeout
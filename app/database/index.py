@@ -1,19 +1,91 @@
 import psycopg2
 import os
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g, has_app_context
+from .instrumentation import InstrumentedConnection, note_checkout
+from .pool import ConnectionPool
 
 load_dotenv()
 
-def get_db_connection():
-    conn = psycopg2.connect(
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_dsn_kwargs():
+    return dict(
         dbname=os.getenv('POSTGRES_DB', 'sm-db'),
         user=os.getenv('POSTGRES_USER', 'postgres'),
         password=os.getenv('POSTGRES_PASSWORD', 'root'),
         host=os.getenv('POSTGRES_HOST', 'localhost'),
         port=os.getenv('POSTGRES_PORT', '5432')
     )
+
+def get_db_connection():
+    """Open a dedicated (unpooled) connection - for scripts and one-off tools"""
+    conn = psycopg2.connect(**get_dsn_kwargs())
     return conn
 
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_dsn_kwargs(),
+                    min_size=int(os.getenv('DB_POOL_MIN', '1')),
+                    max_size=int(os.getenv('DB_POOL_MAX', '10')),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+                    max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+                    health_check_after=float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '30')),
+                    connection_factory=InstrumentedConnection,
+                )
+    return _pool
+
+def get_db():
+    """Return the pooled connection bound to the current request.
+
+    The first call in a request borrows a connection from the pool; later
+    calls (auth middleware, route handler, models) reuse it. It is returned
+    to the pool by close_db() when the app context is torn down.
+    """
+    if 'db_conn' not in g:
+        started = time.perf_counter()
+        g.db_conn = get_pool().getconn()
+        note_checkout(time.perf_counter() - started)
+    return g.db_conn
+
+def close_db(exception=None):
+    """Give the request connection back to the pool"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+@contextmanager
+def pooled_connection():
+    """Borrow a pooled connection outside of a request (background jobs, CLI)"""
+    if has_app_context() and 'db_conn' in g:
+        yield g.db_conn
+        return
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def get_pool_stats():
+    """Saturation stats for the connection pool (None until first use)"""
+    return _pool.stats() if _pool is not None else None
+
+def init_app(app):
+    """Register the per-request connection teardown and maintenance commands"""
+    from .maintenance import register_commands
+    app.teardown_appcontext(close_db)
+    register_commands(app)
+
 def test_db_connection():
     try:
         conn = get_db_connection()
@@ -0,0 +1,131 @@
+"""
+Statement timing for pooled connections.
+
+Pooled connections are InstrumentedConnection objects: every cursor they
+hand out (including RealDictCursor and other factories) times execute(),
+executemany() and copy_expert(). Inside a request the totals go to
+g.query_stats, which the timing middleware reports per request.
+Statements slower than SLOW_QUERY_MS are written to the `app.slow_queries`
+logger as one JSON object per line, with parameter values replaced by
+their types.
+"""
+import json
+import logging
+import os
+import time
+from flask import g, has_app_context, has_request_context, request
+from psycopg2 import extensions
+
+logger = logging.getLogger('app.slow_queries')
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))   # 0 disables the slow-query log
+SLOW_QUERY_MAX_CHARS = 2000
+
+
+class QueryStats:
+    """Database work done on behalf of one request"""
+
+    __slots__ = ('count', 'duration', 'connections', 'pool_wait')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.connections = 0
+        self.pool_wait = 0.0
+
+
+def current_stats():
+    if has_app_context():
+        return g.get('query_stats')
+    return None
+
+
+def note_checkout(wait):
+    """Count a pool checkout (and the time spent waiting) for the request"""
+    stats = current_stats()
+    if stats is not None:
+        stats.connections += 1
+        stats.pool_wait += wait
+
+
+def redact(params):
+    """Parameter types only: values can hold passwords, tokens, emails"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    try:
+        return [type(value).__name__ for value in params]
+    except TypeError:
+        return type(params).__name__
+
+
+def statement_text(cursor, query):
+    if not isinstance(query, (str, bytes)):
+        try:
+            query = query.as_string(cursor.connection)
+        except Exception:
+            query = repr(query)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    return ' '.join(query.split())[:SLOW_QUERY_MAX_CHARS]
+
+
+def record(cursor, query, params, duration):
+    stats = current_stats()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+    if SLOW_QUERY_MS and duration * 1000 >= SLOW_QUERY_MS:
+        entry = {
+            'event': 'slow_query',
+            'duration_ms': round(duration * 1000, 2),
+            'statement': statement_text(cursor, query),
+            'params': redact(params),
+            'rows': cursor.rowcount,
+        }
+        if has_request_context():
+            entry.update(method=request.method, endpoint=request.endpoint, path=request.path)
+        logger.warning(json.dumps(entry, default=str))
+
+
+class TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record(self, query, vars, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record(self, query, None, time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record(self, sql, None, time.perf_counter() - started)
+
+
+_timed_factories = {}
+
+
+def timed_factory(factory):
+    """The timed subclass of a cursor class (made once per class)"""
+    timed = _timed_factories.get(factory)
+    if timed is None:
+        timed = _timed_factories[factory] = type(f"Timed{factory.__name__}", (TimedCursorMixin, factory), {})
+    return timed
+
+
+class InstrumentedConnection(extensions.connection):
+    """psycopg2 connection whose cursors time their statements"""
+
+    def cursor(self, name=None, cursor_factory=None, *args, **kwargs):
+        factory = cursor_factory or self.cursor_factory or extensions.cursor
+        return super().cursor(name, timed_factory(factory), *args, **kwargs)
@@ -0,0 +1,422 @@
+"""
+Database maintenance commands (run with `flask --app app.main <command>`)
+"""
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+import click
+from app.utils.notification_jobs import run_job
+from app.utils.processing import DERIVED_DIR, process_blob
+from app.utils.uploads import UPLOAD_DIR, UPLOAD_TMP_DIR, UPLOAD_URL_PREFIX, discard
+from .index import pooled_connection
+
+NOTIFICATION_READ_RETENTION_DAYS = int(os.getenv('NOTIFICATION_READ_RETENTION_DAYS', '90'))
+NOTIFICATION_UNREAD_RETENTION_DAYS = int(os.getenv('NOTIFICATION_UNREAD_RETENTION_DAYS', '0'))
+NOTIFICATION_ARCHIVE_RETENTION_DAYS = int(os.getenv('NOTIFICATION_ARCHIVE_RETENTION_DAYS', '365'))
+NOTIFICATION_ARCHIVE_BATCH = int(os.getenv('NOTIFICATION_ARCHIVE_BATCH', '5000'))
+ARCHIVE_LOCK_ID = 0x6e6f7469  # pg advisory lock held while archiving
+
+def reconcile_enrollment_counts(conn):
+    """Recompute courses.enrolled_count from enrollments and fix any drift.
+
+    Returns the number of courses whose counter was corrected.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE courses c SET enrolled_count = s.actual
+            FROM (
+                SELECT c2.id, COUNT(e.id) AS actual
+                FROM courses c2
+                LEFT JOIN enrollments e ON e.course_id = c2.id
+                GROUP BY c2.id
+            ) s
+            WHERE c.id = s.id AND c.enrolled_count IS DISTINCT FROM s.actual
+        """)
+        fixed = cur.rowcount
+    conn.commit()
+    return fixed
+
+@click.command('reconcile-enrollment-counts')
+def reconcile_enrollment_counts_command():
+    """Fix drift between courses.enrolled_count and the enrollments table."""
+    started = time.monotonic()
+    with pooled_connection() as conn:
+        fixed = reconcile_enrollment_counts(conn)
+    click.echo(f"Reconciled enrolled_count: {fixed} course(s) corrected in {time.monotonic() - started:.2f}s")
+
+def reconcile_comment_likes(conn):
+    """Recompute comments.likes from comment_likes and fix any drift.
+
+    Returns the number of comments whose counter was corrected.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE comments c SET likes = s.actual
+            FROM (
+                SELECT c2.id, COUNT(cl.id) AS actual
+                FROM comments c2
+                LEFT JOIN comment_likes cl ON cl.comment_id = c2.id
+                GROUP BY c2.id
+            ) s
+            WHERE c.id = s.id AND c.likes IS DISTINCT FROM s.actual
+        """)
+        fixed = cur.rowcount
+    conn.commit()
+    return fixed
+
+@click.command('reconcile-comment-likes')
+def reconcile_comment_likes_command():
+    """Fix drift between comments.likes and the comment_likes table."""
+    started = time.monotonic()
+    with pooled_connection() as conn:
+        fixed = reconcile_comment_likes(conn)
+    click.echo(f"Reconciled comment likes: {fixed} comment(s) corrected in {time.monotonic() - started:.2f}s")
+
+def reconcile_notification_counts(conn):
+    """Recompute notification_counts.unread from notifications and fix any drift.
+
+    Returns the number of users whose counter was corrected.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO notification_counts (user_id, unread)
+            SELECT u.id, COUNT(n.id)
+            FROM users u
+            LEFT JOIN notifications n ON n.user_id = u.id AND n.is_read = false
+            GROUP BY u.id
+            ON CONFLICT (user_id) DO UPDATE SET unread = EXCLUDED.unread
+            WHERE notification_counts.unread IS DISTINCT FROM EXCLUDED.unread
+        """)
+        fixed = cur.rowcount
+    conn.commit()
+    return fixed
+
+@click.command('reconcile-notification-counts')
+def reconcile_notification_counts_command():
+    """Fix drift between notification_counts.unread and the notifications table."""
+    started = time.monotonic()
+    with pooled_connection() as conn:
+        fixed = reconcile_notification_counts(conn)
+    click.echo(f"Reconciled unread counts: {fixed} user(s) corrected in {time.monotonic() - started:.2f}s")
+
+def purge_stale_uploads(conn, max_age_hours):
+    """Abort pending upload sessions idle for longer than ``max_age_hours``
+    and delete their part files.
+
+    Returns the number of sessions purged.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE upload_sessions SET status = 'aborted', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'pending' AND updated_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+            RETURNING id
+        """, (max_age_hours,))
+        stale = [str(row[0]) for row in cur.fetchall()]
+    conn.commit()
+    for upload_id in stale:
+        discard(upload_id)
+    return len(stale)
+
+@click.command('purge-stale-uploads')
+@click.option('--max-age-hours', default=24, show_default=True, help='Idle time before a pending upload is purged.')
+def purge_stale_uploads_command(max_age_hours):
+    """Abort abandoned chunked uploads and free their disk space."""
+    started = time.monotonic()
+    with pooled_connection() as conn:
+        purged = purge_stale_uploads(conn, max_age_hours)
+    click.echo(f"Purged stale uploads: {purged} session(s) aborted in {time.monotonic() - started:.2f}s")
+
+def reconcile_media_blobs(conn):
+    """Recompute media_blobs.ref_count from course_files, tracking any stored
+    upload that is referenced but missing a row, and drop unreferenced rows.
+
+    Returns (rows corrected, rows dropped).
+    """
+    prefix = UPLOAD_URL_PREFIX + '/'
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO media_blobs (name, ref_count)
+            SELECT substr(f.file_url, length(%s) + 1), COUNT(*)
+            FROM course_files f
+            WHERE starts_with(f.file_url, %s)
+            GROUP BY 1
+            ON CONFLICT (name) DO UPDATE SET ref_count = EXCLUDED.ref_count
+            WHERE media_blobs.ref_count IS DISTINCT FROM EXCLUDED.ref_count
+        """, (prefix, prefix))
+        fixed = cur.rowcount
+        cur.execute("""
+            DELETE FROM media_blobs b
+            WHERE NOT EXISTS (SELECT 1 FROM course_files f WHERE f.file_url = %s || b.name)
+        """, (prefix,))
+        dropped = cur.rowcount
+    conn.commit()
+    return fixed, dropped
+
+def scrub_uploads(conn, grace_seconds, dry_run=False):
+    """Delete stored files no media_blobs row refers to, derived artifacts of
+    blobs that are gone, and leftovers in the temporary upload directory.
+    Files younger than ``grace_seconds`` are kept so in-flight uploads are
+    never touched.
+
+    Returns (orphans removed, bytes freed, names of tracked blobs missing on disk).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT name FROM media_blobs")
+        tracked = {row[0] for row in cur.fetchall()}
+        cur.execute("SELECT id FROM upload_sessions WHERE status = 'pending'")
+        pending_parts = {f"{row[0]}.part" for row in cur.fetchall()}
+    conn.commit()
+
+    cutoff = time.time() - grace_seconds
+    removed = freed = 0
+    on_disk = set()
+    for directory, keep in ((UPLOAD_DIR, tracked), (UPLOAD_TMP_DIR, pending_parts)):
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if directory == UPLOAD_DIR:
+                    on_disk.add(entry.name)
+                stat = entry.stat()
+                if entry.name in keep or stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                removed += 1
+                freed += stat.st_size
+    if os.path.isdir(DERIVED_DIR):
+        tracked_stems = {os.path.splitext(name)[0] for name in tracked}
+        with os.scandir(DERIVED_DIR) as entries:
+            for entry in entries:
+                if (entry.is_dir() and entry.name not in tracked_stems
+                        and entry.stat().st_mtime <= cutoff):
+                    if not dry_run:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    removed += 1
+    return removed, freed, sorted(tracked - on_disk)
+
+@click.command('scrub-uploads')
+@click.option('--grace-minutes', default=60, show_default=True, help='Leave files modified more recently than this alone.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed.')
+def scrub_uploads_command(grace_minutes, dry_run):
+    """Fix blob reference counts and delete orphaned upload files."""
+    started = time.monotonic()
+    with pooled_connection() as conn:
+        fixed, dropped = reconcile_media_blobs(conn)
+        removed, freed, missing = scrub_uploads(conn, grace_minutes * 60, dry_run)
+    click.echo(f"Reconciled media blobs: {fixed} ref count(s) corrected, {dropped} unreferenced")
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {removed} orphaned file(s), "
+               f"{freed / (1024 * 1024):.1f} MiB in {time.monotonic() - started:.2f}s")
+    for name in missing:
+        click.echo(f"Missing on disk: {name}", err=True)
+
+@click.command('process-media')
+@click.option('--retry-failed', is_flag=True, help='Also retry blobs whose processing failed.')
+@click.option('--reset-stuck', is_flag=True, help='Requeue blobs left "processing" by a crashed worker.')
+def process_media_command(retry_failed, reset_stuck):
+    """Process uploaded media that is still waiting (runs in the foreground)."""
+    started = time.monotonic()
+    statuses = ['pending', 'failed'] if retry_failed else ['pending']
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            if reset_stuck:
+                cur.execute("UPDATE media_blobs SET processing_status = 'pending' WHERE processing_status = 'processing'")
+            cur.execute("""
+                SELECT name FROM media_blobs WHERE processing_status = ANY(%s) ORDER BY created_at
+            """, (statuses,))
+            names = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    results = {}
+    for name in names:
+        status = process_blob(name, retry_failed=retry_failed)
+        if status:
+            results[status] = results.get(status, 0) + 1
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(results.items())) or 'nothing to do'
+    click.echo(f"Processed media: {summary} in {time.monotonic() - started:.2f}s")
+
+@click.command('run-notification-jobs')
+@click.option('--resume', is_flag=True, help='Also resume jobs left "running" by a stopped process.')
+def run_notification_jobs_command(resume):
+    """Send queued bulk notification jobs (runs in the foreground)."""
+    started = time.monotonic()
+    statuses = ['queued', 'running'] if resume else ['queued']
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM notification_jobs WHERE status = ANY(%s) ORDER BY created_at", (statuses,))
+            job_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+    for job_id in job_ids:
+        status = run_job(job_id, resume=resume)
+        if status:
+            click.echo(f"Job {job_id}: {status}")
+    click.echo(f"Ran {len(job_ids)} notification job(s) in {time.monotonic() - started:.2f}s")
+
+def archive_partition_name(month):
+    return f"notifications_archive_{month:%Y%m}"
+
+def ensure_archive_partitions(conn, is_read, cutoff):
+    """Create the monthly archive partitions the rows about to move fall in.
+
+    Returns the names of the partitions created.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(created_at) FROM notifications WHERE is_read = %s AND created_at < %s",
+                    (is_read, cutoff))
+        oldest = cur.fetchone()[0]
+        if oldest is None:
+            return []
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'notifications_archive'::regclass
+        """)
+        existing = {row[0] for row in cur.fetchall()}
+        created = []
+        month = date(oldest.year, oldest.month, 1)
+        while month <= cutoff.date():
+            following = (month + timedelta(days=32)).replace(day=1)
+            name = archive_partition_name(month)
+            if name not in existing:
+                cur.execute(f"""
+                    CREATE TABLE {name} PARTITION OF notifications_archive
+                    FOR VALUES FROM (%s) TO (%s)
+                """, (month, following))
+                created.append(name)
+            month = following
+    conn.commit()
+    return created
+
+def archive_notifications(conn, is_read, cutoff, batch_size, keep=True):
+    """Move notifications older than ``cutoff`` out of the live table, one
+    committed batch at a time, into notifications_archive (or nowhere, with
+    keep=False). Unread counters follow the unread rows that move.
+
+    Returns the number of rows moved.
+    """
+    moved = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH doomed AS (
+                    SELECT id FROM notifications
+                    WHERE is_read = %(is_read)s AND created_at < %(cutoff)s
+                    ORDER BY created_at
+                    LIMIT %(batch)s
+                    FOR UPDATE SKIP LOCKED
+                ), moved AS (
+                    DELETE FROM notifications n USING doomed d
+                    WHERE n.id = d.id
+                    RETURNING n.id, n.user_id, n.title, n.message, n.is_read, n.created_at
+                ), archived AS (
+                    INSERT INTO notifications_archive (id, user_id, title, message, is_read, created_at)
+                    SELECT id, user_id, title, message, is_read, created_at FROM moved
+                    WHERE %(keep)s
+                    RETURNING 1
+                ), uncounted AS (
+                    UPDATE notification_counts nc SET unread = GREATEST(nc.unread - m.n, 0)
+                    FROM (
+                        SELECT user_id, COUNT(*) AS n FROM moved WHERE is_read = false GROUP BY user_id
+                    ) m
+                    WHERE nc.user_id = m.user_id
+                    RETURNING 1
+                )
+                SELECT (SELECT COUNT(*) FROM moved),
+                       (SELECT COUNT(*) FROM archived),
+                       (SELECT COUNT(*) FROM uncounted)
+            """, {'is_read': is_read, 'cutoff': cutoff, 'batch': batch_size, 'keep': keep})
+            count = cur.fetchone()[0]
+        conn.commit()
+        moved += count
+        if count < batch_size:
+            return moved
+
+def drop_archive_partitions(conn, cutoff):
+    """Drop archive partitions that end before ``cutoff`` and delete expired
+    rows that landed in the default partition.
+
+    Returns (partitions dropped, default-partition rows deleted).
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'notifications_archive'::regclass
+              AND c.relname ~ '^notifications_archive_[0-9]{6}$'
+            ORDER BY c.relname
+        """)
+        names = [row[0] for row in cur.fetchall()]
+    dropped = []
+    for name in names:
+        month = datetime.strptime(name[-6:], '%Y%m').date()
+        if (month + timedelta(days=32)).replace(day=1) > cutoff.date():
+            break
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE {name}")
+        conn.commit()
+        dropped.append(name)
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM notifications_archive_default WHERE created_at < %s", (cutoff,))
+        deleted = cur.rowcount
+    conn.commit()
+    return dropped, deleted
+
+@click.command('archive-notifications')
+@click.option('--read-days', default=NOTIFICATION_READ_RETENTION_DAYS, show_default=True,
+              help='Move read notifications older than this many days (0 keeps them).')
+@click.option('--unread-days', default=NOTIFICATION_UNREAD_RETENTION_DAYS, show_default=True,
+              help='Move unread notifications older than this many days (0 keeps them).')
+@click.option('--archive-days', default=NOTIFICATION_ARCHIVE_RETENTION_DAYS, show_default=True,
+              help='Drop archive partitions older than this many days (0 keeps them).')
+@click.option('--batch-size', default=NOTIFICATION_ARCHIVE_BATCH, show_default=True,
+              help='Rows moved per transaction.')
+@click.option('--no-archive', is_flag=True, help='Delete expired notifications instead of archiving them.')
+def archive_notifications_command(read_days, unread_days, archive_days, batch_size, no_archive):
+    """Move notifications past their retention period out of the live table."""
+    started = time.monotonic()
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s), LOCALTIMESTAMP", (ARCHIVE_LOCK_ID,))
+            locked, now = cur.fetchone()
+        conn.commit()
+        if not locked:
+            raise click.ClickException('Another archive-notifications run is in progress')
+        try:
+            for is_read, days in ((True, read_days), (False, unread_days)):
+                if days <= 0:
+                    continue
+                pass_started = time.monotonic()
+                cutoff = now - timedelta(days=days)
+                if not no_archive:
+                    for name in ensure_archive_partitions(conn, is_read, cutoff):
+                        click.echo(f"Created partition {name}")
+                moved = archive_notifications(conn, is_read, cutoff, batch_size, keep=not no_archive)
+                click.echo(f"{'Deleted' if no_archive else 'Archived'} {moved} "
+                           f"{'read' if is_read else 'unread'} notification(s) older than {days} day(s) "
+                           f"in {time.monotonic() - pass_started:.2f}s")
+            if archive_days > 0:
+                dropped, deleted = drop_archive_partitions(conn, now - timedelta(days=archive_days))
+                for name in dropped:
+                    click.echo(f"Dropped partition {name}")
+                if deleted:
+                    click.echo(f"Deleted {deleted} expired row(s) from notifications_archive_default")
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (ARCHIVE_LOCK_ID,))
+            conn.commit()
+    click.echo(f"Notification retention finished in {time.monotonic() - started:.2f}s")
+
+def register_commands(app):
+    app.cli.add_command(reconcile_enrollment_counts_command)
+    app.cli.add_command(reconcile_comment_likes_command)
+    app.cli.add_command(reconcile_notification_counts_command)
+    app.cli.add_command(purge_stale_uploads_command)
+    app.cli.add_command(scrub_uploads_command)
+    app.cli.add_command(process_media_command)
+    app.cli.add_command(run_notification_jobs_command)
+    app.cli.add_command(archive_notifications_command)
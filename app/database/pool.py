@@ -0,0 +1,188 @@
+"""
+Thread-safe PostgreSQL connection pool
+"""
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of psycopg2 connections.
+
+    Connections are health-checked when borrowed, recycled once they are
+    older than ``max_lifetime`` and handed back in a clean (rolled back)
+    state when returned.
+    """
+
+    def __init__(self, dsn_kwargs, min_size=1, max_size=10, timeout=5.0,
+                 max_lifetime=1800.0, health_check_after=30.0, connection_factory=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size: min=%s max=%s' % (min_size, max_size))
+        self.dsn_kwargs = dsn_kwargs
+        self.connection_factory = connection_factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._lock = threading.Condition()
+        self._idle = []          # [(conn, created_at, last_used_at)]
+        self._in_use = {}        # id(conn) -> created_at
+        self._waiting = 0
+        self._connecting = 0
+        self._closed = False
+
+        # Counters exposed through stats()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._connects = 0
+        self._discarded = 0
+        self._wait_time = 0.0
+
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+            self._connects += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(connection_factory=self.connection_factory, **self.dsn_kwargs)
+        now = time.monotonic()
+        return conn, now, now
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._connecting
+
+    def _is_healthy(self, conn, created_at, last_used_at):
+        """Check a connection before handing it out"""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if self.health_check_after is not None and now - last_used_at > self.health_check_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Borrow a connection, waiting up to ``timeout`` seconds"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            candidate = None
+            with self._lock:
+                while candidate is None:
+                    if self._closed:
+                        raise PoolTimeout('Connection pool is closed')
+                    if self._idle:
+                        candidate = self._idle.pop()
+                        # Reserve the slot while the health check runs unlocked
+                        self._in_use[id(candidate[0])] = candidate[1]
+                    elif self.size < self.max_size:
+                        self._connecting += 1
+                        break
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeout(
+                                'No database connection available after %.1fs (max_size=%d)'
+                                % (self.timeout, self.max_size))
+                        self._waiting += 1
+                        try:
+                            self._lock.wait(remaining)
+                        finally:
+                            self._waiting -= 1
+
+            if candidate is None:
+                # Open a new connection outside the lock so slow handshakes
+                # don't block other borrowers
+                try:
+                    conn, created_at, _ = self._connect()
+                finally:
+                    with self._lock:
+                        self._connecting -= 1
+                        self._lock.notify()
+                with self._lock:
+                    self._connects += 1
+                    self._in_use[id(conn)] = created_at
+                    return self._checkout(conn, started)
+
+            conn, created_at, last_used_at = candidate
+            if self._is_healthy(conn, created_at, last_used_at):
+                with self._lock:
+                    return self._checkout(conn, started)
+            with self._lock:
+                self._in_use.pop(id(conn), None)
+                self._discard(conn)
+                self._lock.notify()
+
+    def _checkout(self, conn, started):
+        self._checkouts += 1
+        self._wait_time += time.monotonic() - started
+        return conn
+
+    def putconn(self, conn):
+        """Return a borrowed connection to the pool"""
+        with self._lock:
+            created_at = self._in_use.pop(id(conn), None)
+            if created_at is None:
+                raise ValueError('Connection does not belong to this pool')
+
+            if not conn.closed and not self._closed:
+                try:
+                    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    self._idle.append((conn, created_at, time.monotonic()))
+                except psycopg2.Error:
+                    self._discard(conn)
+            else:
+                self._discard(conn)
+            self._lock.notify()
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._lock:
+            self._closed = True
+            for conn, _, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._lock.notify_all()
+
+    def stats(self):
+        """Snapshot of pool saturation"""
+        with self._lock:
+            in_use = len(self._in_use)
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': in_use + len(self._idle),
+                'in_use': in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'utilization': round(in_use / self.max_size, 3),
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'connects': self._connects,
+                'discarded': self._discarded,
+                'avg_wait_ms': round(self._wait_time / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+            }
@@ -2,6 +2,7 @@
 Flask crud backend
 """
 
+import logging
 from flask import Flask, jsonify, render_template, request, redirect, url_for
 from app.routes.users import bp as users_bp
 from app.routes.courses import bp as courses_bp
@@ -10,30 +11,40 @@ from app.routes.enrollments import bp as enrollments_bp
 from app.routes.comments import bp as comments_bp
 from app.routes.notifications import bp as notifications_bp
 from app.routes.auth import bp as auth_bp, verify_token
+from app.routes.health import bp as health_bp
+from app.routes.metrics import bp as metrics_bp
+from app.routes.profiles import bp as profiles_bp
+from app.database import init_app as init_db, PoolTimeout
+from app.utils.serialization import init_app as init_json
+from app.middleware.timing import init_app as init_timing
+from app.utils.metrics import METRICS_ENABLED
+from app.utils.profiling import init_app as init_profiling
+from app.utils.media import init_app as init_media
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_db(app)
+init_json(app)
+init_timing(app)
+init_profiling(app)
+init_media(app)
 
 def require_teacher_or_admin():
     """Decorator to require teacher or admin role for frontend routes"""
     def decorator(func):
         def wrapper(*args, **kwargs):
-            print(f"DEBUG: require_teacher_or_admin decorator called for {func.__name__}")
             token = request.cookies.get('auth_token') or request.headers.get('Authorization', '').replace('Bearer ', '')
-            print(f"DEBUG: token found: {bool(token)}")
             if not token:
-                print("DEBUG: No token, redirecting to login")
                 return redirect('/login')
             
             try:
                 user = verify_token(token)
-                print(f"DEBUG: user verified: {user}")
                 if user['role'] not in ['teacher', 'admin']:
-                    print(f"DEBUG: user role {user['role']} not authorized, redirecting to courses")
                     return redirect('/courses')  # Redirect to courses page if not authorized
-                print("DEBUG: user authorized, calling function")
                 return func(*args, **kwargs)
-            except Exception as e:
-                print(f"DEBUG: exception in decorator: {e}")
+            except Exception:
+                logger.debug("Frontend auth failed for %s", func.__name__, exc_info=True)
                 return redirect('/login')
         wrapper.__name__ = func.__name__
         return wrapper
@@ -72,6 +83,10 @@ app.register_blueprint(enrollments_bp, url_prefix="/api/enrollments")
 app.register_blueprint(comments_bp, url_prefix="/api/comments")
 app.register_blueprint(notifications_bp, url_prefix="/api/notifications")
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
+app.register_blueprint(health_bp, url_prefix="/api/health")
+app.register_blueprint(profiles_bp, url_prefix="/api/profiles")
+if METRICS_ENABLED:
+    app.register_blueprint(metrics_bp)
 
 # Frontend Routes
 @app.route('/')
@@ -108,7 +123,6 @@ def course_detail(course_id):
 #@require_teacher_or_admin()
 def create_course():
     """Create course page - only for teachers and admins"""
-    print("DEBUG: create_course route called")
     return render_template('courses/create.html')
 
 
@@ -183,6 +197,11 @@ def not_found(e):
     """ Handle 404 errors """
     return render_template('404.html'), 404
 
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    """ Handle database pool exhaustion """
+    return jsonify({"error": "Database busy, try again", "message": str(e)}), 503
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     """ Handle Exception errors """
@@ -4,48 +4,73 @@ Authentication middleware for role-based access control
 import jwt
 import os
 from functools import wraps
-from flask import request, jsonify, current_app
-from app.database import get_db_connection
+from flask import g, request, jsonify, current_app
+from app.database import get_db
+from app.middleware.user_cache import user_cache
 
 SECRET_KEY = os.getenv('JWT_SECRET', 'your_secret_key')
 ALGORITHM = 'HS256'
 
-def get_current_user():
-    """Extract current user from JWT token"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header or not auth_header.startswith('Bearer '):
+def load_user(user_id):
+    """Fetch a user by id, going through the process-wide cache first"""
+    user = user_cache.get(user_id)
+    if user:
+        return dict(user)
+
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute('SELECT id, email, name, role FROM users WHERE id = %s', (user_id,))
+        row = cur.fetchone()
+    if not row:
         return None
-    
-    token = auth_header.split(' ')[1]
+
+    user = {
+        'id': str(row[0]),
+        'email': row[1],
+        'name': row[2],
+        'role': row[3]
+    }
+    user_cache.set(user_id, dict(user))
+    return user
+
+def resolve_token(token):
+    """Decode a JWT and return the user it belongs to (or None)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get('sub')
-        
-        if not user_id:
-            return None
-            
-        # Get user details from database
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute('SELECT id, email, name, role FROM users WHERE id = %s', (user_id,))
-                user = cur.fetchone()
-                if user:
-                    return {
-                        'id': str(user[0]),
-                        'email': user[1],
-                        'name': user[2],
-                        'role': user[3]
-                    }
-        finally:
-            conn.close()
-            
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
-    
-    return None
+
+    user_id = payload.get('sub')
+    if not user_id:
+        return None
+    return load_user(user_id)
+
+def get_current_user():
+    """Extract current user from JWT token (resolved once per request)"""
+    if 'current_user' in g:
+        return g.current_user
+
+    user = None
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        user = resolve_token(auth_header.split(' ')[1])
+
+    g.current_user = user
+    return user
+
+def get_browser_user():
+    """Like get_current_user(), but also accepts the auth_token cookie.
+
+    For endpoints the browser calls directly (<video src>, EventSource),
+    which can't send an Authorization header.
+    """
+    user = get_current_user()
+    if not user and request.cookies.get('auth_token'):
+        user = resolve_token(request.cookies['auth_token'])
+        g.current_user = user
+    return user
 
 def require_auth(f):
     """Decorator to require authentication"""
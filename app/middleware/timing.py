@@ -0,0 +1,92 @@
+"""
+Per-request timing.
+
+Every request records its wall time and the database work done for it
+(statements, time spent in them, pool checkouts and the wait for them).
+The numbers are sent back in a Server-Timing header, which browser dev
+tools show next to the request, and logged to `app.requests` as one JSON
+object per line: at DEBUG for every request, at WARNING once a request
+takes longer than SLOW_REQUEST_MS. They also feed the per-route metrics
+exposed at /metrics.
+"""
+import json
+import logging
+import os
+import time
+from flask import g, request
+from app.database.instrumentation import QueryStats
+from app.utils.metrics import METRICS_ENABLED, Counter, Histogram
+
+logger = logging.getLogger('app.requests')
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+
+REQUESTS = Counter('http_requests_total', 'Requests handled, by route and status',
+                   ('blueprint', 'endpoint', 'method', 'status'))
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Request latency, by route',
+                             ('blueprint', 'endpoint'))
+REQUEST_STATEMENTS = Counter('http_request_db_statements_total', 'SQL statements run for requests, by route',
+                             ('blueprint', 'endpoint'))
+REQUEST_DB_SECONDS = Counter('http_request_db_seconds_total', 'Time spent in SQL for requests, by route',
+                             ('blueprint', 'endpoint'))
+REQUEST_POOL_WAIT = Counter('http_request_pool_wait_seconds_total', 'Time requests waited for a pooled connection',
+                            ('blueprint',))
+
+
+def observe(elapsed, stats, status):
+    blueprint = request.blueprint or 'app'
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(blueprint, endpoint, request.method, str(status))
+    REQUEST_DURATION.observe(elapsed, blueprint, endpoint)
+    if stats.count:
+        REQUEST_STATEMENTS.inc(blueprint, endpoint, amount=stats.count)
+        REQUEST_DB_SECONDS.inc(blueprint, endpoint, amount=stats.duration)
+    if stats.pool_wait:
+        REQUEST_POOL_WAIT.inc(blueprint, amount=stats.pool_wait)
+
+
+def start_timer():
+    g.request_started = time.perf_counter()
+    g.query_stats = QueryStats()
+
+
+def finish_timer(response):
+    started = g.pop('request_started', None)
+    stats = g.get('query_stats')
+    if started is None or stats is None:
+        return response
+    elapsed = time.perf_counter() - started
+    elapsed_ms = elapsed * 1000
+    db_ms = stats.duration * 1000
+    pool_ms = stats.pool_wait * 1000
+
+    if SERVER_TIMING:
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={elapsed_ms:.1f}, db;dur={db_ms:.1f};desc="{stats.count} queries", pool;dur={pool_ms:.1f}')
+
+    if METRICS_ENABLED:
+        observe(elapsed, stats, response.status_code)
+
+    slow = elapsed_ms >= SLOW_REQUEST_MS
+    if slow or logger.isEnabledFor(logging.DEBUG):
+        entry = {
+            'event': 'slow_request' if slow else 'request',
+            'method': request.method,
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(elapsed_ms, 2),
+            'db_ms': round(db_ms, 2),
+            'queries': stats.count,
+            'connections': stats.connections,
+            'pool_wait_ms': round(pool_ms, 2),
+        }
+        logger.log(logging.WARNING if slow else logging.DEBUG, json.dumps(entry))
+    return response
+
+
+def init_app(app):
+    app.before_request(start_timer)
+    app.after_request(finish_timer)
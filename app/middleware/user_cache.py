@@ -0,0 +1,15 @@
+"""
+Process-wide TTL/LRU cache of resolved users, keyed by token subject
+"""
+import os
+from app.utils.cache import TTLCache
+
+user_cache = TTLCache(
+    ttl=float(os.getenv('USER_CACHE_TTL', '0')),
+    maxsize=int(os.getenv('USER_CACHE_SIZE', '1024')),
+)
+
+
+def invalidate_user(user_id):
+    """Drop a user from the process-wide cache after it changes"""
+    user_cache.invalidate(str(user_id))
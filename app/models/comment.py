@@ -13,8 +13,10 @@ class CommentModel:
     def create(self, file_id, user_id, comment, parent_id=None, likes=0):
         with self.conn.cursor() as cur:
             cur.execute("""
-                INSERT INTO comments (file_id, user_id, comment, parent_id, likes)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, (file_id, user_id, comment, parent_id, likes))
+                INSERT INTO comments (file_id, user_id, comment, parent_id, likes, root_id)
+                VALUES (%s, %s, %s, %s, %s,
+                        (SELECT COALESCE(p.root_id, p.id) FROM comments p WHERE p.id = %s))
+                RETURNING id
+            """, (file_id, user_id, comment, parent_id, likes, parent_id))
             self.conn.commit()
             return cur.fetchone()[0]
@@ -1,5 +1,35 @@
+import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from app.database import pooled_connection
+from app.utils.counters import DeltaBuffer
+from app.utils.response_cache import invalidate
+
+# 'direct': comments.likes is updated in the same statement as the like row.
+# 'batched': only the like row is written per request; count deltas are
+# summed in memory and applied every LIKE_FLUSH_INTERVAL seconds, so likers
+# of a hot comment stop queueing on its row lock. comment_likes stays the
+# source of truth (see `flask reconcile-comment-likes`).
+LIKE_COUNTER_MODE = os.getenv('LIKE_COUNTER_MODE', 'direct')
+
+def flush_like_deltas(deltas):
+    """Apply {comment_id: delta} to comments.likes in one statement"""
+    comment_ids = list(deltas)
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE comments c SET likes = GREATEST(c.likes + d.delta, 0)
+                FROM unnest(%s::uuid[], %s::int[]) AS d(id, delta)
+                WHERE c.id = d.id
+                RETURNING c.file_id, (SELECT f.course_id FROM course_files f WHERE f.id = c.file_id)
+            """, (comment_ids, [deltas[comment_id] for comment_id in comment_ids]))
+            touched = set(cur.fetchall())
+        conn.commit()
+    # Cached comment lists carry the counts
+    invalidate('comments', *(tag for file_id, course_id in touched
+                             for tag in (f"comments:file:{file_id}", f"comments:course:{course_id}")))
+
+like_deltas = DeltaBuffer(flush_like_deltas, interval=float(os.getenv('LIKE_FLUSH_INTERVAL', '2')))
 
 class CommentLikeModel:
     def __init__(self, conn):
@@ -18,3 +48,81 @@ class CommentLikeModel:
             """, (comment_id, user_id))
             self.conn.commit()
             return cur.fetchone()[0]
+
+    def like(self, comment_id, user_id):
+        """Add a like. Returns False if the user already liked the comment.
+
+        Raises psycopg2.IntegrityError if the comment does not exist.
+        """
+        comment_id = str(comment_id)
+        with self.conn.cursor() as cur:
+            if LIKE_COUNTER_MODE == 'batched':
+                cur.execute("""
+                    INSERT INTO comment_likes (comment_id, user_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT (comment_id, user_id) DO NOTHING
+                    RETURNING comment_id
+                """, (comment_id, user_id))
+                added = cur.fetchone() is not None
+                self.conn.commit()
+                # Only count likes that are committed
+                if added:
+                    like_deltas.add(comment_id, 1)
+                return added
+
+            # Insert and bump the counter in one statement
+            cur.execute("""
+                WITH added AS (
+                    INSERT INTO comment_likes (comment_id, user_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT (comment_id, user_id) DO NOTHING
+                    RETURNING comment_id
+                )
+                UPDATE comments SET likes = likes + 1
+                WHERE id = (SELECT comment_id FROM added)
+                RETURNING id
+            """, (comment_id, user_id))
+            added = cur.fetchone() is not None
+            self.conn.commit()
+            return added
+
+    def unlike(self, comment_id, user_id):
+        """Remove a like. Returns False if there was none."""
+        comment_id = str(comment_id)
+        with self.conn.cursor() as cur:
+            if LIKE_COUNTER_MODE == 'batched':
+                cur.execute("""
+                    DELETE FROM comment_likes
+                    WHERE comment_id = %s AND user_id = %s
+                    RETURNING comment_id
+                """, (comment_id, user_id))
+                removed = cur.fetchone() is not None
+                self.conn.commit()
+                if removed:
+                    like_deltas.add(comment_id, -1)
+                return removed
+
+            cur.execute("""
+                WITH removed AS (
+                    DELETE FROM comment_likes
+                    WHERE comment_id = %s AND user_id = %s
+                    RETURNING comment_id
+                )
+                UPDATE comments SET likes = GREATEST(likes - 1, 0)
+                WHERE id = (SELECT comment_id FROM removed)
+                RETURNING id
+            """, (comment_id, user_id))
+            removed = cur.fetchone() is not None
+            self.conn.commit()
+            return removed
+
+    def liked_among(self, user_id, comment_ids):
+        """Subset of comment_ids the user has liked, in one query"""
+        if not comment_ids:
+            return set()
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT comment_id FROM comment_likes
+                WHERE user_id = %s AND comment_id = ANY(%s::uuid[])
+            """, (user_id, [str(comment_id) for comment_id in comment_ids]))
+            return {str(row[0]) for row in cur.fetchall()}
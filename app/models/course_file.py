@@ -1,5 +1,18 @@
+import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from app.utils.cache import TTLCache
+
+# course_id -> id of its discussion file. The mapping only changes when the
+# file or course is deleted, so entries can live long.
+discussion_files = TTLCache(
+    ttl=float(os.getenv('DISCUSSION_CACHE_TTL', '3600')),
+    maxsize=int(os.getenv('DISCUSSION_CACHE_SIZE', '4096')),
+)
+
+def forget_discussion_file(course_id):
+    """Drop a course's cached discussion file (after deleting it or the course)"""
+    discussion_files.invalidate(str(course_id))
 
 class CourseFileModel:
     def __init__(self, conn):
@@ -18,3 +31,41 @@ class CourseFileModel:
             """, (course_id, title, file_type, file_url, file_order))
             self.conn.commit()
             return cur.fetchone()[0]
+
+    def get_discussion_file_id(self, course_id, create=False):
+        """Id of the course's discussion file, cached per process.
+
+        With create=True the file is made on first use by an atomic upsert
+        against the one-discussion-file-per-course unique index. The caller
+        owns the transaction (nothing is committed here).
+        """
+        course_id = str(course_id)
+        file_id = discussion_files.get(course_id)
+        if file_id:
+            return file_id
+
+        with self.conn.cursor() as cur:
+            if create:
+                # DO UPDATE (not DO NOTHING) so RETURNING yields the existing row too
+                cur.execute("""
+                    INSERT INTO course_files (course_id, title, file_type, file_url, file_order)
+                    VALUES (%s, 'Course Discussion', 'discussion', '/course-discussion', 999)
+                    ON CONFLICT (course_id) WHERE file_type = 'discussion'
+                    DO UPDATE SET file_type = EXCLUDED.file_type
+                    RETURNING id, (xmax = 0) AS inserted
+                """, (course_id,))
+            else:
+                cur.execute("""
+                    SELECT id, false FROM course_files
+                    WHERE course_id = %s AND file_type = 'discussion'
+                """, (course_id,))
+            row = cur.fetchone()
+
+        if not row:
+            return None
+        file_id = str(row[0])
+        # A row inserted just now is only cached once its transaction commits
+        # (the next lookup will see it), so a rollback can't leave a stale id
+        if not row[1]:
+            discussion_files.set(course_id, file_id)
+        return file_id
@@ -18,3 +18,24 @@ class EnrollmentModel:
             """, (student_id, course_id))
             self.conn.commit()
             return cur.fetchone()[0]
+
+    def status_for_courses(self, student_id, course_ids):
+        """Enrollment state of one student across many courses, in one query.
+
+        Returns {course_id: {'enrollment_id', 'enrolled_at'}} for the courses
+        the student is enrolled in; missing ids are not enrolled.
+        """
+        if not course_ids:
+            return {}
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT course_id, id, enrolled_at FROM enrollments
+                WHERE student_id = %s AND course_id = ANY(%s::uuid[])
+            """, (str(student_id), [str(course_id) for course_id in course_ids]))
+            return {
+                str(row[0]): {
+                    'enrollment_id': str(row[1]),
+                    'enrolled_at': row[2].isoformat() if row[2] else None
+                }
+                for row in cur.fetchall()
+            }
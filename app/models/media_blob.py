@@ -0,0 +1,45 @@
+class MediaBlobModel:
+    """Reference counts for content-addressed upload blobs.
+
+    Every course_files row whose file_url points at a stored blob holds one
+    reference. The caller owns the transaction: the row lock taken here
+    serializes a blob's last release against a concurrent re-upload of the
+    same content.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def acquire(self, name, sha256, size):
+        """Add a reference, creating the blob row on first use.
+
+        Returns True if the blob is new (it still needs processing).
+        """
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO media_blobs (name, sha256, size, ref_count)
+                VALUES (%s, %s, %s, 1)
+                ON CONFLICT (name) DO UPDATE SET ref_count = media_blobs.ref_count + 1
+                RETURNING (xmax = 0) AS inserted
+            """, (name, sha256, size))
+            return cur.fetchone()[0]
+
+    def add_ref(self, name):
+        """Add a reference to an existing blob (False if it isn't tracked)"""
+        with self.conn.cursor() as cur:
+            cur.execute("UPDATE media_blobs SET ref_count = ref_count + 1 WHERE name = %s", (name,))
+            return cur.rowcount == 1
+
+    def release(self, name):
+        """Drop a reference. Returns True if it was the last one (row deleted)"""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                UPDATE media_blobs SET ref_count = ref_count - 1
+                WHERE name = %s
+                RETURNING ref_count
+            """, (name,))
+            row = cur.fetchone()
+            if not row or row[0] > 0:
+                return False
+            cur.execute("DELETE FROM media_blobs WHERE name = %s AND ref_count <= 0", (name,))
+            return cur.rowcount == 1
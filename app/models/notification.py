@@ -1,6 +1,21 @@
+import json
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+NOTIFY_CHANNEL = 'notifications'
+
+def adjust_unread_count(cur, user_id, delta):
+    """Keep notification_counts.unread in step with notifications (same transaction)"""
+    cur.execute("""
+        INSERT INTO notification_counts (user_id, unread) VALUES (%s, GREATEST(%s, 0))
+        ON CONFLICT (user_id) DO UPDATE SET unread = GREATEST(notification_counts.unread + %s, 0)
+    """, (str(user_id), delta, delta))
+
+def notify_created(cur, notification_id, user_id):
+    """Announce a new notification to live streams (delivered on commit)"""
+    cur.execute("SELECT pg_notify(%s, %s)", (
+        NOTIFY_CHANNEL, json.dumps({'id': str(notification_id), 'user_id': str(user_id)})))
+
 class NotificationModel:
     def __init__(self, conn):
         self.conn = conn
@@ -16,5 +31,42 @@ class NotificationModel:
                 INSERT INTO notifications (user_id, title, message, is_read)
                 VALUES (%s, %s, %s, %s) RETURNING id
             """, (user_id, title, message, is_read))
+            notification_id = cur.fetchone()[0]
+            if not is_read:
+                adjust_unread_count(cur, user_id, 1)
+            notify_created(cur, notification_id, user_id)
             self.conn.commit()
-            return cur.fetchone()[0]
+            return notification_id
+
+    def unread_count(self, user_id):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT unread FROM notification_counts WHERE user_id = %s", (str(user_id),))
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+    def mark_read(self, user_id, notification_ids=None):
+        """Mark some (or, with no ids, all) of a user's notifications read in
+        one statement. Returns (rows marked, unread left). The caller commits.
+        """
+        id_filter = "AND id = ANY(%s::uuid[])" if notification_ids is not None else ""
+        params = [str(user_id)]
+        if notification_ids is not None:
+            params.append([str(i) for i in notification_ids])
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                WITH marked AS (
+                    UPDATE notifications SET is_read = true
+                    WHERE user_id = %s AND is_read = false {id_filter}
+                    RETURNING 1
+                ), counted AS (
+                    SELECT COUNT(*) AS n FROM marked
+                ), counter AS (
+                    UPDATE notification_counts nc SET unread = GREATEST(nc.unread - counted.n, 0)
+                    FROM counted
+                    WHERE nc.user_id = %s
+                    RETURNING nc.unread
+                )
+                SELECT counted.n, (SELECT unread FROM counter) FROM counted
+            """, params + [str(user_id)])
+            marked, unread = cur.fetchone()
+            return marked, unread or 0
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from app.models.user import UserModel
-from app.database import get_db_connection
+from app.database import get_db
+from app.middleware.auth import resolve_token
 import jwt
 import hashlib
 from datetime import datetime, timedelta
@@ -23,31 +24,7 @@ def create_access_token(identity):
 def verify_token(token):
     """Verify JWT token and return user information"""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get('sub')
-        if not user_id:
-            return None
-        
-        # Get user information from database
-        conn = get_db_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute('SELECT id, email, name, role FROM users WHERE id = %s', (user_id,))
-                user = cur.fetchone()
-                if user:
-                    return {
-                        'id': str(user[0]),
-                        'email': user[1],
-                        'name': user[2],
-                        'role': user[3]
-                    }
-                return None
-        finally:
-            conn.close()
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+        return resolve_token(token)
     except Exception:
         return None
 
@@ -72,7 +49,7 @@ def register():
         return jsonify({'error': 'Password must be at least 6 characters long'}), 400
     
     try:
-        conn = get_db_connection()
+        conn = get_db()
         user_model = UserModel(conn)
         
         # Check if user already exists
@@ -102,9 +79,6 @@ def register():
         
     except Exception as e:
         return jsonify({'error': 'Failed to create user', 'details': str(e)}), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
 
 @bp.route('/login', methods=['POST'])
 def login():
@@ -116,7 +90,7 @@ def login():
         return jsonify({'error': 'Email and password are required'}), 400
     
     try:
-        conn = get_db_connection()
+        conn = get_db()
         user_model = UserModel(conn)
         
         with conn.cursor() as cur:
@@ -142,6 +116,3 @@ def login():
         
     except Exception as e:
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
-    finally:
-        if 'conn' in locals():
-            conn.close()
@@ -1,136 +1,290 @@
 from flask import Blueprint, request, jsonify
+import logging
+import psycopg2
+import uuid
 from app.models.comment import CommentModel
-from app.database import get_db_connection
+from app.models.course_file import CourseFileModel
+from app.models.comment_like import CommentLikeModel
+from app.database import get_db
 from app.middleware.auth import require_auth, get_current_user
+from app.utils.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_condition
+from app.utils.response_cache import cache_enabled, cached_response, invalidate
+from app.utils.serialization import (
+    RawJSON, db_json, json_rows_sql, raw_json_response, row_number_sql, row_to_dict, rows_to_dicts,
+)
 
 
 bp = Blueprint('comments', __name__)
+logger = logging.getLogger(__name__)
+
+COMMENT_COLUMNS = ['id', 'file_id', 'user_id', 'parent_id', 'comment', 'likes', 'created_at',
+                   'user_name', 'user_role', 'is_liked']
+
+# Flat comment listings, in COMMENT_COLUMNS order; is_liked is for the user bound first
+COMMENT_SELECT = """
+    c.id, c.file_id, c.user_id, c.parent_id, c.comment, COALESCE(c.likes, 0), c.created_at,
+    u.name as user_name, u.role as user_role,
+    cl.user_id IS NOT NULL as is_liked
+    FROM comments c
+    LEFT JOIN users u ON c.user_id = u.id
+    LEFT JOIN comment_likes cl ON c.id = cl.comment_id AND cl.user_id = %s
+"""
+
+def comment_list_tags(args, view_args):
+    if args.get('file_id'):
+        return [f"comments:file:{args['file_id']}"]
+    if args.get('course_id'):
+        return [f"comments:course:{args['course_id']}"]
+    return ['comments']
+
+def discussion_tags(cur, comment_id=None, file_id=None, course_id=None):
+    """Cache tags of the discussion a comment belongs to.
+
+    Looked up (only when caching is on) before the write commits, then
+    passed to invalidate() after it.
+    """
+    if not cache_enabled():
+        return []
+    if comment_id:
+        cur.execute("""
+            SELECT c.file_id, f.course_id FROM comments c
+            LEFT JOIN course_files f ON f.id = c.file_id
+            WHERE c.id = %s
+        """, (str(comment_id),))
+        file_id, course_id = cur.fetchone() or (None, None)
+    elif file_id and not course_id:
+        cur.execute("SELECT course_id FROM course_files WHERE id = %s", (str(file_id),))
+        course_id = (cur.fetchone() or (None,))[0]
+    return ['comments', f"comments:file:{file_id}", f"comments:course:{course_id}"]
 
 @bp.route('/', methods=['GET'])
 @require_auth
+@cached_response('comments', tags=comment_list_tags, audience=lambda user: user['id'])
 def get_comments():
-    conn = get_db_connection()
+    conn = get_db()
     try:
         file_id = request.args.get('file_id')
         course_id = request.args.get('course_id')
         
         current_user = get_current_user()
         
+        if course_id and not file_id:
+            # Course-level comments live on the course's discussion file
+            file_id = CourseFileModel(conn).get_discussion_file_id(course_id)
+            if not file_id:
+                # No discussion file exists yet, return empty comments
+                return jsonify({'comments': []})
+        
+        use_db_json = db_json('comments')
+        order_by = "ORDER BY c.created_at ASC, c.id ASC"
+        # db-side JSON numbers the rows in the listing's order (see json_rows_sql)
+        numbered = f"{row_number_sql(order_by)}," if use_db_json else ""
         if file_id:
             # Get comments for specific file
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT c.id, c.file_id, c.user_id, c.parent_id, c.comment, c.likes, c.created_at,
-                           u.name as user_name, u.role as user_role,
-                           CASE WHEN cl.user_id IS NOT NULL THEN true ELSE false END as is_liked
-                    FROM comments c
-                    LEFT JOIN users u ON c.user_id = u.id
-                    LEFT JOIN comment_likes cl ON c.id = cl.comment_id AND cl.user_id = %s
-                    WHERE c.file_id = %s
-                    ORDER BY c.created_at ASC
-                """, (current_user['id'], file_id))
-                comments = cur.fetchall()
-        elif course_id:
-            # Get comments for course - handle both file-based and course-based comments
-            with conn.cursor() as cur:
-                # First, try to get or create a course discussion file
-                cur.execute("""
-                    SELECT id FROM course_files 
-                    WHERE course_id = %s AND file_type = 'discussion' 
-                    LIMIT 1
-                """, (course_id,))
-                discussion_file = cur.fetchone()
-                
-                if discussion_file:
-                    # Get comments for the discussion file
-                    cur.execute("""
-                        SELECT c.id, c.file_id, c.user_id, c.parent_id, c.comment, c.likes, c.created_at,
-                               u.name as user_name, u.role as user_role,
-                               CASE WHEN cl.user_id IS NOT NULL THEN true ELSE false END as is_liked
-                        FROM comments c
-                        LEFT JOIN users u ON c.user_id = u.id
-                        LEFT JOIN comment_likes cl ON c.id = cl.comment_id AND cl.user_id = %s
-                        WHERE c.file_id = %s
-                        ORDER BY c.created_at ASC
-                    """, (current_user['id'], discussion_file[0]))
-                    comments = cur.fetchall()
-                else:
-                    # No discussion file exists yet, return empty comments
-                    comments = []
+            query = f"SELECT {numbered} {COMMENT_SELECT} WHERE c.file_id = %s {order_by}"
+            params = (current_user['id'], file_id)
         else:
             # Get all comments
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT c.id, c.file_id, c.user_id, c.parent_id, c.comment, c.likes, c.created_at,
-                           u.name as user_name, u.role as user_role,
-                           CASE WHEN cl.user_id IS NOT NULL THEN true ELSE false END as is_liked
-                    FROM comments c
-                    LEFT JOIN users u ON c.user_id = u.id
-                    LEFT JOIN comment_likes cl ON c.id = cl.comment_id AND cl.user_id = %s
-                    ORDER BY c.created_at ASC
-                """, (current_user['id'],))
-                comments = cur.fetchall()
+            query = f"SELECT {numbered} {COMMENT_SELECT} {order_by}"
+            params = (current_user['id'],)
         
-        comment_list = []
-        for comment in comments:
-            comment_dict = {
-                'id': str(comment[0]),
-                'file_id': str(comment[1]) if comment[1] else None,
-                'user_id': str(comment[2]),
-                'parent_id': str(comment[3]) if comment[3] else None,
-                'comment': comment[4],
-                'likes': comment[5] or 0,
-                'created_at': comment[6].isoformat() if comment[6] else None,
-                'user_name': comment[7],
-                'user_role': comment[8],
-                'is_liked': comment[9] if len(comment) > 9 else False
-            }
-            comment_list.append(comment_dict)
+        with conn.cursor() as cur:
+            if use_db_json:
+                cur.execute(json_rows_sql(query, COMMENT_COLUMNS), params)
+                return raw_json_response({'comments': RawJSON(cur.fetchone()[0])})
+            cur.execute(query, params)
+            comments = cur.fetchall()
         
-        return jsonify({'comments': comment_list})
+        return jsonify({'comments': rows_to_dicts(COMMENT_COLUMNS, comments)})
     except Exception as e:
-        print(f"ERROR in get_comments: {e}")
+        logger.exception("get_comments failed")
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+
+# Columns shared by the tree queries; is_liked is checked for the current user
+TREE_COLUMNS = """
+    c.id, c.file_id, c.user_id, c.parent_id, c.comment, c.likes, c.created_at,
+    u.name as user_name, u.role as user_role,
+    EXISTS (SELECT 1 FROM comment_likes cl WHERE cl.comment_id = c.id AND cl.user_id = %s) as is_liked
+"""
+
+# Top-level sort -> (key columns, descending, row indexes of the key values)
+THREAD_SORTS = {
+    'newest': (['c.created_at', 'c.id'], True, [6, 0]),
+    'oldest': (['c.created_at', 'c.id'], False, [6, 0]),
+    'likes': (['c.likes', 'c.created_at', 'c.id'], True, [5, 6, 0]),
+}
+
+MAX_THREADS_PER_PAGE = 50
+MAX_INLINE_REPLIES = 20
+MAX_REPLIES_PER_PAGE = 100
+MAX_BATCH_COMMENT_IDS = 500
+
+def comment_to_dict(comment):
+    """Shape a comment row (TREE_COLUMNS order) for the API"""
+    comment_dict = row_to_dict(COMMENT_COLUMNS, comment)
+    comment_dict['likes'] = comment_dict['likes'] or 0
+    return comment_dict
+
+def replies_cursor(reply):
+    return encode_cursor('replies', [reply[6], reply[0]])
+
+@bp.route('/tree', methods=['GET'])
+@require_auth
+def get_comment_tree():
+    """Paginated discussion threads for a file (or a course's discussion).
+
+    ?file_id= or ?course_id=, ?sort=newest|oldest|likes, ?limit= threads per
+    page, ?cursor= from next_cursor, ?replies= replies inlined per thread.
+    Each thread carries replies_cursor for GET /<thread_id>/replies.
+    """
+    conn = get_db()
+    current_user = get_current_user()
+    file_id = request.args.get('file_id')
+    course_id = request.args.get('course_id')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_THREADS_PER_PAGE)
+    inline = min(max(request.args.get('replies', 3, type=int), 1), MAX_INLINE_REPLIES)
+    cursor = request.args.get('cursor', '', type=str)
+    sort = request.args.get('sort', 'newest', type=str)
+    if sort not in THREAD_SORTS:
+        sort = 'newest'
+    key_columns, descending, key_indexes = THREAD_SORTS[sort]
+    
+    if not file_id and course_id:
+        file_id = CourseFileModel(conn).get_discussion_file_id(course_id)
+        if not file_id:
+            return jsonify({'threads': [], 'next_cursor': None, 'has_next': False})
+    
+    if not file_id:
+        return jsonify({'error': 'file_id or course_id is required'}), 400
+    
+    with conn.cursor() as cur:
+        conditions = ["c.file_id = %s", "c.parent_id IS NULL"]
+        params = [str(file_id)]
+        if cursor:
+            try:
+                after_sql, after_params = keyset_condition(key_columns, descending, decode_cursor(cursor, sort))
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            conditions.append(after_sql)
+            params.extend(after_params)
+        
+        direction = "DESC" if descending else "ASC"
+        cur.execute(f"""
+            SELECT {TREE_COLUMNS}
+            FROM comments c
+            LEFT JOIN users u ON c.user_id = u.id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {", ".join(f"{column} {direction}" for column in key_columns)}
+            LIMIT %s
+        """, [current_user['id']] + params + [limit + 1])
+        roots = cur.fetchall()
+        
+        has_next = len(roots) > limit
+        roots = roots[:limit]
+        
+        # First replies of every thread on the page in one query
+        replies = []
+        if roots:
+            cur.execute(f"""
+                SELECT r.*
+                FROM unnest(%s::uuid[]) AS thread(id)
+                CROSS JOIN LATERAL (
+                    SELECT {TREE_COLUMNS}, c.root_id
+                    FROM comments c
+                    LEFT JOIN users u ON c.user_id = u.id
+                    WHERE c.root_id = thread.id
+                    ORDER BY c.created_at ASC, c.id ASC
+                    LIMIT %s
+                ) r
+            """, ([str(root[0]) for root in roots], current_user['id'], inline + 1))
+            replies = cur.fetchall()
+    
+    replies_by_thread = {}
+    for reply in replies:
+        replies_by_thread.setdefault(str(reply[10]), []).append(reply)
+    
+    threads = []
+    for root in roots:
+        thread = comment_to_dict(root)
+        thread_replies = replies_by_thread.get(str(thread['id']), [])
+        has_more = len(thread_replies) > inline
+        thread_replies = thread_replies[:inline]
+        thread['replies'] = [comment_to_dict(reply) for reply in thread_replies]
+        thread['has_more_replies'] = has_more
+        thread['replies_cursor'] = replies_cursor(thread_replies[-1]) if has_more else None
+        threads.append(thread)
+    
+    return jsonify({
+        'threads': threads,
+        'file_id': str(file_id),
+        'next_cursor': encode_cursor(sort, [roots[-1][i] for i in key_indexes]) if has_next else None,
+        'has_next': has_next
+    })
+
+@bp.route('/<uuid:comment_id>/replies', methods=['GET'])
+@require_auth
+def get_comment_replies(comment_id):
+    """More replies of a thread, oldest first (?cursor=, ?limit=)"""
+    conn = get_db()
+    current_user = get_current_user()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_REPLIES_PER_PAGE)
+    cursor = request.args.get('cursor', '', type=str)
+    
+    conditions = ["c.root_id = %s"]
+    params = [str(comment_id)]
+    if cursor:
+        try:
+            after_sql, after_params = keyset_condition(
+                ['c.created_at', 'c.id'], False, decode_cursor(cursor, 'replies'))
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        conditions.append(after_sql)
+        params.extend(after_params)
+    
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {TREE_COLUMNS}
+            FROM comments c
+            LEFT JOIN users u ON c.user_id = u.id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY c.created_at ASC, c.id ASC
+            LIMIT %s
+        """, [current_user['id']] + params + [limit + 1])
+        replies = cur.fetchall()
+    
+    has_next = len(replies) > limit
+    replies = replies[:limit]
+    
+    return jsonify({
+        'replies': [comment_to_dict(reply) for reply in replies],
+        'next_cursor': replies_cursor(replies[-1]) if has_next else None,
+        'has_next': has_next
+    })
 
 @bp.route('/<uuid:comment_id>', methods=['GET'])
 @require_auth
 def get_comment(comment_id):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT c.id, c.file_id, c.user_id, c.parent_id, c.comment, c.likes, c.created_at,
-                       u.name as user_name, u.role as user_role
-                FROM comments c
-                LEFT JOIN users u ON c.user_id = u.id
-                WHERE c.id = %s
-            """, (str(comment_id),))
-            comment = cur.fetchone()
-        if comment:
-            comment_dict = {
-                'id': str(comment[0]),
-                'file_id': str(comment[1]) if comment[1] else None,
-                'user_id': str(comment[2]),
-                'parent_id': str(comment[3]) if comment[3] else None,
-                'comment': comment[4],
-                'likes': comment[5] or 0,
-                'created_at': comment[6].isoformat() if comment[6] else None,
-                'user_name': comment[7],
-                'user_role': comment[8]
-            }
-            return jsonify(comment_dict)
-        return jsonify({'error': 'Comment not found'}), 404
-    finally:
-        conn.close()
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.id, c.file_id, c.user_id, c.parent_id, c.comment, COALESCE(c.likes, 0), c.created_at,
+                   u.name as user_name, u.role as user_role
+            FROM comments c
+            LEFT JOIN users u ON c.user_id = u.id
+            WHERE c.id = %s
+        """, (str(comment_id),))
+        comment = cur.fetchone()
+    if comment:
+        # No is_liked here: zip stops at the last selected column
+        return jsonify(row_to_dict(COMMENT_COLUMNS, comment))
+    return jsonify({'error': 'Comment not found'}), 404
 
 @bp.route('/', methods=['POST'])
 @require_auth
 def create_comment():
     data = request.json
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
     
     try:
         with conn.cursor() as cur:
@@ -139,148 +293,142 @@ def create_comment():
             course_id = data.get('course_id')
             
             if course_id and not file_id:
-                # Check if discussion file already exists
-                cur.execute("""
-                    SELECT id FROM course_files 
-                    WHERE course_id = %s AND file_type = 'discussion' 
-                    LIMIT 1
-                """, (course_id,))
-                discussion_file = cur.fetchone()
-                
-                if discussion_file:
-                    file_id = discussion_file[0]
-                else:
-                    # Create a course-level comment by creating a discussion file entry
-                    cur.execute("""
-                        INSERT INTO course_files (course_id, title, file_type, file_url, file_order)
-                        VALUES (%s, %s, %s, %s, %s) RETURNING id
-                    """, (course_id, 'Course Discussion', 'discussion', '/course-discussion', 999))
-                    file_id = cur.fetchone()[0]
+                # Course-level comments live on the course's discussion file
+                file_id = CourseFileModel(conn).get_discussion_file_id(course_id, create=True)
             
             if not file_id:
                 return jsonify({'error': 'file_id or course_id is required'}), 400
+            tags = discussion_tags(cur, file_id=file_id, course_id=course_id)
             
+            # root_id is the thread's top-level comment (NULL for top-level comments)
             cur.execute("""
-                INSERT INTO comments (file_id, user_id, parent_id, comment, likes)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, (file_id, current_user['id'], data.get('parent_id'), data['comment'], data.get('likes', 0)))
+                INSERT INTO comments (file_id, user_id, parent_id, comment, likes, root_id)
+                VALUES (%s, %s, %s, %s, %s,
+                        (SELECT COALESCE(p.root_id, p.id) FROM comments p WHERE p.id = %s))
+                RETURNING id
+            """, (file_id, current_user['id'], data.get('parent_id'), data['comment'], data.get('likes', 0), data.get('parent_id')))
             comment_id = cur.fetchone()[0]
             conn.commit()
         
+        invalidate(*tags)
+        if course_id and not data.get('file_id'):
+            # The course's discussion file may have just been created
+            invalidate('files', f"files:{course_id}")
         return jsonify({'id': str(comment_id), 'message': 'Comment created successfully'}), 201
         
     except Exception as e:
-        print(f"ERROR in create_comment: {e}")
+        logger.exception("create_comment failed")
         conn.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @bp.route('/<uuid:comment_id>', methods=['PUT'])
 @require_auth
 def update_comment(comment_id):
     data = request.json
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
     
-    try:
-        with conn.cursor() as cur:
-            # Check if user owns the comment
-            cur.execute("SELECT user_id FROM comments WHERE id = %s", (str(comment_id),))
-            comment = cur.fetchone()
+    with conn.cursor() as cur:
+        # Check if user owns the comment
+        cur.execute("SELECT user_id FROM comments WHERE id = %s", (str(comment_id),))
+        comment = cur.fetchone()
             
-            if not comment:
-                return jsonify({'error': 'Comment not found'}), 404
+        if not comment:
+            return jsonify({'error': 'Comment not found'}), 404
             
-            if str(comment[0]) != current_user['id']:
-                return jsonify({'error': 'Permission denied'}), 403
+        if str(comment[0]) != current_user['id']:
+            return jsonify({'error': 'Permission denied'}), 403
+        tags = discussion_tags(cur, comment_id=comment_id)
             
-            cur.execute("""
-                UPDATE comments SET comment=%s
-                WHERE id=%s RETURNING id
-            """, (data['comment'], str(comment_id)))
-            updated = cur.fetchone()
-            conn.commit()
+        cur.execute("""
+            UPDATE comments SET comment=%s
+            WHERE id=%s RETURNING id
+        """, (data['comment'], str(comment_id)))
+        updated = cur.fetchone()
+        conn.commit()
         
-        if updated:
-            return jsonify({'id': str(updated[0]), 'message': 'Comment updated successfully'})
-        return jsonify({'error': 'Comment not found'}), 404
-    finally:
-        conn.close()
+    if updated:
+        invalidate(*tags)
+        return jsonify({'id': str(updated[0]), 'message': 'Comment updated successfully'})
+    return jsonify({'error': 'Comment not found'}), 404
 
 @bp.route('/<uuid:comment_id>', methods=['DELETE'])
 @require_auth
 def delete_comment(comment_id):
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
     
-    try:
-        with conn.cursor() as cur:
-            # Check if user owns the comment
-            cur.execute("SELECT user_id FROM comments WHERE id = %s", (str(comment_id),))
-            comment = cur.fetchone()
+    with conn.cursor() as cur:
+        # Check if user owns the comment
+        cur.execute("SELECT user_id FROM comments WHERE id = %s", (str(comment_id),))
+        comment = cur.fetchone()
             
-            if not comment:
-                return jsonify({'error': 'Comment not found'}), 404
+        if not comment:
+            return jsonify({'error': 'Comment not found'}), 404
             
-            if str(comment[0]) != current_user['id']:
-                return jsonify({'error': 'Permission denied'}), 403
+        if str(comment[0]) != current_user['id']:
+            return jsonify({'error': 'Permission denied'}), 403
+        tags = discussion_tags(cur, comment_id=comment_id)
             
-            cur.execute("DELETE FROM comments WHERE id = %s RETURNING id", (str(comment_id),))
-            deleted = cur.fetchone()
-            conn.commit()
+        cur.execute("DELETE FROM comments WHERE id = %s RETURNING id", (str(comment_id),))
+        deleted = cur.fetchone()
+        conn.commit()
         
-        if deleted:
-            return jsonify({'id': str(deleted[0]), 'message': 'Comment deleted successfully'})
-        return jsonify({'error': 'Comment not found'}), 404
-    finally:
-        conn.close()
+    if deleted:
+        invalidate(*tags)
+        return jsonify({'id': str(deleted[0]), 'message': 'Comment deleted successfully'})
+    return jsonify({'error': 'Comment not found'}), 404
 
 @bp.route('/<uuid:comment_id>/like', methods=['POST', 'DELETE'])
 @require_auth
 def toggle_comment_like(comment_id):
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
+    likes = CommentLikeModel(conn)
+    with conn.cursor() as cur:
+        tags = discussion_tags(cur, comment_id=comment_id)
+    
+    if request.method == 'POST':
+        # Add like
+        try:
+            added = likes.like(comment_id, current_user['id'])
+        except psycopg2.IntegrityError:
+            conn.rollback()
+            return jsonify({'error': 'Comment not found'}), 404
+        if not added:
+            return jsonify({'error': 'Already liked'}), 400
+        invalidate(*tags)
+        return jsonify({'message': 'Like added successfully'})
+    else:
+        # Remove like
+        if likes.unlike(comment_id, current_user['id']):
+            invalidate(*tags)
+            return jsonify({'message': 'Like removed successfully'})
+        return jsonify({'error': 'Like not found'}), 404
+
+@bp.route('/likes', methods=['GET', 'POST'])
+@require_auth
+def get_liked_comments():
+    """Which of these comments the current user has liked.
+
+    Accepts ?comment_ids=<uuid>,<uuid> or a JSON body {"comment_ids": [...]}.
+    """
+    current_user = get_current_user()
+    
+    if request.method == 'POST':
+        comment_ids = (request.get_json(silent=True) or {}).get('comment_ids') or []
+    else:
+        comment_ids = [c for c in request.args.get('comment_ids', '').split(',') if c]
+    
+    if not isinstance(comment_ids, list):
+        return jsonify({'error': 'comment_ids must be a list'}), 400
+    if len(comment_ids) > MAX_BATCH_COMMENT_IDS:
+        return jsonify({'error': f'At most {MAX_BATCH_COMMENT_IDS} comment_ids per request'}), 400
     
     try:
-        with conn.cursor() as cur:
-            if request.method == 'POST':
-                # Add like
-                try:
-                    cur.execute("""
-                        INSERT INTO comment_likes (comment_id, user_id)
-                        VALUES (%s, %s)
-                    """, (str(comment_id), current_user['id']))
-                    
-                    # Update comment likes count
-                    cur.execute("""
-                        UPDATE comments SET likes = likes + 1
-                        WHERE id = %s
-                    """, (str(comment_id),))
-                    
-                    conn.commit()
-                    return jsonify({'message': 'Like added successfully'})
-                except Exception as e:
-                    if 'unique' in str(e).lower():
-                        return jsonify({'error': 'Already liked'}), 400
-                    raise e
-            else:
-                # Remove like
-                cur.execute("""
-                    DELETE FROM comment_likes 
-                    WHERE comment_id = %s AND user_id = %s
-                """, (str(comment_id), current_user['id']))
-                
-                if cur.rowcount > 0:
-                    # Update comment likes count
-                    cur.execute("""
-                        UPDATE comments SET likes = GREATEST(likes - 1, 0)
-                        WHERE id = %s
-                    """, (str(comment_id),))
-                    
-                    conn.commit()
-                    return jsonify({'message': 'Like removed successfully'})
-                else:
-                    return jsonify({'error': 'Like not found'}), 404
-    finally:
-        conn.close()
+        comment_ids = [str(uuid.UUID(str(comment_id))) for comment_id in comment_ids]
+    except ValueError:
+        return jsonify({'error': 'Invalid comment id'}), 400
+    
+    liked = CommentLikeModel(get_db()).liked_among(current_user['id'], comment_ids)
+    return jsonify({'is_liked': {comment_id: comment_id in liked for comment_id in comment_ids}})
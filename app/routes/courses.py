@@ -1,208 +1,262 @@
 from flask import Blueprint, request, jsonify
 from app.models.course import CourseModel
-from app.database import get_db_connection
+from app.models.enrollment import EnrollmentModel
+from app.models.course_file import forget_discussion_file
+from app.database import get_db
 from app.middleware.auth import require_auth, require_teacher_or_admin, require_admin, get_current_user
+from app.utils.search import course_search
+from app.utils.pagination import InvalidCursor, count_mode, decode_cursor, encode_cursor, estimate_count, keyset_condition
+from app.utils.response_cache import cached_response, invalidate
+from app.utils.serialization import (
+    RawJSON, db_json, json_rows_sql, raw_json_response, row_number_sql, row_to_dict, rows_to_dicts,
+)
 
 bp = Blueprint('courses', __name__)
 
+# sort -> (key columns, descending, row indexes of the key values)
+# Every key ends in c.id so the order is total and usable as a keyset cursor.
+COURSE_SORTS = {
+    'newest': (['c.created_at', 'c.id'], True, [6, 0]),
+    'oldest': (['c.created_at', 'c.id'], False, [6, 0]),
+    'title': (['c.title', 'c.id'], False, [2, 0]),
+    'popular': (['c.enrolled_count', 'c.created_at', 'c.id'], True, [10, 6, 0]),
+}
+
+MAX_PER_PAGE = 100
+
+# Row order of COURSE_SELECT
+COURSE_COLUMNS = ['id', 'teacher_id', 'title', 'description', 'video_url', 'is_published', 'created_at',
+                  'category', 'level', 'teacher_name', 'enrolled_count']
+
+COURSE_FIELDS = """
+    c.id, c.teacher_id, c.title, c.description, c.video_url, c.is_published, c.created_at,
+    c.category, c.level,
+    u.name as teacher_name,
+    c.enrolled_count
+"""
+
+COURSE_SELECT = f"""
+    SELECT {COURSE_FIELDS}
+    FROM courses c
+    LEFT JOIN users u ON c.teacher_id = u.id
+"""
+
+# Extra listing column for students when Postgres builds the JSON
+ENROLLED_FIELD = "EXISTS (SELECT 1 FROM enrollments e WHERE e.course_id = c.id AND e.student_id = %s)"
+
+def listing_audience(user):
+    """Students get their own is_enrolled flags; staff all see the same list"""
+    return f"student:{user['id']}" if user['role'] == 'student' else 'staff'
+
+def course_audience(user):
+    """Drafts are visible to admins and their own teacher only"""
+    return f"teacher:{user['id']}" if user['role'] == 'teacher' else user['role']
+
 @bp.route('/', methods=['GET'])
 @require_auth
+@cached_response('courses', tags=lambda args, view_args: ['courses'], audience=listing_audience)
 def get_courses():
-    """Get courses with pagination - all users can view published courses"""
-    conn = get_db_connection()
+    """Get courses with pagination - all users can view published courses
+
+    Offset mode (default): ?page=&per_page=
+    Cursor mode: ?pagination=cursor, then ?cursor=<next_cursor> for later pages.
+    ?total=exact|estimate|none controls the total count.
+    ?search= uses full-text + fuzzy matching and sorts by relevance by default.
+    With "courses" in DB_JSON_ENDPOINTS, Postgres builds the course list JSON.
+    """
+    conn = get_db()
     current_user = get_current_user()
     
     # Pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 6, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 6, type=int), 1), MAX_PER_PAGE)
     search = request.args.get('search', '', type=str)
+    cursor = request.args.get('cursor', '', type=str)
+    cursor_mode = bool(cursor) or request.args.get('pagination', '', type=str) == 'cursor'
+    total_mode = count_mode(request.args, 'none' if cursor_mode else 'exact')
     
     # Filter parameters
     category = request.args.get('category', '', type=str)
     level = request.args.get('level', '', type=str)
     status = request.args.get('status', '', type=str)
-    sort = request.args.get('sort', 'newest', type=str)
+    search_clause = course_search(search) if search.strip() else None
+    # Searches rank by relevance unless another sort is asked for
+    sort = request.args.get('sort', 'relevance' if search_clause else 'newest', type=str)
+    if sort not in COURSE_SORTS and not (sort == 'relevance' and search_clause):
+        sort = 'newest'
+    if sort == 'relevance' and cursor_mode:
+        return jsonify({'error': 'Cursor pagination is not available for sort=relevance'}), 400
     
-    try:
-        with conn.cursor() as cur:
-            # Base query conditions
-            base_where = "WHERE c.is_published = true" if current_user['role'] == 'student' else ""
-            search_condition = f"AND (c.title ILIKE %s OR c.description ILIKE %s)" if search else ""
-            
-            # Build filter conditions
-            filter_conditions = []
-            filter_params = []
-            
-            if status:
-                if status == 'published':
-                    filter_conditions.append("c.is_published = true")
-                elif status == 'draft':
-                    filter_conditions.append("c.is_published = false")
-            
-            if category:
-                filter_conditions.append("c.category = %s")
-                filter_params.append(category)
-            
-            if level:
-                filter_conditions.append("c.level = %s")
-                filter_params.append(level)
-            
-            filter_where = ""
-            if filter_conditions:
-                filter_where = "AND " + " AND ".join(filter_conditions)
-            
-            # Build ORDER BY clause
-            order_by = "ORDER BY c.created_at DESC"  # default
-            if sort == 'oldest':
-                order_by = "ORDER BY c.created_at ASC"
-            elif sort == 'title':
-                order_by = "ORDER BY c.title ASC"
-            elif sort == 'popular':
-                order_by = "ORDER BY enrolled_count DESC, c.created_at DESC"
-            
-            # Count total courses for pagination
-            count_query = f"""
-                SELECT COUNT(DISTINCT c.id)
-                FROM courses c
-                LEFT JOIN users u ON c.teacher_id = u.id
-                {base_where}
-                {search_condition}
-                {filter_where}
-            """
-            
-            count_params = []
-            if search:
-                count_params.extend([f'%{search}%', f'%{search}%'])
-            
-            # Add filter parameters
-            count_params.extend(filter_params)
-            
-            if count_params:
-                cur.execute(count_query, count_params)
-            else:
-                cur.execute(count_query)
-            
+    # Build filter conditions
+    conditions = []
+    params = []
+    
+    if current_user['role'] == 'student':
+        conditions.append("c.is_published = true")
+    
+    if search_clause:
+        conditions.append(search_clause.condition)
+        params.extend(search_clause.params)
+    
+    if status:
+        if status == 'published':
+            conditions.append("c.is_published = true")
+        elif status == 'draft':
+            conditions.append("c.is_published = false")
+    
+    if category:
+        conditions.append("c.category = %s")
+        params.append(category)
+    
+    if level:
+        conditions.append("c.level = %s")
+        params.append(level)
+    
+    filter_where = "WHERE " + " AND ".join(conditions) if conditions else ""
+    
+    # Keyset condition for the page after the cursor
+    page_conditions = list(conditions)
+    page_params = list(params)
+    if cursor:
+        key_columns, descending, _ = COURSE_SORTS[sort]
+        try:
+            after_sql, after_params = keyset_condition(key_columns, descending, decode_cursor(cursor, sort))
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        page_conditions.append(after_sql)
+        page_params.extend(after_params)
+    page_where = "WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+    
+    order_params = []
+    if sort == 'relevance':
+        order_by = f"ORDER BY {search_clause.rank} DESC, c.id DESC"
+        order_params = search_clause.rank_params
+    else:
+        key_columns, descending, _ = COURSE_SORTS[sort]
+        direction = "DESC" if descending else "ASC"
+        order_by = "ORDER BY " + ", ".join(f"{column} {direction}" for column in key_columns)
+    
+    with conn.cursor() as cur:
+        total_courses = None
+        count_query = f"SELECT COUNT(*) FROM courses c {filter_where}"
+        if total_mode == 'exact':
+            cur.execute(count_query, params)
             total_courses = cur.fetchone()[0]
-            total_pages = (total_courses + per_page - 1) // per_page
-            
-            # Get paginated courses
-            offset = (page - 1) * per_page
-            
-            courses_query = f"""
-                SELECT c.id, c.teacher_id, c.title, c.description, c.video_url, c.is_published, c.created_at,
-                       c.category, c.level,
-                       u.name as teacher_name,
-                       COUNT(e.id) as enrolled_count
-                FROM courses c
-                LEFT JOIN users u ON c.teacher_id = u.id
-                LEFT JOIN enrollments e ON c.id = e.course_id
-                {base_where}
-                {search_condition}
-                {filter_where}
-                GROUP BY c.id, c.teacher_id, c.title, c.description, c.video_url, c.is_published, c.created_at, c.category, c.level, u.name
-                {order_by}
-                LIMIT %s OFFSET %s
-            """
-            
-            query_params = []
-            if search:
-                query_params.extend([f'%{search}%', f'%{search}%'])
-            
-            # Add filter parameters
-            query_params.extend(filter_params)
-            query_params.extend([per_page, offset])
-            
+        elif total_mode == 'estimate':
+            total_courses = estimate_count(cur, f"SELECT c.id FROM courses c {filter_where}", params)
+        
+        use_db_json = db_json('courses')
+        fields, field_params, columns = COURSE_FIELDS, [], COURSE_COLUMNS
+        if use_db_json:
+            # Rows are numbered in the listing's own order (see json_rows_sql)
+            fields = f"{row_number_sql(order_by)}, {fields}"
+            field_params = list(order_params)
+            if current_user['role'] == 'student':
+                fields = f"{fields}, {ENROLLED_FIELD}"
+                field_params.append(current_user['id'])
+                columns = COURSE_COLUMNS + ['is_enrolled']
+        
+        courses_query = f"""
+            SELECT {fields}
+            FROM courses c
+            LEFT JOIN users u ON c.teacher_id = u.id
+            {page_where}
+            {order_by}
+            LIMIT %s
+        """
+        
+        if cursor_mode:
+            # Fetch one extra row to know whether there is a next page
+            query_params = field_params + page_params + order_params + [per_page + 1]
+        else:
+            courses_query += " OFFSET %s"
+            query_params = field_params + page_params + order_params + [per_page, (page - 1) * per_page]
+        
+        if use_db_json:
+            key_names = [COURSE_COLUMNS[i] for i in COURSE_SORTS[sort][2]] if cursor_mode else []
+            # Rows are numbered before OFFSET, so only cursor pages (which start at
+            # _n = 1 and fetch one row ahead) are cut to per_page
+            page_size = per_page if cursor_mode else None
+            cur.execute(json_rows_sql(courses_query, columns, page_size, key_names), query_params)
+            courses_json, row_count, *last_key = cur.fetchone()
+        else:
             cur.execute(courses_query, query_params)
             courses = cur.fetchall()
-            
-        course_list = []
-        for course in courses:
-            course_dict = {
-                'id': str(course[0]),
-                'teacher_id': str(course[1]),
-                'title': course[2],
-                'description': course[3],
-                'video_url': course[4],
-                'is_published': course[5],
-                'created_at': course[6].isoformat() if course[6] else None,
-                'category': course[7],
-                'level': course[8],
-                'teacher_name': course[9],
-                'enrolled_count': course[10] or 0
-            }
-            course_list.append(course_dict)
-            
-        return jsonify({
-            'courses': course_list,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total_courses,
-                'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
-            }
-        })
+            row_count = len(courses)
+    
+    has_next = cursor_mode and row_count > per_page
+    
+    if use_db_json:
+        course_list = RawJSON(courses_json)
+    else:
+        courses = courses[:per_page]
+        last_key = [courses[-1][i] for i in COURSE_SORTS[sort][2]] if has_next else None
+        course_list = rows_to_dicts(COURSE_COLUMNS, courses)
         
-    finally:
-        conn.close()
+        # Fold the student's enrollment state into the listing (one query per page)
+        if current_user['role'] == 'student':
+            enrolled = EnrollmentModel(conn).status_for_courses(
+                current_user['id'], [str(course['id']) for course in course_list])
+            for course in course_list:
+                course['is_enrolled'] = str(course['id']) in enrolled
+    
+    if cursor_mode:
+        next_cursor = encode_cursor(sort, last_key) if has_next else None
+        pagination = {
+            'mode': 'cursor',
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_next': has_next,
+            'total': total_courses
+        }
+    else:
+        total_pages = (total_courses + per_page - 1) // per_page if total_courses is not None else None
+        pagination = {
+            'page': page,
+            'per_page': per_page,
+            'total': total_courses,
+            'total_pages': total_pages,
+            'has_next': page < total_pages if total_pages is not None else row_count == per_page,
+            'has_prev': page > 1
+        }
+    
+    document = {
+        'courses': course_list,
+        'pagination': pagination
+    }
+    return raw_json_response(document) if use_db_json else jsonify(document)
 
 @bp.route('/<uuid:course_id>', methods=['GET'])
 @require_auth
+@cached_response('course', tags=lambda args, view_args: [f"course:{view_args['course_id']}"],
+                 audience=course_audience)
 def get_course(course_id):
     """Get specific course - all users can view if published or if they're the teacher/admin"""
-    conn = get_db_connection()
+    conn = get_db()
     current_user = get_current_user()
     
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT c.id, c.teacher_id, c.title, c.description, c.video_url, c.is_published, c.created_at,
-                       c.category, c.level,
-                       u.name as teacher_name,
-                       COUNT(e.id) as enrolled_count
-                FROM courses c
-                LEFT JOIN users u ON c.teacher_id = u.id
-                LEFT JOIN enrollments e ON c.id = e.course_id
-                WHERE c.id = %s
-                GROUP BY c.id, c.teacher_id, c.title, c.description, c.video_url, c.is_published, c.created_at, c.category, c.level, u.name
-            """, (str(course_id),))
+    with conn.cursor() as cur:
+        cur.execute(COURSE_SELECT + " WHERE c.id = %s", (str(course_id),))
             
-            course = cur.fetchone()
+        course = cur.fetchone()
             
-        if not course:
-            return jsonify({'error': 'Course not found'}), 404
+    if not course:
+        return jsonify({'error': 'Course not found'}), 404
             
-        # Check if user can view this course
-        is_published = course[5]
-        teacher_id = str(course[1])
+    # Check if user can view this course
+    is_published = course[5]
+    teacher_id = str(course[1])
         
-        # Allow if published OR if user is teacher/admin
-        if not is_published and current_user['role'] not in ['teacher', 'admin']:
-            return jsonify({'error': 'Course not available'}), 403
+    # Allow if published OR if user is teacher/admin
+    if not is_published and current_user['role'] not in ['teacher', 'admin']:
+        return jsonify({'error': 'Course not available'}), 403
             
-        # Allow if user is the teacher of this course or admin
-        if not is_published and teacher_id != current_user['id'] and current_user['role'] != 'admin':
-            return jsonify({'error': 'Course not available'}), 403
+    # Allow if user is the teacher of this course or admin
+    if not is_published and teacher_id != current_user['id'] and current_user['role'] != 'admin':
+        return jsonify({'error': 'Course not available'}), 403
             
-        course_dict = {
-            'id': str(course[0]),
-            'teacher_id': str(course[1]),
-            'title': course[2],
-            'description': course[3],
-            'video_url': course[4],
-            'is_published': course[5],
-            'created_at': course[6].isoformat() if course[6] else None,
-            'category': course[7],
-            'level': course[8],
-            'teacher_name': course[9],
-            'enrolled_count': course[10] or 0
-        }
-        
-        return jsonify(course_dict)
+    return jsonify(row_to_dict(COURSE_COLUMNS, course))
         
-    finally:
-        conn.close()
 
 @bp.route('/', methods=['POST'])
 @require_teacher_or_admin
@@ -210,7 +264,7 @@ def create_course():
     """Create course - only teachers and admins"""
     data = request.json
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
     
     try:
         with conn.cursor() as cur:
@@ -230,12 +284,11 @@ def create_course():
             course_id = cur.fetchone()[0]
             conn.commit()
             
+        invalidate('courses')
         return jsonify({'id': str(course_id), 'message': 'Course created successfully'}), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @bp.route('/<uuid:course_id>', methods=['PUT'])
 @require_teacher_or_admin
@@ -243,7 +296,7 @@ def update_course(course_id):
     """Update course - only teachers and admins"""
     data = request.json
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
     
     try:
         with conn.cursor() as cur:
@@ -271,21 +324,20 @@ def update_course(course_id):
             updated = cur.fetchone()
             conn.commit()
             
+        invalidate('courses', f"course:{course_id}")
         if updated:
             return jsonify({'id': str(updated[0]), 'message': 'Course updated successfully'})
         return jsonify({'error': 'Course not found'}), 404
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @bp.route('/<uuid:course_id>', methods=['DELETE'])
 @require_teacher_or_admin
 def delete_course(course_id):
     """Delete course - only teachers and admins"""
     current_user = get_current_user()
-    conn = get_db_connection()
+    conn = get_db()
     
     try:
         with conn.cursor() as cur:
@@ -304,11 +356,11 @@ def delete_course(course_id):
             deleted = cur.fetchone()
             conn.commit()
             
+        forget_discussion_file(course_id)
+        invalidate('courses', f"course:{course_id}")
         if deleted:
             return jsonify({'id': str(deleted[0]), 'message': 'Course deleted successfully'})
         return jsonify({'error': 'Course not found'}), 404
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
@@ -1,10 +1,28 @@
 from flask import Blueprint, request, jsonify
 from app.models.enrollment import EnrollmentModel
-from app.database import get_db_connection
+from app.database import get_db
 from app.middleware.auth import get_current_user, require_auth
+from app.utils.response_cache import invalidate
+from app.utils.serialization import (
+    RawJSON, db_json, json_rows_sql, raw_json_response, row_number_sql, row_to_dict, rows_to_dicts,
+)
+import uuid
 
 bp = Blueprint('enrollments', __name__)
 
+MAX_BATCH_COURSE_IDS = 200
+
+ENROLLMENT_COLUMNS = ['id', 'student_id', 'course_id', 'enrolled_at']
+MY_COURSE_COLUMNS = ['id', 'title', 'description', 'teacher_id', 'is_published', 'created_at',
+                     'teacher_name', 'enrolled_at']
+
+def adjust_enrolled_count(cur, course_id, delta):
+    """Keep courses.enrolled_count in step with enrollments (same transaction)"""
+    cur.execute("""
+        UPDATE courses SET enrolled_count = GREATEST(enrolled_count + %s, 0)
+        WHERE id = %s
+    """, (delta, str(course_id)))
+
 @bp.route('/check/<uuid:course_id>', methods=['GET'])
 @require_auth
 def check_enrollment(course_id):
@@ -14,7 +32,7 @@ def check_enrollment(course_id):
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
             
-        conn = get_db_connection()
+        conn = get_db()
         with conn.cursor() as cur:
             cur.execute("""
                 SELECT id, enrolled_at FROM enrollments 
@@ -23,8 +41,6 @@ def check_enrollment(course_id):
             
             enrollment = cur.fetchone()
             
-        conn.close()
-        
         if enrollment:
             return jsonify({
                 'enrolled': True,
@@ -37,6 +53,39 @@ def check_enrollment(course_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/check', methods=['GET', 'POST'])
+@require_auth
+def check_enrollments():
+    """Check the current user's enrollment in many courses at once.
+
+    Accepts ?course_ids=<uuid>,<uuid> or a JSON body {"course_ids": [...]}.
+    """
+    user = get_current_user()
+    
+    if request.method == 'POST':
+        course_ids = (request.get_json(silent=True) or {}).get('course_ids') or []
+    else:
+        course_ids = [c for c in request.args.get('course_ids', '').split(',') if c]
+    
+    if not isinstance(course_ids, list):
+        return jsonify({'error': 'course_ids must be a list'}), 400
+    if len(course_ids) > MAX_BATCH_COURSE_IDS:
+        return jsonify({'error': f'At most {MAX_BATCH_COURSE_IDS} course_ids per request'}), 400
+    
+    try:
+        course_ids = [str(uuid.UUID(str(course_id))) for course_id in course_ids]
+    except ValueError:
+        return jsonify({'error': 'Invalid course id'}), 400
+    
+    enrolled = EnrollmentModel(get_db()).status_for_courses(user['id'], course_ids)
+    
+    return jsonify({
+        'enrollments': {
+            course_id: {'enrolled': True, **enrolled[course_id]} if course_id in enrolled else {'enrolled': False}
+            for course_id in course_ids
+        }
+    })
+
 @bp.route('/my-courses', methods=['GET'])
 def get_my_courses():
     """Get current user's enrolled courses"""
@@ -45,11 +94,15 @@ def get_my_courses():
         if not user:
             return jsonify({'error': 'Authentication required'}), 401
             
-        conn = get_db_connection()
+        conn = get_db()
         with conn.cursor() as cur:
             # Get enrolled courses with course details
-            cur.execute("""
-                SELECT 
+            use_db_json = db_json('my_courses')
+            order_by = "ORDER BY e.enrolled_at DESC, e.id DESC"
+            # db-side JSON numbers the rows in the listing's order (see json_rows_sql)
+            numbered = f"{row_number_sql(order_by)}," if use_db_json else ""
+            query = f"""
+                SELECT {numbered}
                     c.id,
                     c.title,
                     c.description,
@@ -62,50 +115,35 @@ def get_my_courses():
                 JOIN courses c ON e.course_id = c.id
                 JOIN users u ON c.teacher_id = u.id
                 WHERE e.student_id = %s
-                ORDER BY e.enrolled_at DESC
-            """, (str(user['id']),))
-            
+                {order_by}
+            """
+            if use_db_json:
+                cur.execute(json_rows_sql(query, MY_COURSE_COLUMNS), (str(user['id']),))
+                return raw_json_response(RawJSON(cur.fetchone()[0]))
+            cur.execute(query, (str(user['id']),))
             courses = cur.fetchall()
-            
-            course_list = []
-            for course in courses:
-                course_data = {
-                    'id': course[0],
-                    'title': course[1],
-                    'description': course[2],
-                    'teacher_id': course[3],
-                    'is_published': course[4],
-                    'created_at': course[5].isoformat() if course[5] else None,
-                    'teacher_name': course[6],
-                    'enrolled_at': course[7].isoformat() if course[7] else None
-                }
-                course_list.append(course_data)
                 
-        conn.close()
-        return jsonify(course_list)
+        return jsonify(rows_to_dicts(MY_COURSE_COLUMNS, courses))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/', methods=['GET'])
 def get_enrollments():
-    conn = get_db_connection()
+    conn = get_db()
     with conn.cursor() as cur:
         cur.execute("SELECT id, student_id, course_id, enrolled_at FROM enrollments")
         enrollments = cur.fetchall()
-    enrollment_list = [dict(zip(['id', 'student_id', 'course_id', 'enrolled_at'], enrollment)) for enrollment in enrollments]
-    conn.close()
-    return jsonify(enrollment_list)
+    return jsonify(rows_to_dicts(ENROLLMENT_COLUMNS, enrollments))
 
 @bp.route('/<uuid:enrollment_id>', methods=['GET'])
 def get_enrollment(enrollment_id):
-    conn = get_db_connection()
+    conn = get_db()
     with conn.cursor() as cur:
         cur.execute("SELECT id, student_id, course_id, enrolled_at FROM enrollments WHERE id = %s", (str(enrollment_id),))
         enrollment = cur.fetchone()
-    conn.close()
     if enrollment:
-        return jsonify(dict(zip(['id', 'student_id', 'course_id', 'enrolled_at'], enrollment)))
+        return jsonify(row_to_dict(ENROLLMENT_COLUMNS, enrollment))
     return jsonify({'error': 'Enrollment not found'}), 404
 
 @bp.route('/', methods=['POST'])
@@ -125,7 +163,7 @@ def create_enrollment():
     if not data.get('course_id'):
         return jsonify({'error': 'course_id is required'}), 400
     
-    conn = get_db_connection()
+    conn = get_db()
     try:
         with conn.cursor() as cur:
             # Check if course exists and is published
@@ -138,53 +176,65 @@ def create_enrollment():
             if not course[1]:  # is_published
                 return jsonify({'error': 'Course is not published'}), 403
             
-            # Check if already enrolled
-            cur.execute("SELECT id FROM enrollments WHERE student_id = %s AND course_id = %s", 
-                       (current_user['id'], data['course_id']))
-            existing = cur.fetchone()
-            
-            if existing:
-                return jsonify({'error': 'Already enrolled in this course'}), 409
-            
-            # Create enrollment
+            # Create enrollment; the unique (student_id, course_id) constraint
+            # settles concurrent duplicate requests
             cur.execute("""
                 INSERT INTO enrollments (student_id, course_id)
-                VALUES (%s, %s) RETURNING id
+                VALUES (%s, %s)
+                ON CONFLICT (student_id, course_id) DO NOTHING
+                RETURNING id
             """, (current_user['id'], data['course_id']))
-            enrollment_id = cur.fetchone()[0]
+            created = cur.fetchone()
+            
+            if not created:
+                conn.rollback()
+                return jsonify({'error': 'Already enrolled in this course'}), 409
+            
+            enrollment_id = created[0]
+            adjust_enrolled_count(cur, data['course_id'], 1)
             conn.commit()
             
+        invalidate('courses', f"course:{data['course_id']}")
         return jsonify({'id': str(enrollment_id), 'message': 'Successfully enrolled in course'}), 201
         
     except Exception as e:
+        conn.rollback()
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @bp.route('/<uuid:enrollment_id>', methods=['PUT'])
 def update_enrollment(enrollment_id):
     data = request.json
-    conn = get_db_connection()
+    conn = get_db()
     with conn.cursor() as cur:
         cur.execute("""
-            UPDATE enrollments SET student_id=%s, course_id=%s
-            WHERE id=%s RETURNING id
-        """, (data['student_id'], data['course_id'], str(enrollment_id)))
+            WITH old AS (
+                SELECT id, course_id FROM enrollments WHERE id = %s FOR UPDATE
+            )
+            UPDATE enrollments e SET student_id=%s, course_id=%s
+            FROM old
+            WHERE e.id = old.id
+            RETURNING e.id, old.course_id, e.course_id
+        """, (str(enrollment_id), data['student_id'], data['course_id']))
         updated = cur.fetchone()
+        if updated and updated[1] != updated[2]:
+            adjust_enrolled_count(cur, updated[1], -1)
+            adjust_enrolled_count(cur, updated[2], 1)
         conn.commit()
-    conn.close()
     if updated:
+        invalidate('courses', f"course:{updated[1]}", f"course:{updated[2]}")
         return jsonify({'id': updated[0]})
     return jsonify({'error': 'Enrollment not found'}), 404
 
 @bp.route('/<uuid:enrollment_id>', methods=['DELETE'])
 def delete_enrollment(enrollment_id):
-    conn = get_db_connection()
+    conn = get_db()
     with conn.cursor() as cur:
-        cur.execute("DELETE FROM enrollments WHERE id = %s RETURNING id", (str(enrollment_id),))
+        cur.execute("DELETE FROM enrollments WHERE id = %s RETURNING id, course_id", (str(enrollment_id),))
         deleted = cur.fetchone()
+        if deleted:
+            adjust_enrolled_count(cur, deleted[1], -1)
         conn.commit()
-    conn.close()
     if deleted:
+        invalidate('courses', f"course:{deleted[1]}")
         return jsonify({'id': deleted[0]})
     return jsonify({'error': 'Enrollment not found'}), 404
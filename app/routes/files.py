@@ -1,75 +1,249 @@
 from flask import Blueprint, request, jsonify
-from app.models.course_file import CourseFileModel
-from app.database import get_db_connection
-from app.middleware.auth import require_auth, require_teacher_or_admin
+from app.models.course_file import CourseFileModel, forget_discussion_file
+from app.models.media_blob import MediaBlobModel
+from app.database import get_db, close_db
+from app.middleware.auth import require_auth, require_teacher_or_admin, get_current_user, get_browser_user
+from app.utils.media import artifact_path, artifact_url, media_response, media_url, stored_name
+from app.utils.processing import enqueue_processing, remove_derived
+from app.utils.response_cache import cached_response, invalidate
+from app.utils.serialization import row_to_dict
+from app.utils.uploads import (
+    UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_FILE_TYPES, UPLOAD_FORM_MAX_BYTES, UPLOAD_MAX_BYTES, UPLOAD_TMP_DIR,
+    UPLOAD_URL_PREFIX,
+    UploadError, blob_name, blob_url, create_part, discard, locked_part, parse_checksum_header,
+    part_path, place_blob, purge_trash, restore_blob, rollback_chunk, save_stream, trash_blob,
+    unplace_blob, verify_part, write_chunk,
+)
+from contextlib import contextmanager
 import os
+import re
 import uuid
 
 bp = Blueprint('files', __name__)
 
+FILE_COLUMNS = ['id', 'course_id', 'title', 'file_type', 'file_url', 'file_order']
+PROCESSING_COLUMNS = ['status', 'info', 'thumbnail_url', 'preview_url', 'transcoded_url']
+
+# Course files joined with the processing results of the blob they point at
+FILE_SELECT = f"""
+    SELECT f.id, f.course_id, f.title, f.file_type, f.file_url, f.file_order,
+           b.processing_status, b.media_info, b.thumbnail_url, b.preview_url, b.transcoded_url
+    FROM course_files f
+    LEFT JOIN media_blobs b
+      ON starts_with(f.file_url, '{UPLOAD_URL_PREFIX}/')
+     AND b.name = substr(f.file_url, {len(UPLOAD_URL_PREFIX) + 2})
+"""
+
+def file_to_dict(row):
+    file = row_to_dict(FILE_COLUMNS, row)
+    file['media_url'] = media_url(file['id'], file['file_url'])
+    if file['media_url']:
+        # Stored uploads are only reachable through the checked media endpoint
+        file['file_url'] = None
+    processing = row[len(FILE_COLUMNS):]
+    if processing and processing[0]:
+        file['processing'] = dict(zip(PROCESSING_COLUMNS, processing))
+        for key in PROCESSING_COLUMNS[2:]:
+            file['processing'][key] = artifact_url(file['id'], file['processing'][key])
+    else:
+        file['processing'] = None
+    return file
+
+@contextmanager
+def stored_blob(conn, src_path, digest, size, filename):
+    """Take a reference on the blob for an upload's content and yield its file_url.
+
+    The file at ``src_path`` becomes the blob unless identical content is
+    already stored. The body inserts the course_files row; the transaction
+    is committed on exit, and on failure the file is put back at src_path.
+    New content is queued for background processing once committed.
+    """
+    name = blob_name(digest, filename)
+    moved = False
+    try:
+        is_new = MediaBlobModel(conn).acquire(name, digest, size)
+        moved = place_blob(src_path, name)
+        yield blob_url(name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if moved:
+            unplace_blob(src_path, name)
+        raise
+    if is_new:
+        enqueue_processing(name)
+
+def release_blob(conn, file_url):
+    """Drop a course_files reference to a stored blob.
+
+    Returns (name, trash path) if that was the last reference: the blob is
+    moved aside so the caller can purge_trash() after commit or
+    restore_blob() after a rollback.
+    """
+    name = stored_name(file_url)
+    if name and MediaBlobModel(conn).release(name):
+        return name, trash_blob(name)
+    return None, None
+
+def reference_blob(conn, file_url, file_id=None):
+    """Take a reference for a course file whose file_url is set by hand.
+
+    External links need nothing. A stored blob can be reused by admins, or
+    by a teacher who already has it on a course they teach (``file_id``,
+    the row being updated, doesn't count), so nobody can pull another
+    course's upload into their own course. Returns an error message or None.
+    """
+    if not file_url.startswith(UPLOAD_URL_PREFIX + '/'):
+        return None
+    name = stored_name(file_url)
+    if not name:
+        return 'Invalid stored file'
+    current_user = get_current_user()
+    if current_user['role'] != 'admin':
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT 1 FROM course_files f JOIN courses c ON c.id = f.course_id
+                    WHERE f.file_url = %s AND c.teacher_id = %s AND f.id IS DISTINCT FROM %s
+                )
+            """, (file_url, current_user['id'], file_id))
+            if not cur.fetchone()[0]:
+                return 'Stored files can only be reused from courses you teach'
+    if not MediaBlobModel(conn).add_ref(name):
+        return 'Stored file not found'
+    return None
+
+def file_list_tags(args, view_args):
+    # 'media' is bumped when background processing finishes
+    if args.get('course_id'):
+        return [f"files:{args['course_id']}", 'media']
+    return ['files', 'media']
+
+def invalidate_files(*course_ids):
+    invalidate('files', *(f"files:{course_id}" for course_id in course_ids))
+
 @bp.route('/', methods=['GET'])
 @require_auth
+@cached_response('files', tags=file_list_tags)
 def get_files():
-    conn = get_db_connection()
-    try:
-        course_id = request.args.get('course_id')
+    conn = get_db()
+    course_id = request.args.get('course_id')
         
-        if course_id:
-            # Get files for specific course
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT id, course_id, title, file_type, file_url, file_order 
-                    FROM course_files 
-                    WHERE course_id = %s 
-                    ORDER BY file_order ASC
-                """, (course_id,))
-                files = cur.fetchall()
-        else:
-            # Get all files
-            with conn.cursor() as cur:
-                cur.execute("SELECT id, course_id, title, file_type, file_url, file_order FROM course_files")
-                files = cur.fetchall()
+    if course_id:
+        # Get files for specific course
+        with conn.cursor() as cur:
+            cur.execute(FILE_SELECT + """
+                WHERE f.course_id = %s 
+                ORDER BY f.file_order ASC
+            """, (course_id,))
+            files = cur.fetchall()
+    else:
+        # Get all files
+        with conn.cursor() as cur:
+            cur.execute(FILE_SELECT)
+            files = cur.fetchall()
         
-        file_list = [dict(zip(['id', 'course_id', 'title', 'file_type', 'file_url', 'file_order'], file)) for file in files]
-        return jsonify({'files': file_list})
-    finally:
-        conn.close()
+    file_list = [file_to_dict(file) for file in files]
+    return jsonify({'files': file_list})
 
 @bp.route('/<uuid:file_id>', methods=['GET'])
 @require_auth
 def get_file(file_id):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, course_id, title, file_type, file_url, file_order FROM course_files WHERE id = %s", (str(file_id),))
-            file = cur.fetchone()
-        if file:
-            return jsonify(dict(zip(['id', 'course_id', 'title', 'file_type', 'file_url', 'file_order'], file)))
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute(FILE_SELECT + " WHERE f.id = %s", (str(file_id),))
+        file = cur.fetchone()
+    if file:
+        return jsonify(file_to_dict(file))
+    return jsonify({'error': 'File not found'}), 404
+
+def checked_media(file_id):
+    """The stored blob name behind a course file the browser user may read.
+
+    Open to admins, the course teacher and enrolled students. Browsers
+    can't add an Authorization header to <video src>, so the auth_token
+    cookie is accepted as well. Returns (name, None) or (None, error response).
+    """
+    current_user = get_browser_user()
+    if not current_user:
+        return None, (jsonify({'error': 'Authentication required'}), 401)
+
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT f.file_url, c.teacher_id,
+                   EXISTS (SELECT 1 FROM enrollments e
+                           WHERE e.course_id = f.course_id AND e.student_id = %s) AS is_enrolled
+            FROM course_files f
+            LEFT JOIN courses c ON c.id = f.course_id
+            WHERE f.id = %s
+        """, (current_user['id'], str(file_id)))
+        file = cur.fetchone()
+    # Nothing else needs the connection while the file streams
+    close_db()
+
+    if not file:
+        return None, (jsonify({'error': 'File not found'}), 404)
+    file_url, teacher_id, is_enrolled = file
+    if current_user['role'] != 'admin' and str(teacher_id) != current_user['id'] and not is_enrolled:
+        return None, (jsonify({'error': 'Access denied'}), 403)
+
+    name = stored_name(file_url)
+    if not name:
+        return None, (jsonify({'error': 'File is not stored on this server', 'file_url': file_url}), 404)
+    return name, None
+
+@bp.route('/<uuid:file_id>/media', methods=['GET', 'HEAD'])
+def get_file_media(file_id):
+    """Stream an uploaded file with Range/ETag support"""
+    name, error = checked_media(file_id)
+    if error:
+        return error
+    response = media_response(name)
+    if response is None:
         return jsonify({'error': 'File not found'}), 404
-    finally:
-        conn.close()
+    return response
+
+@bp.route('/<uuid:file_id>/media/<artifact>', methods=['GET', 'HEAD'])
+def get_file_artifact(file_id, artifact):
+    """Stream a derived artifact (thumbnail.jpg, preview.png, 720p.mp4) of an uploaded file"""
+    name, error = checked_media(file_id)
+    if error:
+        return error
+    relpath = artifact_path(name, artifact)
+    response = media_response(relpath, etag=relpath.replace('/', '-')) if relpath else None
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+    return response
 
 @bp.route('/', methods=['POST'])
 @require_teacher_or_admin
 def create_file():
     data = request.json
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO course_files (course_id, title, file_type, file_url, file_order)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id
-            """, (data['course_id'], data['title'], data['file_type'], data['file_url'], data.get('file_order', 0)))
-            file_id = cur.fetchone()[0]
-            conn.commit()
-        return jsonify({'id': str(file_id)}), 201
-    finally:
-        conn.close()
+    if not isinstance(data.get('file_url'), str):
+        return jsonify({'error': 'file_url is required'}), 400
+    conn = get_db()
+    error = reference_blob(conn, data['file_url'])
+    if error:
+        conn.rollback()
+        return jsonify({'error': error}), 400
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO course_files (course_id, title, file_type, file_url, file_order)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id
+        """, (data['course_id'], data['title'], data['file_type'], data['file_url'], data.get('file_order', 0)))
+        file_id = cur.fetchone()[0]
+        conn.commit()
+    invalidate_files(data['course_id'])
+    return jsonify({'id': str(file_id)}), 201
 
 @bp.route('/upload', methods=['POST'])
 @require_teacher_or_admin
 def upload_file():
-    """Handle file uploads"""
+    """Handle single-request file uploads (use /uploads for large files)"""
+    if request.content_length and request.content_length > UPLOAD_FORM_MAX_BYTES:
+        return jsonify({'error': f'File too large; use the chunked upload API above {UPLOAD_FORM_MAX_BYTES} bytes'}), 413
+
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
     
@@ -86,74 +260,319 @@ def upload_file():
     if not course_id:
         return jsonify({'error': 'Course ID is required'}), 400
     
-    # Create upload directory if it doesn't exist
-    upload_dir = 'app/static/uploads'
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(upload_dir, unique_filename)
+    # Hash while copying to a temporary file, then store it by content
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4()}.form")
     
     try:
-        # Save file
-        file.save(file_path)
+        digest, size = save_stream(file.stream, tmp_path)
+        UPLOAD_BYTES.inc('form', amount=size)
         
         # Save file info to database
-        conn = get_db_connection()
-        try:
+        conn = get_db()
+        with stored_blob(conn, tmp_path, digest, size, file.filename) as file_url:
             with conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO course_files (course_id, title, file_type, file_url, file_order)
                     VALUES (%s, %s, %s, %s, %s) RETURNING id
-                """, (course_id, title, file_type, f"/static/uploads/{unique_filename}", file_order))
+                """, (course_id, title, file_type, file_url, file_order))
                 file_id = cur.fetchone()[0]
-                conn.commit()
+        invalidate_files(course_id)
             
-            return jsonify({
-                'id': str(file_id),
-                'message': 'File uploaded successfully',
-                'file_url': f"/static/uploads/{unique_filename}"
-            }), 201
-        finally:
-            conn.close()
+        return jsonify({
+            'id': str(file_id),
+            'message': 'File uploaded successfully',
+            'media_url': media_url(file_id, file_url),
+            'sha256': digest
+        }), 201
             
     except Exception as e:
-        # Clean up file if database save fails
-        if os.path.exists(file_path):
-            os.remove(file_path)
         return jsonify({'error': str(e)}), 500
+    finally:
+        # Left behind when the content was already stored, or on failure
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ---------------------------------------------
+# Chunked, resumable uploads
+# ---------------------------------------------
+# POST   /uploads                 start a session (metadata + size [+ sha256])
+# GET    /uploads/<id>            current offset, to resume after a failure
+# PUT    /uploads/<id>            append a chunk at Upload-Offset
+# POST   /uploads/<id>/complete   verify, move into place, create course_files row
+# DELETE /uploads/<id>            abort
+
+SESSION_COLUMNS = ['id', 'course_id', 'created_by', 'filename', 'title', 'file_type', 'file_order',
+                   'total_size', 'received_bytes', 'expected_sha256', 'status', 'file_id']
+SHA256_RE = re.compile(r'^[0-9a-fA-F]{64}$')
+
+def load_upload_session(cur, upload_id, for_update=False):
+    """Fetch an upload session visible to the current user.
+
+    Returns (session, None) or (None, error response).
+    """
+    cur.execute(f"""
+        SELECT {', '.join(SESSION_COLUMNS)} FROM upload_sessions WHERE id = %s
+        {'FOR UPDATE' if for_update else ''}
+    """, (upload_id,))
+    row = cur.fetchone()
+    if not row:
+        return None, (jsonify({'error': 'Upload not found'}), 404)
+    session = dict(zip(SESSION_COLUMNS, row))
+    current_user = get_current_user()
+    if str(session['created_by']) != str(current_user['id']) and current_user['role'] != 'admin':
+        return None, (jsonify({'error': 'Access denied'}), 403)
+    return session, None
+
+def upload_status(session):
+    return {
+        'upload_id': str(session['id']),
+        'status': session['status'],
+        'size': session['total_size'],
+        'offset': session['received_bytes'],
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+        'file_id': str(session['file_id']) if session['file_id'] else None,
+    }
+
+@bp.route('/uploads', methods=['POST'])
+@require_teacher_or_admin
+def start_upload():
+    data = request.json or {}
+    course_id = data.get('course_id')
+    filename = data.get('filename')
+    file_type = data.get('file_type', 'document')
+    size = data.get('size')
+    sha256 = data.get('sha256')
+
+    if not course_id or not filename:
+        return jsonify({'error': 'course_id and filename are required'}), 400
+    if file_type not in UPLOAD_FILE_TYPES:
+        return jsonify({'error': f"file_type must be one of {', '.join(UPLOAD_FILE_TYPES)}"}), 400
+    if not isinstance(size, int) or size < 0:
+        return jsonify({'error': 'size must be a non-negative integer'}), 400
+    if size > UPLOAD_MAX_BYTES:
+        return jsonify({'error': f'File exceeds {UPLOAD_MAX_BYTES} bytes'}), 413
+    if sha256 is not None and not SHA256_RE.match(str(sha256)):
+        return jsonify({'error': 'sha256 must be a hex digest'}), 400
+
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO upload_sessions (course_id, created_by, filename, title, file_type, file_order,
+                                         total_size, expected_sha256)
+            SELECT c.id, %s, %s, %s, %s, %s, %s, %s FROM courses c WHERE c.id = %s
+            RETURNING id
+        """, (get_current_user()['id'], filename[:255], data.get('title') or filename[:200], file_type,
+              int(data.get('file_order', 0)), size, sha256.lower() if sha256 else None, course_id))
+        row = cur.fetchone()
+        if not row:
+            conn.rollback()
+            return jsonify({'error': 'Course not found'}), 404
+        upload_id = str(row[0])
+        create_part(upload_id)
+        conn.commit()
+
+    return jsonify({
+        'upload_id': upload_id,
+        'status': 'pending',
+        'size': size,
+        'offset': 0,
+        'chunk_size': UPLOAD_CHUNK_SIZE,
+    }), 201
+
+@bp.route('/uploads/<uuid:upload_id>', methods=['GET'])
+@require_teacher_or_admin
+def get_upload(upload_id):
+    conn = get_db()
+    with conn.cursor() as cur:
+        session, error = load_upload_session(cur, str(upload_id))
+    if error:
+        return error
+    return jsonify(upload_status(session))
+
+@bp.route('/uploads/<uuid:upload_id>', methods=['PUT'])
+@require_teacher_or_admin
+def upload_chunk(upload_id):
+    """Append one chunk. Headers: Upload-Offset (required), Upload-Checksum: sha256 <base64>"""
+    upload_id = str(upload_id)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        checksum = parse_checksum_header(request.headers.get('Upload-Checksum'))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    try:
+        with locked_part(upload_id) as part:
+            conn = get_db()
+            with conn.cursor() as cur:
+                session, error = load_upload_session(cur, upload_id)
+            conn.commit()
+            if error:
+                return error
+            if session['status'] != 'pending':
+                return jsonify({'error': f"Upload is {session['status']}"}), 409
+            if offset != session['received_bytes']:
+                return jsonify({'error': 'Offset mismatch', 'offset': session['received_bytes']}), 409
+
+            # Don't hold a pooled connection while the body streams in
+            close_db()
+            new_offset = write_chunk(part, upload_id, offset, session['total_size'],
+                                     request.stream, request.content_length, checksum)
+
+            try:
+                conn = get_db()
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE upload_sessions SET received_bytes = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND received_bytes = %s AND status = 'pending'
+                    """, (new_offset, upload_id, offset))
+                    recorded = cur.rowcount == 1
+                conn.commit()
+            except Exception:
+                rollback_chunk(part, upload_id, offset)
+                raise
+            if not recorded:
+                rollback_chunk(part, upload_id, offset)
+                return jsonify({'error': 'Upload changed while the chunk was being written'}), 409
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    return jsonify({'upload_id': upload_id, 'offset': new_offset, 'size': session['total_size']})
+
+@bp.route('/uploads/<uuid:upload_id>/complete', methods=['POST'])
+@require_teacher_or_admin
+def complete_upload(upload_id):
+    upload_id = str(upload_id)
+    try:
+        with locked_part(upload_id) as part:
+            conn = get_db()
+            with conn.cursor() as cur:
+                session, error = load_upload_session(cur, upload_id, for_update=True)
+                if error:
+                    conn.rollback()
+                    return error
+                if session['status'] != 'pending':
+                    conn.rollback()
+                    return jsonify({'error': f"Upload is {session['status']}"}), 409
+                if session['received_bytes'] != session['total_size']:
+                    conn.rollback()
+                    return jsonify({'error': 'Upload is incomplete', 'offset': session['received_bytes']}), 409
+
+                digest = verify_part(part, upload_id, session['total_size'], session['expected_sha256'])
+                with stored_blob(conn, part_path(upload_id), digest, session['total_size'],
+                                 session['filename']) as file_url:
+                    cur.execute("""
+                        INSERT INTO course_files (course_id, title, file_type, file_url, file_order)
+                        VALUES (%s, %s, %s, %s, %s) RETURNING id
+                    """, (session['course_id'], session['title'], session['file_type'], file_url, session['file_order']))
+                    file_id = cur.fetchone()[0]
+                    cur.execute("""
+                        UPDATE upload_sessions SET status = 'complete', sha256 = %s, file_id = %s,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s
+                    """, (digest, file_id, upload_id))
+        # Drops the part file too if identical content was already stored
+        discard(upload_id)
+        invalidate_files(session['course_id'])
+    except UploadError as e:
+        get_db().rollback()
+        return jsonify({'error': str(e)}), e.status
+
+    return jsonify({
+        'id': str(file_id),
+        'message': 'File uploaded successfully',
+        'media_url': media_url(file_id, file_url),
+        'sha256': digest,
+    }), 201
+
+@bp.route('/uploads/<uuid:upload_id>', methods=['DELETE'])
+@require_teacher_or_admin
+def abort_upload(upload_id):
+    upload_id = str(upload_id)
+    conn = get_db()
+    with conn.cursor() as cur:
+        session, error = load_upload_session(cur, upload_id, for_update=True)
+        if error:
+            conn.rollback()
+            return error
+        if session['status'] != 'pending':
+            conn.rollback()
+            return jsonify({'error': f"Upload is {session['status']}"}), 409
+        cur.execute("""
+            UPDATE upload_sessions SET status = 'aborted', updated_at = CURRENT_TIMESTAMP WHERE id = %s
+        """, (upload_id,))
+        conn.commit()
+    discard(upload_id)
+    return jsonify({'upload_id': upload_id, 'status': 'aborted'})
 
 @bp.route('/<uuid:file_id>', methods=['PUT'])
 @require_teacher_or_admin
 def update_file(file_id):
     data = request.json
-    conn = get_db_connection()
+    conn = get_db()
+    with conn.cursor() as cur:
+        # file_url is left out (null) for stored uploads, which keeps the current one
+        cur.execute("""
+            WITH old AS (
+                SELECT id, course_id, file_type, file_url FROM course_files WHERE id = %s FOR UPDATE
+            )
+            UPDATE course_files f SET course_id=%s, title=%s, file_type=%s,
+                file_url=COALESCE(%s, old.file_url), file_order=%s
+            FROM old
+            WHERE f.id = old.id
+            RETURNING f.id, old.course_id, old.file_type, old.file_url, f.file_url
+        """, (str(file_id), data['course_id'], data['title'], data['file_type'], data.get('file_url'),
+              data.get('file_order', 0)))
+        updated = cur.fetchone()
+    name = trash = None
+    if updated and updated[3] != updated[4]:
+        error = reference_blob(conn, updated[4], file_id=str(updated[0]))
+        if error:
+            conn.rollback()
+            return jsonify({'error': error}), 400
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE course_files SET course_id=%s, title=%s, file_type=%s, file_url=%s, file_order=%s
-                WHERE id=%s RETURNING id
-            """, (data['course_id'], data['title'], data['file_type'], data['file_url'], data.get('file_order', 0), str(file_id)))
-            updated = cur.fetchone()
-            conn.commit()
-        if updated:
-            return jsonify({'id': str(updated[0])})
-        return jsonify({'error': 'File not found'}), 404
-    finally:
-        conn.close()
+        if updated and updated[3] != updated[4]:
+            name, trash = release_blob(conn, updated[3])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        restore_blob(trash, name)
+        raise
+    purge_trash(trash)
+    if name:
+        remove_derived(name)
+    if updated and updated[2] == 'discussion':
+        forget_discussion_file(updated[1])
+    if updated:
+        invalidate_files(updated[1], data['course_id'])
+        return jsonify({'id': str(updated[0])})
+    return jsonify({'error': 'File not found'}), 404
 
 @bp.route('/<uuid:file_id>', methods=['DELETE'])
 @require_teacher_or_admin
 def delete_file(file_id):
-    conn = get_db_connection()
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM course_files WHERE id = %s RETURNING id, course_id, file_type, file_url", (str(file_id),))
+        deleted = cur.fetchone()
+    name = trash = None
     try:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM course_files WHERE id = %s RETURNING id", (str(file_id),))
-            deleted = cur.fetchone()
-            conn.commit()
         if deleted:
-            return jsonify({'id': str(deleted[0])})
-        return jsonify({'error': 'File not found'}), 404
-    finally:
-        conn.close()
+            # Garbage-collect the blob with its last reference
+            name, trash = release_blob(conn, deleted[3])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        restore_blob(trash, name)
+        raise
+    purge_trash(trash)
+    if name:
+        remove_derived(name)
+    if deleted and deleted[2] == 'discussion':
+        forget_discussion_file(deleted[1])
+    if deleted:
+        invalidate_files(deleted[1])
+        return jsonify({'id': str(deleted[0])})
+    return jsonify({'error': 'File not found'}), 404
@@ -0,0 +1,40 @@
+from flask import Blueprint, jsonify
+from app.database import get_db, get_pool_stats
+from app.middleware.auth import require_admin
+from app.middleware.user_cache import user_cache
+from app.models.course_file import discussion_files
+from app.utils.realtime import hub
+from app.utils.response_cache import cache_stats
+
+bp = Blueprint('health', __name__)
+
+@bp.route('/', methods=['GET'])
+def health():
+    """Liveness check - runs a trivial query on a pooled connection"""
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1")
+        cur.fetchone()
+    return jsonify({'status': 'ok'})
+
+@bp.route('/pool', methods=['GET'])
+@require_admin
+def pool_stats():
+    """Connection pool saturation stats - admin only"""
+    return jsonify({'pool': get_pool_stats()})
+
+@bp.route('/realtime', methods=['GET'])
+@require_admin
+def realtime_stats():
+    """Notification stream fan-out stats for this process - admin only"""
+    return jsonify({'realtime': hub.stats()})
+
+@bp.route('/cache', methods=['GET'])
+@require_admin
+def cache_health():
+    """Hit rates of this process's caches - admin only"""
+    return jsonify({
+        'responses': cache_stats(),
+        'users': user_cache.stats(),
+        'discussion_files': discussion_files.stats(),
+    })
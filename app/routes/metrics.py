@@ -0,0 +1,77 @@
+import hmac
+from flask import Blueprint, Response, jsonify, request
+from app.database import get_pool_stats
+from app.middleware.user_cache import user_cache
+from app.models.course_file import discussion_files
+from app.utils.metrics import METRICS_TOKEN, REGISTRY, CallbackCounter, CallbackGauge
+from app.utils.realtime import hub
+from app.utils.response_cache import cache_stats
+
+bp = Blueprint('metrics', __name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+CallbackGauge('db_pool_connections', 'Pooled connections in this process, by state', ('state',))
+CallbackGauge('db_pool_max_connections', 'Pool size limit per process')
+CallbackGauge('db_pool_waiting', 'Threads waiting for a pooled connection')
+CallbackCounter('db_pool_checkouts_total', 'Connections handed out by the pool')
+CallbackCounter('db_pool_timeouts_total', 'Checkouts that gave up waiting for a connection')
+CallbackCounter('db_pool_connects_total', 'New database connections opened by the pool')
+CallbackCounter('db_pool_discarded_total', 'Pooled connections closed as broken or expired')
+CallbackGauge('sse_streams', 'Open notification streams')
+CallbackCounter('sse_events_delivered_total', 'Notification events pushed to streams')
+CallbackCounter('sse_events_dropped_total', 'Notification events dropped for slow streams')
+CallbackGauge('cache_entries', 'Entries held by in-process caches', ('cache',))
+CallbackCounter('cache_hits_total', 'Cache hits', ('cache',))
+CallbackCounter('cache_misses_total', 'Cache misses', ('cache',))
+
+
+@REGISTRY.collector
+def pool_samples():
+    stats = get_pool_stats()
+    if stats is None:
+        return []
+    return [
+        ('db_pool_connections', ('in_use',), stats['in_use']),
+        ('db_pool_connections', ('idle',), stats['idle']),
+        ('db_pool_max_connections', (), stats['max_size']),
+        ('db_pool_waiting', (), stats['waiting']),
+        ('db_pool_checkouts_total', (), stats['checkouts']),
+        ('db_pool_timeouts_total', (), stats['timeouts']),
+        ('db_pool_connects_total', (), stats['connects']),
+        ('db_pool_discarded_total', (), stats['discarded']),
+    ]
+
+
+@REGISTRY.collector
+def realtime_samples():
+    stats = hub.stats()
+    return [
+        ('sse_streams', (), stats['streams']),
+        ('sse_events_delivered_total', (), stats['delivered']),
+        ('sse_events_dropped_total', (), stats['dropped']),
+    ]
+
+
+@REGISTRY.collector
+def cache_samples():
+    samples = []
+    for name, stats in (('responses', cache_stats()), ('users', user_cache.stats()),
+                        ('discussion_files', discussion_files.stats())):
+        if not stats.get('enabled'):
+            continue
+        if 'size' in stats:
+            samples.append(('cache_entries', (name,), stats['size']))
+        samples.append(('cache_hits_total', (name,), stats['hits']))
+        samples.append(('cache_misses_total', (name,), stats['misses']))
+    return samples
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint (bearer METRICS_TOKEN when configured)"""
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not hmac.compare_digest(supplied.encode(), METRICS_TOKEN.encode()):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+    return Response(REGISTRY.exposition(), content_type=CONTENT_TYPE)
@@ -1,63 +1,361 @@
-from flask import Blueprint, request, jsonify
-from app.models.notification import NotificationModel
-from app.database import get_db
+from flask import Blueprint, Response, request, jsonify
+from app.models.notification import NotificationModel, adjust_unread_count
+from app.database import get_db, close_db
+from app.middleware.auth import require_auth, require_teacher_or_admin, get_current_user, get_browser_user
+from app.utils.serialization import row_to_dict, rows_to_dicts
+from app.utils.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_condition
+from app.utils.notification_jobs import JOB_COLUMNS, count_recipients, enqueue_job, render_template
+from app.utils.realtime import (
+    RESYNC, SSE_HEARTBEAT, SSE_MAX_DURATION, SSE_REPLAY_LIMIT, SSE_RETRY_MS, hub, sse_event, wait_for,
+)
+import json
+import time
+import uuid
+from datetime import datetime
 
 bp = Blueprint('notifications', __name__)
 
+NOTIFICATION_COLUMNS = ['id', 'user_id', 'title', 'message', 'is_read', 'created_at']
+MAX_PER_PAGE = 100
+MAX_BATCH_NOTIFICATION_IDS = 500
+MAX_BULK_USER_IDS = 10000
+# Resume point for a stream opened before the user had any notifications
+STREAM_ORIGIN = (datetime(1970, 1, 1), '00000000-0000-0000-0000-000000000000')
+
+def can_access(current_user, user_id):
+    return current_user['role'] == 'admin' or str(user_id) == current_user['id']
+
 @bp.route('/', methods=['GET'])
+@require_auth
 def get_notifications():
+    """The current user's notifications, newest first.
+
+    ?limit= (max 100), ?cursor=<next_cursor> for the next page,
+    ?unread=true for unread only. Admins may pass ?user_id=.
+    """
+    current_user = get_current_user()
+    user_id = request.args.get('user_id', current_user['id'], type=str)
+    try:
+        user_id = str(uuid.UUID(user_id))
+    except ValueError:
+        return jsonify({'error': 'Invalid user id'}), 400
+    if not can_access(current_user, user_id):
+        return jsonify({'error': 'Access denied'}), 403
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PER_PAGE)
+    unread_only = request.args.get('unread', '', type=str).lower() in ('1', 'true')
+    cursor = request.args.get('cursor', '', type=str)
+
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    if unread_only:
+        conditions.append("is_read = false")
+    if cursor:
+        try:
+            after_sql, after_params = keyset_condition(
+                ['created_at', 'id'], True, decode_cursor(cursor, 'newest'))
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        conditions.append(after_sql)
+        params.extend(after_params)
+
     conn = get_db()
     with conn.cursor() as cur:
-        cur.execute("SELECT id, user_id, title, message, is_read, created_at FROM notifications")
+        # Fetch one extra row to know whether there is a next page
+        cur.execute(f"""
+            SELECT {', '.join(NOTIFICATION_COLUMNS)}
+            FROM notifications
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """, params + [limit + 1])
         notifications = cur.fetchall()
-    notification_list = [dict(zip(['id', 'user_id', 'title', 'message', 'is_read', 'created_at'], notification)) for notification in notifications]
-    return jsonify(notification_list)
+
+    has_next = len(notifications) > limit
+    notifications = notifications[:limit]
+    return jsonify({
+        'notifications': rows_to_dicts(NOTIFICATION_COLUMNS, notifications),
+        'pagination': {
+            'mode': 'cursor',
+            'per_page': limit,
+            'next_cursor': encode_cursor('newest', [notifications[-1][5], notifications[-1][0]]) if has_next else None,
+            'has_next': has_next,
+        }
+    })
+
+@bp.route('/stream', methods=['GET'])
+def stream_notifications():
+    """Server-Sent Events stream of the current user's new notifications.
+
+    Each event's id is a (created_at, id) cursor; on reconnect the browser
+    sends it back as Last-Event-ID and anything missed is replayed from the
+    table first. A `ready` event carries the starting id for fresh
+    connections, `: heartbeat` comments keep proxies from timing out, and
+    a `resync` event (or the stream ending after SSE_MAX_DURATION) just
+    means "reconnect".
+    """
+    current_user = get_browser_user()
+    if not current_user:
+        return jsonify({'error': 'Authentication required'}), 401
+    user_id = current_user['id']
+
+    after = None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id:
+        try:
+            after = decode_cursor(last_event_id, 'stream')
+        except InvalidCursor:
+            after = None
+
+    # Subscribe before reading the table so nothing falls in between
+    q = hub.subscribe(user_id)
+    try:
+        conn = get_db()
+        with conn.cursor() as cur:
+            if after:
+                after_sql, after_params = keyset_condition(['created_at', 'id'], False, after)
+                cur.execute(f"""
+                    SELECT {', '.join(NOTIFICATION_COLUMNS)} FROM notifications
+                    WHERE user_id = %s AND {after_sql}
+                    ORDER BY created_at, id
+                    LIMIT %s
+                """, [user_id] + after_params + [SSE_REPLAY_LIMIT + 1])
+                backlog = cur.fetchall()
+                start = None
+            else:
+                cur.execute("""
+                    SELECT created_at, id FROM notifications WHERE user_id = %s
+                    ORDER BY created_at DESC, id DESC LIMIT 1
+                """, (user_id,))
+                backlog, start = [], cur.fetchone()
+        conn.commit()
+    except Exception:
+        hub.unsubscribe(user_id, q)
+        raise
+    finally:
+        # The stream can stay open for minutes; don't hold a pooled connection
+        close_db()
+
+    def event_id(row):
+        return encode_cursor('stream', [row[5], row[0]])
+
+    def generate():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            if not after:
+                # Gives fresh connections an id to resume from
+                yield sse_event({}, event_id=encode_cursor('stream', list(start or STREAM_ORIGIN)), event='ready')
+            seen = set()
+            for row in backlog[:SSE_REPLAY_LIMIT]:
+                seen.add(str(row[0]))
+                yield sse_event(row_to_dict(NOTIFICATION_COLUMNS, row), event_id=event_id(row), event='notification')
+            if len(backlog) > SSE_REPLAY_LIMIT:
+                # Too much to replay; the client should reload its feed
+                yield sse_event({'reason': 'replay_truncated'}, event='resync')
+                return
+
+            deadline = time.monotonic() + SSE_MAX_DURATION
+            while time.monotonic() < deadline:
+                item = wait_for(q, SSE_HEARTBEAT)
+                if item is None:
+                    yield ": heartbeat\n\n"
+                elif item is RESYNC:
+                    yield sse_event({'reason': 'missed_events'}, event='resync')
+                    return
+                elif str(item[0]) not in seen:
+                    yield sse_event(row_to_dict(NOTIFICATION_COLUMNS, item), event_id=event_id(item), event='notification')
+        finally:
+            hub.unsubscribe(user_id, q)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@bp.route('/unread-count', methods=['GET'])
+@require_auth
+def get_unread_count():
+    """Unread notifications for the current user (a counter, not a COUNT)"""
+    conn = get_db()
+    unread = NotificationModel(conn).unread_count(get_current_user()['id'])
+    return jsonify({'unread': unread})
+
+@bp.route('/read', methods=['POST'])
+@require_auth
+def mark_notifications_read():
+    """Mark several notifications read. Body: {"ids": [...]}"""
+    ids = (request.json or {}).get('ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'error': 'ids must be a non-empty list'}), 400
+    if len(ids) > MAX_BATCH_NOTIFICATION_IDS:
+        return jsonify({'error': f'At most {MAX_BATCH_NOTIFICATION_IDS} ids per request'}), 400
+
+    try:
+        ids = [str(uuid.UUID(str(notification_id))) for notification_id in ids]
+    except ValueError:
+        return jsonify({'error': 'Invalid notification id'}), 400
+
+    conn = get_db()
+    marked, unread = NotificationModel(conn).mark_read(get_current_user()['id'], ids)
+    conn.commit()
+    return jsonify({'marked': marked, 'unread': unread})
+
+@bp.route('/read-all', methods=['POST'])
+@require_auth
+def mark_all_notifications_read():
+    conn = get_db()
+    marked, unread = NotificationModel(conn).mark_read(get_current_user()['id'])
+    conn.commit()
+    return jsonify({'marked': marked, 'unread': unread})
+
+def job_to_dict(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    for key in ('id', 'created_by'):
+        job[key] = str(job[key])
+    for key in ('created_at', 'started_at', 'finished_at'):
+        job[key] = job[key].isoformat() if job[key] else None
+    if job['target_type'] == 'users':
+        job['target'] = f"{len(job['target'])} users"
+    job.pop('last_user_id')
+    job['progress'] = round(job['sent'] / job['total'], 3) if job['total'] else 1.0
+    return job
+
+@bp.route('/bulk', methods=['POST'])
+@require_teacher_or_admin
+def create_bulk_notification():
+    """Send one notification to many users as a background job.
+
+    Body: {"course_id": ...} (enrolled students), {"role": ...} or
+    {"user_ids": [...]}, plus "title" and "message". Both may use
+    {placeholders} filled from "context" plus course_title / sender_name;
+    they are rendered once, not per recipient. Teachers can only target
+    their own courses. Poll GET /bulk/<job_id> for progress.
+    """
+    data = request.json or {}
+    current_user = get_current_user()
+    if not data.get('title') or not data.get('message'):
+        return jsonify({'error': 'title and message are required'}), 400
+
+    conn = get_db()
+    context = {key: value for key, value in (data.get('context') or {}).items() if isinstance(value, (str, int, float))}
+    context['sender_name'] = current_user['name']
+
+    with conn.cursor() as cur:
+        if data.get('course_id'):
+            target_type, target = 'course', str(data['course_id'])
+            cur.execute("SELECT title, teacher_id FROM courses WHERE id = %s", (target,))
+            course = cur.fetchone()
+            if not course:
+                return jsonify({'error': 'Course not found'}), 404
+            if current_user['role'] != 'admin' and str(course[1]) != current_user['id']:
+                return jsonify({'error': 'Permission denied'}), 403
+            context['course_title'] = course[0]
+        elif current_user['role'] != 'admin':
+            return jsonify({'error': 'Only admins can target roles or user lists'}), 403
+        elif data.get('role'):
+            if data['role'] not in ('admin', 'teacher', 'student'):
+                return jsonify({'error': 'Invalid role'}), 400
+            target_type, target = 'role', data['role']
+        elif isinstance(data.get('user_ids'), list) and data['user_ids']:
+            if len(data['user_ids']) > MAX_BULK_USER_IDS:
+                return jsonify({'error': f'At most {MAX_BULK_USER_IDS} user_ids per job'}), 400
+            target_type, target = 'users', sorted({str(user_id) for user_id in data['user_ids']})
+        else:
+            return jsonify({'error': 'Provide course_id, role or user_ids'}), 400
+
+        try:
+            title = render_template(data['title'], context)[:200]
+            message = render_template(data['message'], context)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        total = count_recipients(cur, target_type, target)
+        cur.execute(f"""
+            INSERT INTO notification_jobs (created_by, target_type, target, title, message, total)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING {', '.join(JOB_COLUMNS)}
+        """, (current_user['id'], target_type, json.dumps(target), title, message, total))
+        job = cur.fetchone()
+        conn.commit()
+
+    enqueue_job(job[0])
+    return jsonify(job_to_dict(job)), 202
+
+@bp.route('/bulk/<uuid:job_id>', methods=['GET'])
+@require_teacher_or_admin
+def get_bulk_notification(job_id):
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM notification_jobs WHERE id = %s", (str(job_id),))
+        job = cur.fetchone()
+    if not job or not can_access(get_current_user(), job[1]):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_to_dict(job))
 
 @bp.route('/<uuid:notification_id>', methods=['GET'])
+@require_auth
 def get_notification(notification_id):
     conn = get_db()
     with conn.cursor() as cur:
-        cur.execute("SELECT id, user_id, title, message, is_read, created_at FROM notifications WHERE id = %s", (str(notification_id),))
+        cur.execute(f"SELECT {', '.join(NOTIFICATION_COLUMNS)} FROM notifications WHERE id = %s", (str(notification_id),))
         notification = cur.fetchone()
-    if notification:
-        return jsonify(dict(zip(['id', 'user_id', 'title', 'message', 'is_read', 'created_at'], notification)))
+    if notification and can_access(get_current_user(), notification[1]):
+        return jsonify(row_to_dict(NOTIFICATION_COLUMNS, notification))
     return jsonify({'error': 'Notification not found'}), 404
 
 @bp.route('/', methods=['POST'])
+@require_teacher_or_admin
 def create_notification():
     data = request.json
     conn = get_db()
-    with conn.cursor() as cur:
-        cur.execute("""
-            INSERT INTO notifications (user_id, title, message, is_read)
-            VALUES (%s, %s, %s, %s) RETURNING id
-        """, (data['user_id'], data['title'], data['message'], data.get('is_read', False)))
-        notification_id = cur.fetchone()[0]
-        conn.commit()
-    return jsonify({'id': notification_id}), 201
+    notification_id = NotificationModel(conn).create(
+        data['user_id'], data['title'], data['message'], data.get('is_read', False))
+    return jsonify({'id': str(notification_id)}), 201
 
 @bp.route('/<uuid:notification_id>', methods=['PUT'])
+@require_auth
 def update_notification(notification_id):
     data = request.json
+    current_user = get_current_user()
+    if not can_access(current_user, data['user_id']):
+        return jsonify({'error': 'Access denied'}), 403
     conn = get_db()
     with conn.cursor() as cur:
         cur.execute("""
-            UPDATE notifications SET user_id=%s, title=%s, message=%s, is_read=%s
-            WHERE id=%s RETURNING id
-        """, (data['user_id'], data['title'], data['message'], data.get('is_read', False), str(notification_id)))
+            WITH old AS (
+                SELECT id, user_id, is_read FROM notifications WHERE id = %s FOR UPDATE
+            )
+            UPDATE notifications n SET user_id=%s, title=%s, message=%s, is_read=%s
+            FROM old
+            WHERE n.id = old.id AND (%s OR old.user_id = %s)
+            RETURNING n.id, old.user_id, old.is_read, n.user_id, n.is_read
+        """, (str(notification_id), data['user_id'], data['title'], data['message'], data.get('is_read', False),
+              current_user['role'] == 'admin', current_user['id']))
         updated = cur.fetchone()
+        if updated:
+            _, old_user, old_read, new_user, new_read = updated
+            if not old_read:
+                adjust_unread_count(cur, old_user, -1)
+            if not new_read:
+                adjust_unread_count(cur, new_user, 1)
         conn.commit()
     if updated:
-        return jsonify({'id': updated[0]})
+        return jsonify({'id': str(updated[0])})
     return jsonify({'error': 'Notification not found'}), 404
 
 @bp.route('/<uuid:notification_id>', methods=['DELETE'])
+@require_auth
 def delete_notification(notification_id):
+    current_user = get_current_user()
     conn = get_db()
     with conn.cursor() as cur:
-        cur.execute("DELETE FROM notifications WHERE id = %s RETURNING id", (str(notification_id),))
+        cur.execute("""
+            DELETE FROM notifications WHERE id = %s AND (%s OR user_id = %s)
+            RETURNING id, user_id, is_read
+        """, (str(notification_id), current_user['role'] == 'admin', current_user['id']))
         deleted = cur.fetchone()
+        if deleted and not deleted[2]:
+            adjust_unread_count(cur, deleted[1], -1)
         conn.commit()
     if deleted:
-        return jsonify({'id': deleted[0]})
+        return jsonify({'id': str(deleted[0])})
     return jsonify({'error': 'Notification not found'}), 404
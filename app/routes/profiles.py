@@ -0,0 +1,56 @@
+from flask import Blueprint, Response, jsonify, request
+from app.middleware.auth import require_admin
+from app.utils.profiling import config, list_profiles, load_profile, parse_endpoints, to_collapsed, to_pstats
+
+bp = Blueprint('profiles', __name__)
+
+@bp.route('/', methods=['GET'])
+@require_admin
+def get_profiles():
+    """Recent request profiles, newest first - admin only"""
+    return jsonify({'profiles': list_profiles(), 'config': config.as_dict()})
+
+@bp.route('/config', methods=['GET'])
+@require_admin
+def get_config():
+    config.refresh()
+    return jsonify({'config': config.as_dict()})
+
+@bp.route('/config', methods=['PUT'])
+@require_admin
+def update_config():
+    """Set sampling rates: {"endpoints": {"courses.get_courses": 0.1} or "get_comments=1", "sample_rate": 0}"""
+    data = request.json or {}
+    try:
+        endpoints = data.get('endpoints', {})
+        if isinstance(endpoints, str):
+            endpoints = parse_endpoints(endpoints)
+        endpoints = {str(name): float(rate) for name, rate in endpoints.items()}
+        sample_rate = float(data.get('sample_rate', 0))
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'endpoints must map endpoint names to rates'}), 400
+    if not all(0 <= rate <= 1 for rate in [sample_rate, *endpoints.values()]):
+        return jsonify({'error': 'Rates must be between 0 and 1'}), 400
+
+    config.save(endpoints, sample_rate)
+    return jsonify({'config': config.as_dict()})
+
+@bp.route('/<profile_id>', methods=['GET'])
+@require_admin
+def download_profile(profile_id):
+    """?format=collapsed (default), pstats or json"""
+    profile = load_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+
+    fmt = request.args.get('format', 'collapsed')
+    if fmt == 'collapsed':
+        body, mimetype, ext = to_collapsed(profile), 'text/plain', 'txt'
+    elif fmt == 'pstats':
+        body, mimetype, ext = to_pstats(profile), 'application/octet-stream', 'pstats'
+    elif fmt == 'json':
+        return jsonify(profile)
+    else:
+        return jsonify({'error': 'format must be collapsed, pstats or json'}), 400
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{profile_id}.{ext}"'})
@@ -1,107 +1,141 @@
 from flask import Blueprint, request, jsonify
 from app.models.user import UserModel
-from app.database import get_db_connection
+from app.database import get_db
 from app.middleware.auth import require_admin
+from app.middleware.user_cache import invalidate_user
+from app.utils.search import user_search
+from app.utils.pagination import InvalidCursor, count_mode, decode_cursor, encode_cursor, estimate_count, keyset_condition
+from app.utils.serialization import row_to_dict, rows_to_dicts
 
 bp = Blueprint('users', __name__)
 
+MAX_PER_PAGE = 100
+
+USER_COLUMNS = ['id', 'email', 'name', 'role', 'created_at']
+
 @bp.route('/', methods=['GET'])
 @require_admin
 def get_users():
-    """Get users with pagination - admin only"""
-    conn = get_db_connection()
+    """Get users with pagination - admin only
+
+    Offset mode (default): ?page=&per_page=
+    Cursor mode: ?pagination=cursor, then ?cursor=<next_cursor> for later pages.
+    ?total=exact|estimate|none controls the total count.
+    """
+    conn = get_db()
     
     # Pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 6, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 6, type=int), 1), MAX_PER_PAGE)
     search = request.args.get('search', '', type=str)
     role_filter = request.args.get('role', '', type=str)
+    cursor = request.args.get('cursor', '', type=str)
+    cursor_mode = bool(cursor) or request.args.get('pagination', '', type=str) == 'cursor'
+    total_mode = count_mode(request.args, 'none' if cursor_mode else 'exact')
     
-    try:
-        with conn.cursor() as cur:
-            # Build WHERE conditions
-            where_conditions = []
-            params = []
-            
-            if search:
-                where_conditions.append("(name ILIKE %s OR email ILIKE %s)")
-                params.extend([f'%{search}%', f'%{search}%'])
-            
-            if role_filter and role_filter in ['admin', 'teacher', 'student']:
-                where_conditions.append("role = %s")
-                params.append(role_filter)
-            
-            where_clause = ""
-            if where_conditions:
-                where_clause = "WHERE " + " AND ".join(where_conditions)
-            
-            # Count total users
-            count_query = f"SELECT COUNT(*) FROM users {where_clause}"
-            cur.execute(count_query, params)
+    # Build WHERE conditions
+    where_conditions = []
+    params = []
+    
+    search_clause = user_search(search) if search.strip() else None
+    if search_clause:
+        where_conditions.append(search_clause.condition)
+        params.extend(search_clause.params)
+    
+    if role_filter and role_filter in ['admin', 'teacher', 'student']:
+        where_conditions.append("role = %s")
+        params.append(role_filter)
+    
+    where_clause = ""
+    if where_conditions:
+        where_clause = "WHERE " + " AND ".join(where_conditions)
+    
+    # Searches rank by relevance in offset mode; cursor mode stays newest first
+    order_by = "ORDER BY created_at DESC, id DESC"
+    order_params = []
+    if search_clause and not cursor_mode:
+        order_by = f"ORDER BY {search_clause.rank} DESC, created_at DESC, id DESC"
+        order_params = search_clause.rank_params
+    
+    # Keyset condition for the page after the cursor (newest first)
+    page_conditions = list(where_conditions)
+    page_params = list(params)
+    if cursor:
+        try:
+            after_sql, after_params = keyset_condition(
+                ['created_at', 'id'], True, decode_cursor(cursor, 'newest'))
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        page_conditions.append(after_sql)
+        page_params.extend(after_params)
+    page_where = "WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+    
+    with conn.cursor() as cur:
+        # Count total users
+        total_users = None
+        if total_mode == 'exact':
+            cur.execute(f"SELECT COUNT(*) FROM users {where_clause}", params)
             total_users = cur.fetchone()[0]
-            total_pages = (total_users + per_page - 1) // per_page
-            
-            # Get paginated users
-            offset = (page - 1) * per_page
-            users_query = f"""
-                SELECT id, email, name, role, created_at 
-                FROM users 
-                {where_clause}
-                ORDER BY created_at DESC 
-                LIMIT %s OFFSET %s
-            """
-            
-            query_params = params + [per_page, offset]
-            cur.execute(users_query, query_params)
-            users = cur.fetchall()
-            
-        user_list = []
-        for user in users:
-            user_dict = {
-                'id': str(user[0]),
-                'email': user[1],
-                'name': user[2],
-                'role': user[3],
-                'created_at': user[4].isoformat() if user[4] else None
-            }
-            user_list.append(user_dict)
+        elif total_mode == 'estimate':
+            total_users = estimate_count(cur, f"SELECT id FROM users {where_clause}", params)
+        
+        users_query = f"""
+            SELECT id, email, name, role, created_at 
+            FROM users 
+            {page_where}
+            {order_by}
+            LIMIT %s
+        """
         
-        return jsonify({
-            'users': user_list,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total': total_users,
-                'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
-            }
-        })
+        if cursor_mode:
+            # Fetch one extra row to know whether there is a next page
+            cur.execute(users_query, page_params + order_params + [per_page + 1])
+        else:
+            cur.execute(users_query + " OFFSET %s", page_params + order_params + [per_page, (page - 1) * per_page])
+        users = cur.fetchall()
+    
+    has_next = False
+    if cursor_mode and len(users) > per_page:
+        users = users[:per_page]
+        has_next = True
         
-    finally:
-        conn.close()
+    user_list = rows_to_dicts(USER_COLUMNS, users)
+    
+    if cursor_mode:
+        pagination = {
+            'mode': 'cursor',
+            'per_page': per_page,
+            'next_cursor': encode_cursor('newest', [users[-1][4], users[-1][0]]) if has_next else None,
+            'has_next': has_next,
+            'total': total_users
+        }
+    else:
+        total_pages = (total_users + per_page - 1) // per_page if total_users is not None else None
+        pagination = {
+            'page': page,
+            'per_page': per_page,
+            'total': total_users,
+            'total_pages': total_pages,
+            'has_next': page < total_pages if total_pages is not None else len(users) == per_page,
+            'has_prev': page > 1
+        }
+    
+    return jsonify({
+        'users': user_list,
+        'pagination': pagination
+    })
 
 @bp.route('/<uuid:user_id>', methods=['GET'])
 @require_admin
 def get_user(user_id):
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT id, email, name, role, created_at FROM users WHERE id = %s", (str(user_id),))
-            user = cur.fetchone()
+    conn = get_db()
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, email, name, role, created_at FROM users WHERE id = %s", (str(user_id),))
+        user = cur.fetchone()
             
-            if user:
-                user_dict = {
-                    'id': str(user[0]),
-                    'email': user[1],
-                    'name': user[2],
-                    'role': user[3],
-                    'created_at': user[4].isoformat() if user[4] else None
-                }
-                return jsonify(user_dict)
-            return jsonify({'error': 'User not found'}), 404
-    finally:
-        conn.close()
+        if user:
+            return jsonify(row_to_dict(USER_COLUMNS, user))
+        return jsonify({'error': 'User not found'}), 404
 
 @bp.route('/', methods=['POST'])
 @require_admin
@@ -116,7 +150,7 @@ def create_user():
     if data.get('role') not in ['student', 'teacher', 'admin']:
         return jsonify({'error': 'Invalid role. Must be student, teacher, or admin'}), 400
     
-    conn = get_db_connection()
+    conn = get_db()
     try:
         with conn.cursor() as cur:
             # Check if email already exists
@@ -140,15 +174,13 @@ def create_user():
         return jsonify({'id': str(user_id), 'message': 'User created successfully'}), 201
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @bp.route('/<uuid:user_id>', methods=['PUT'])
 @require_admin
 def update_user(user_id):
     """Update user - admin only"""
     data = request.json
-    conn = get_db_connection()
+    conn = get_db()
     
     try:
         with conn.cursor() as cur:
@@ -188,29 +220,27 @@ def update_user(user_id):
             updated = cur.fetchone()
             conn.commit()
             
+        invalidate_user(user_id)
         if updated:
             return jsonify({'id': str(updated[0]), 'message': 'User updated successfully'})
         return jsonify({'error': 'User not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 @bp.route('/<uuid:user_id>', methods=['DELETE'])
 @require_admin
 def delete_user(user_id):
     """Delete user - admin only"""
-    conn = get_db_connection()
+    conn = get_db()
     try:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM users WHERE id = %s RETURNING id", (str(user_id),))
             deleted = cur.fetchone()
             conn.commit()
             
+        invalidate_user(user_id)
         if deleted:
             return jsonify({'id': str(deleted[0]), 'message': 'User deleted successfully'})
         return jsonify({'error': 'User not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
@@ -274,27 +274,23 @@ class CourseList extends HTMLElement {
   async checkEnrollmentStatus() {
     if (!this.courses || this.courses.length === 0) return;
     
+    // The course listing already carries is_enrolled for students
+    const missing = this.courses.filter(course => course.is_enrolled === undefined);
+    if (missing.length === 0) return;
+    
     try {
-      const enrollmentPromises = this.courses.map(async (course) => {
-        try {
-          const enrollmentData = await window.SchoolApp.apiCall(`/enrollments/check/${course.id}`);
-          return { courseId: course.id, enrolled: enrollmentData.enrolled };
-        } catch (error) {
-          console.error(`Failed to check enrollment for course ${course.id}:`, error);
-          return { courseId: course.id, enrolled: false };
-        }
+      // One batched request instead of one per course
+      const data = await window.SchoolApp.apiCall('/enrollments/check', {
+        method: 'POST',
+        body: JSON.stringify({ course_ids: missing.map(course => course.id) })
       });
-      
-      const enrollmentResults = await Promise.all(enrollmentPromises);
+      const enrollments = data.enrollments || {};
       
       // Update courses with enrollment status
-      this.courses = this.courses.map(course => {
-        const enrollmentResult = enrollmentResults.find(r => r.courseId === course.id);
-        return {
-          ...course,
-          is_enrolled: enrollmentResult ? enrollmentResult.enrolled : false
-        };
-      });
+      this.courses = this.courses.map(course => ({
+        ...course,
+        is_enrolled: course.is_enrolled ?? Boolean(enrollments[course.id]?.enrolled)
+      }));
     } catch (error) {
       console.error('Failed to check enrollment status:', error);
     }
@@ -559,7 +555,7 @@ class CourseDetail extends HTMLElement {
                   </div>
                   <div class="flex-shrink-0">
                     <a 
-                      href="${file.file_url}" 
+                      href="${file.media_url || file.file_url}" 
                       target="_blank" 
                       class="inline-flex items-center px-3 py-2 text-sm font-medium text-blue-600 bg-blue-50 rounded-lg hover:bg-blue-100 transition-colors"
                     >
@@ -1171,17 +1167,7 @@ class CourseForm extends HTMLElement {
     try {
       for (let i = 0; i < this.selectedFiles.length; i++) {
         const file = this.selectedFiles[i];
-        const formData = new FormData();
-        formData.append('file', file);
-        formData.append('course_id', courseId);
-        formData.append('title', file.name);
-        formData.append('file_type', this.getFileType(file.name));
-        formData.append('file_order', i + 1);
-
-        await window.SchoolApp.apiCall('/files/upload', {
-          method: 'POST',
-          body: formData
-        });
+        await this.uploadFileInChunks(file, courseId, i + 1);
       }
       
       window.SchoolApp.showFlash('Files uploaded successfully!', 'success');
@@ -1191,6 +1177,50 @@ class CourseForm extends HTMLElement {
     }
   }
 
+  // Chunked, resumable upload: a failed chunk is retried from the offset the server has
+  async uploadFileInChunks(file, courseId, fileOrder, maxRetries = 3) {
+    const session = await window.SchoolApp.apiCall('/files/uploads', {
+      method: 'POST',
+      body: JSON.stringify({
+        course_id: courseId,
+        filename: file.name,
+        title: file.name,
+        file_type: this.getFileType(file.name),
+        file_order: fileOrder,
+        size: file.size
+      })
+    });
+
+    let offset = session.offset;
+    let retries = 0;
+    while (offset < file.size) {
+      const chunk = file.slice(offset, offset + session.chunk_size);
+      try {
+        const headers = {
+          'Content-Type': 'application/octet-stream',
+          'Upload-Offset': String(offset)
+        };
+        if (window.crypto && window.crypto.subtle) {
+          const digest = await window.crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+          headers['Upload-Checksum'] = 'sha256 ' + btoa(String.fromCharCode(...new Uint8Array(digest)));
+        }
+        const result = await window.SchoolApp.apiCall(`/files/uploads/${session.upload_id}`, {
+          method: 'PUT',
+          headers,
+          body: chunk
+        });
+        offset = result.offset;
+        retries = 0;
+      } catch (error) {
+        if (++retries > maxRetries) throw error;
+        const status = await window.SchoolApp.apiCall(`/files/uploads/${session.upload_id}`);
+        offset = status.offset;
+      }
+    }
+
+    return window.SchoolApp.apiCall(`/files/uploads/${session.upload_id}/complete`, { method: 'POST' });
+  }
+
   getFileType(fileName) {
     const extension = fileName.split('.').pop().toLowerCase();
     const typeMap = {
@@ -1200,7 +1230,7 @@ class CourseForm extends HTMLElement {
       ppt: 'document',
       pptx: 'document',
       txt: 'document',
-      zip: 'archive'
+      zip: 'document'
     };
     return typeMap[extension] || 'document';
   }
@@ -0,0 +1,80 @@
+"""
+In-process counter batching: hot counters are bumped in memory and written
+to the database in one statement per flush instead of once per event.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaBuffer:
+    """Accumulates per-key deltas and hands them to ``flush_fn`` periodically.
+
+    ``flush_fn(deltas)`` receives {key: delta} (zero deltas dropped). If it
+    raises, the deltas are merged back and retried on the next flush.
+    """
+
+    def __init__(self, flush_fn, interval=2.0):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self._deltas = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.failures = 0
+
+    def add(self, key, delta):
+        with self._lock:
+            self._deltas[key] += delta
+        self._ensure_started()
+
+    def pending(self, key=None):
+        """Unflushed delta for ``key``, or the number of keys waiting"""
+        with self._lock:
+            if key is None:
+                return len(self._deltas)
+            return self._deltas.get(key, 0)
+
+    def flush(self):
+        # One flush at a time so a retry can't race a newer batch
+        with self._flush_lock:
+            with self._lock:
+                deltas = {key: delta for key, delta in self._deltas.items() if delta}
+                self._deltas = defaultdict(int)
+            if not deltas:
+                return 0
+            try:
+                self.flush_fn(deltas)
+                self.flushes += 1
+            except Exception:
+                self.failures += 1
+                logger.exception("Counter flush failed; %d key(s) kept for retry", len(deltas))
+                with self._lock:
+                    for key, delta in deltas.items():
+                        self._deltas[key] += delta
+                return 0
+            return len(deltas)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='delta-buffer-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        """Stop the background thread and write out whatever is pending"""
+        self._stop.set()
+        self.flush()
@@ -0,0 +1,93 @@
+"""
+Serving uploaded course media.
+
+Stored uploads are named after their SHA-256, so a name always refers to
+the same bytes: responses can be cached as immutable and the digest
+doubles as a strong ETag. Range requests, If-None-Match / If-Range and
+zero-copy file transfer are handled by Werkzeug's send_file (the WSGI
+server's file_wrapper uses sendfile where available). In offload mode the
+file is handed to the front proxy instead:
+
+    MEDIA_OFFLOAD=nginx     X-Accel-Redirect: <MEDIA_ACCEL_PREFIX><name>
+    MEDIA_OFFLOAD=sendfile  X-Sendfile: <absolute path>  (Apache/lighttpd)
+
+Derived artifacts (thumbnails, previews, renditions) go through the same
+check at /api/files/<id>/media/<artifact>. Nothing under UPLOAD_URL_PREFIX
+is served directly.
+"""
+import mimetypes
+import os
+from flask import Response, abort, request, send_file
+from app.utils.uploads import UPLOAD_DIR, UPLOAD_URL_PREFIX
+
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', 'none')
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-uploads/')
+MEDIA_MAX_AGE = int(os.getenv('MEDIA_MAX_AGE', str(365 * 24 * 3600)))
+# Media is access-checked, so shared caches must not keep it unless told to
+MEDIA_CACHE_CONTROL = os.getenv('MEDIA_CACHE_CONTROL', f'private, max-age={MEDIA_MAX_AGE}, immutable')
+
+
+def stored_name(file_url):
+    """Name of the stored upload behind a course_files.file_url (None if external)"""
+    if not file_url or not file_url.startswith(UPLOAD_URL_PREFIX + '/'):
+        return None
+    name = file_url[len(UPLOAD_URL_PREFIX) + 1:]
+    if not name or '/' in name or name.startswith('.'):
+        return None
+    return name
+
+
+def media_url(file_id, file_url):
+    """Access-checked URL for a course file, or None for external links"""
+    return f"/api/files/{file_id}/media" if stored_name(file_url) else None
+
+
+def artifact_url(file_id, derived):
+    """Access-checked URL for a derived artifact stored as UPLOAD_URL_PREFIX/derived/<sha256>/<artifact>"""
+    if not derived:
+        return None
+    return f"/api/files/{file_id}/media/{derived.rpartition('/')[2]}"
+
+
+def artifact_path(name, artifact):
+    """Path of a blob's derived artifact relative to UPLOAD_DIR (None if invalid)"""
+    if not artifact or '/' in artifact or artifact.startswith('.'):
+        return None
+    return f"derived/{os.path.splitext(name)[0]}/{artifact}"
+
+
+def media_response(relpath, etag=None):
+    """Build the response for a file under UPLOAD_DIR (None if it is missing on disk).
+
+    Blobs are named after their digest, which is used as the ETag unless
+    ``etag`` is given.
+    """
+    path = os.path.abspath(os.path.join(UPLOAD_DIR, relpath))
+    if not os.path.isfile(path):
+        return None
+    etag = etag or os.path.splitext(relpath)[0]
+
+    if MEDIA_OFFLOAD in ('nginx', 'sendfile'):
+        response = Response(mimetype=mimetypes.guess_type(relpath)[0] or 'application/octet-stream')
+        if MEDIA_OFFLOAD == 'nginx':
+            response.headers['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + relpath
+        else:
+            response.headers['X-Sendfile'] = path
+        response.set_etag(etag)
+        # Answer If-None-Match here; the proxy handles Range itself
+        response.make_conditional(request)
+    else:
+        response = send_file(path, conditional=True, etag=etag, max_age=MEDIA_MAX_AGE)
+    response.headers['Cache-Control'] = MEDIA_CACHE_CONTROL
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def block_static_uploads():
+    """404 for UPLOAD_URL_PREFIX, in case UPLOAD_DIR was pointed into app/static"""
+    if request.path.startswith(UPLOAD_URL_PREFIX + '/'):
+        abort(404)
+
+
+def init_app(app):
+    app.before_request(block_static_uploads)
@@ -0,0 +1,309 @@
+"""
+Prometheus metrics without a client library.
+
+Counters, gauges and histograms are written to per-thread shards, so the
+request path never takes a lock: each thread only touches its own dict,
+and a scrape sums the shards. When a thread finishes, its shard is folded
+into a retired total, so servers that start a thread per connection don't
+pile up shards between scrapes. Gauges that mirror state owned elsewhere
+(pool size, stream count) are read from callbacks at scrape time instead.
+
+With several worker processes, set METRICS_DIR to a directory shared by
+them (and emptied when the server starts). Each process then writes its
+values to <pid>.<token>.json there every METRICS_FLUSH_INTERVAL seconds,
+and whichever process answers /metrics adds up every file: counters and
+histograms from all processes, including ones that have exited, gauges
+from live processes only.
+"""
+import atexit
+import glob
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+import uuid
+import weakref
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')                 # bearer token required by /metrics, if set
+METRICS_DIR = os.getenv('METRICS_DIR', '')                     # shared directory for multi-process workers
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _merge(totals, values):
+    for key, value in values.items():
+        if isinstance(value, list):
+            current = totals.get(key)
+            if current is None:
+                totals[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    current[i] += v
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+class Registry:
+    """Metric definitions, per-thread values and scrape-time callbacks"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._reset()
+
+    def _reset(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = {}      # shard key -> {(name, labels): value} of a live thread
+        self._keys = itertools.count()
+        self._retired = {}
+        self._token = f"{os.getpid()}.{uuid.uuid4().hex[:8]}"
+        self._writer = None
+        self._stop = threading.Event()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Duplicate metric {metric.name}')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def collector(self, fn):
+        """Register ``fn() -> [(name, labels, value)]``, called at scrape time"""
+        self.collectors.append(fn)
+        return fn
+
+    def values(self):
+        """This thread's shard (registered on first use)"""
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            key = next(self._keys)
+            # Single dict stores are atomic, so registering needs no lock
+            self._shards[key] = shard
+            # The thread's locals are dropped when it finishes, and the owner with them
+            owner = self._local.owner = _ShardOwner()
+            weakref.finalize(owner, self._retire, self._token, key, shard).atexit = False
+            self._ensure_writer()
+        return shard
+
+    def _retire(self, token, key, shard):
+        """Fold a finished thread's shard into the retired total"""
+        if token != self._token:
+            return  # a shard inherited from the parent process, already dropped by _reset
+        with self._lock:
+            if self._shards.pop(key, None) is not None:
+                _merge(self._retired, shard)
+
+    def snapshot(self):
+        """{(name, labels): value} for this process"""
+        totals = {}
+        with self._lock:
+            for shard in self._shards.copy().values():
+                _merge(totals, shard.copy())
+            _merge(totals, self._retired)
+        for fn in self.collectors:
+            try:
+                for name, labels, value in fn():
+                    totals[(name, tuple(labels))] = value
+            except Exception:
+                logger.exception("Metrics collector %s failed", getattr(fn, '__name__', fn))
+        return totals
+
+    # -- multi-process --------------------------------------------------------
+
+    def _path(self):
+        return os.path.join(METRICS_DIR, f"{self._token}.json")
+
+    def write(self):
+        """Publish this process's values to METRICS_DIR"""
+        samples = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        tmp = f"{self._path()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'pid': os.getpid(), 'samples': samples}, f)
+        os.replace(tmp, self._path())
+
+    def _ensure_writer(self):
+        if not METRICS_DIR or self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                self._writer = threading.Thread(target=self._write_loop, name='metrics-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while not self._stop.wait(METRICS_FLUSH_INTERVAL):
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Could not write metrics to %s", METRICS_DIR)
+
+    def gather(self):
+        """Values to expose: this process's, or every process's with METRICS_DIR"""
+        if not METRICS_DIR:
+            return self.snapshot()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        self.write()
+        totals = {}
+        for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(data['pid'])
+            for name, labels, value in data['samples']:
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                _merge(totals, {(name, tuple(labels)): value})
+        return totals
+
+    # -- exposition -----------------------------------------------------------
+
+    def exposition(self):
+        """Prometheus text format (version 0.0.4)"""
+        by_metric = {}
+        for (name, labels), value in self.gather().items():
+            by_metric.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for labels, value in sorted(by_metric.get(name, ()), key=lambda s: s[0]):
+                lines.extend(metric.samples(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+class _ShardOwner:
+    """Lives in a thread's locals; its finalizer retires the thread's shard"""
+    __slots__ = ('__weakref__',)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{v}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def samples(self, labels, value):
+        return [f"{self.name}{_label_text(self.labelnames, labels)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        shard = self.registry.values()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A gauge moved with inc()/dec(); the shards are summed, so a value
+    raised on one thread and lowered on another still adds up"""
+
+    type = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        shard = self.registry.values()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labels):
+        # [count per bucket..., count above the last bucket, sum]
+        shard = self.registry.values()
+        key = (self.name, labels)
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self, labels, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = _label_text(self.labelnames, labels, [('le', _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        plain = _label_text(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{plain} {_format_value(counts[-1])}")
+        lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class CallbackGauge(Metric):
+    """Declares a gauge whose values come from a Registry.collector"""
+    type = 'gauge'
+
+
+class CallbackCounter(Metric):
+    """Declares a counter whose values come from a Registry.collector"""
+    type = 'counter'
+
+
+REGISTRY = Registry()
+
+if hasattr(os, 'register_at_fork'):
+    # A forked worker starts from zero instead of re-reporting the parent's counts
+    os.register_at_fork(after_in_child=REGISTRY._reset)
+
+
+@atexit.register
+def _final_write():
+    if METRICS_DIR and REGISTRY._writer is not None:
+        try:
+            REGISTRY.write()
+        except Exception:
+            pass
@@ -0,0 +1,181 @@
+"""
+Bulk notification fan-out.
+
+A job sends one rendered title/message to every recipient of a target:
+a course's enrollments, every user with a role, or an explicit id list.
+Jobs run on a small in-process worker pool. Each batch is a single
+INSERT ... SELECT that also bumps the unread counters, announces the rows
+to live streams and is committed together with the job's progress and
+resume cursor. A job interrupted by a restart continues from its last
+batch (`flask run-notification-jobs`).
+"""
+import logging
+import os
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.database import pooled_connection
+from app.utils.metrics import Gauge
+from app.models.notification import NOTIFY_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_JOB_WORKERS = int(os.getenv('NOTIFY_JOB_WORKERS', '1'))  # 0 leaves jobs for the CLI
+NOTIFY_JOB_BATCH = int(os.getenv('NOTIFY_JOB_BATCH', '1000'))
+
+# target type -> recipients query, keyset-ordered by user id
+RECIPIENT_QUERIES = {
+    'course': """
+        SELECT e.student_id AS user_id FROM enrollments e
+        WHERE e.course_id = %(target)s AND e.student_id > %(after)s
+        ORDER BY e.student_id LIMIT %(limit)s
+    """,
+    'role': """
+        SELECT u.id AS user_id FROM users u
+        WHERE u.role = %(target)s AND u.id > %(after)s
+        ORDER BY u.id LIMIT %(limit)s
+    """,
+    'users': """
+        SELECT u.id AS user_id FROM users u
+        WHERE u.id = ANY(%(target)s::uuid[]) AND u.id > %(after)s
+        ORDER BY u.id LIMIT %(limit)s
+    """,
+}
+
+FIRST_ID = '00000000-0000-0000-0000-000000000000'
+
+_executor = None
+_executor_lock = threading.Lock()
+QUEUE_DEPTH = Gauge('notification_job_queue_depth', 'Bulk notification jobs queued or running in this process')
+
+
+class _KeepMissing(dict):
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def render_template(template, context):
+    """Fill {placeholders} from ``context`` once for every recipient.
+
+    Unknown placeholders are left as they are; format specs and attribute
+    access are not allowed.
+    """
+    out = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        out.append(literal)
+        if field is None:
+            continue
+        if spec or conversion or not field.isidentifier():
+            raise ValueError(f'Unsupported placeholder: {{{field}}}')
+        out.append(str(_KeepMissing(context)[field]))
+    return ''.join(out)
+
+
+def count_recipients(cur, target_type, target):
+    cur.execute(f"SELECT COUNT(*) FROM ({RECIPIENT_QUERIES[target_type]}) r",
+                {'target': target, 'after': FIRST_ID, 'limit': None})
+    return cur.fetchone()[0]
+
+
+def send_batch(cur, job):
+    """Insert one batch for ``job`` and return (rows sent, last recipient id)"""
+    cur.execute(f"""
+        WITH recipients AS (
+            {RECIPIENT_QUERIES[job['target_type']]}
+        ), inserted AS (
+            INSERT INTO notifications (user_id, title, message)
+            SELECT user_id, %(title)s, %(message)s FROM recipients
+            RETURNING id, user_id
+        ), counted AS (
+            INSERT INTO notification_counts (user_id, unread)
+            SELECT user_id, 1 FROM inserted
+            ON CONFLICT (user_id) DO UPDATE SET unread = notification_counts.unread + 1
+        ), announced AS (
+            SELECT pg_notify(%(channel)s, json_build_object('id', id, 'user_id', user_id)::text)
+            FROM inserted
+        )
+        SELECT (SELECT COUNT(*) FROM announced),
+               (SELECT user_id::text FROM recipients ORDER BY user_id DESC LIMIT 1)
+    """, {
+        'target': job['target'],
+        'after': job['last_user_id'] or FIRST_ID,
+        'limit': NOTIFY_JOB_BATCH,
+        'title': job['title'],
+        'message': job['message'],
+        'channel': NOTIFY_CHANNEL,
+    })
+    return cur.fetchone()
+
+
+JOB_COLUMNS = ['id', 'created_by', 'target_type', 'target', 'title', 'message', 'status',
+               'total', 'sent', 'last_user_id', 'error', 'created_at', 'started_at', 'finished_at']
+
+
+def run_job(job_id, resume=False):
+    """Claim a queued job (or, with resume, a stuck running one) and send it.
+
+    Returns the final status, or None if the job was not claimable.
+    """
+    claimable = ['queued', 'running'] if resume else ['queued']
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE notification_jobs SET status = 'running',
+                    started_at = COALESCE(started_at, CURRENT_TIMESTAMP)
+                WHERE id = %s AND status = ANY(%s)
+                RETURNING {', '.join(JOB_COLUMNS)}
+            """, (str(job_id), claimable))
+            row = cur.fetchone()
+        conn.commit()
+        if not row:
+            return None
+        job = dict(zip(JOB_COLUMNS, row))
+
+        try:
+            while True:
+                with conn.cursor() as cur:
+                    sent, last = send_batch(cur, job)
+                    if not sent:
+                        cur.execute("""
+                            UPDATE notification_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                            WHERE id = %s
+                        """, (str(job_id),))
+                        conn.commit()
+                        return 'done'
+                    job['last_user_id'] = last
+                    cur.execute("""
+                        UPDATE notification_jobs SET sent = sent + %s, last_user_id = %s WHERE id = %s
+                    """, (sent, last, str(job_id)))
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Notification job %s failed", job_id)
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE notification_jobs SET status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                """, (str(e)[:1000], str(job_id)))
+            conn.commit()
+            return 'failed'
+
+
+def _run_quietly(job_id):
+    try:
+        run_job(job_id)
+    except Exception:
+        logger.exception("Notification job worker crashed on %s", job_id)
+    finally:
+        QUEUE_DEPTH.dec()
+
+
+def enqueue_job(job_id):
+    """Start a committed job in the background (no-op with NOTIFY_JOB_WORKERS=0)"""
+    global _executor
+    if NOTIFY_JOB_WORKERS <= 0:
+        return
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=NOTIFY_JOB_WORKERS, thread_name_prefix='notify-job')
+    QUEUE_DEPTH.inc()
+    _executor.submit(_run_quietly, str(job_id))
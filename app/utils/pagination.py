@@ -0,0 +1,72 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'t': value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 't' in value:
+        return datetime.fromisoformat(value['t'])
+    return value
+
+
+def encode_cursor(sort, values):
+    """Pack the sort key of the last row into an opaque, URL-safe token"""
+    payload = json.dumps({'s': sort, 'v': [_encode_value(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort):
+    """Unpack a cursor, checking it was issued for the same sort order"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [_decode_value(v) for v in payload['v']]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Malformed cursor')
+    if payload.get('s') != sort:
+        raise InvalidCursor('Cursor does not match sort order')
+    return values
+
+
+def keyset_condition(columns, descending, values):
+    """SQL row comparison selecting rows strictly after ``values``.
+
+    ``columns`` are SQL expressions that all sort in the same direction,
+    so a single row comparison can use a matching composite index.
+    """
+    if len(columns) != len(values):
+        raise InvalidCursor('Cursor does not match sort order')
+    operator = '<' if descending else '>'
+    placeholders = ', '.join(['%s'] * len(values))
+    return f"({', '.join(columns)}) {operator} ({placeholders})", list(values)
+
+
+def estimate_count(cur, query, params):
+    """Row estimate from the planner's statistics instead of a full COUNT"""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_mode(args, default):
+    """Read the ?total= parameter: exact, estimate or none"""
+    mode = args.get('total', default, type=str)
+    return mode if mode in ('exact', 'estimate', 'none') else default
@@ -0,0 +1,203 @@
+"""
+Background processing for uploaded media.
+
+New blobs are handed to a small in-process worker pool once their upload
+commits, so the upload request never waits for it. A worker claims the
+media_blobs row (pending -> processing), extracts metadata and writes
+derived artifacts under UPLOAD_DIR/derived/<sha256>/:
+
+    video     duration / resolution (ffprobe), thumbnail frame (ffmpeg),
+              optional 720p H.264 rendition (MEDIA_TRANSCODE=1)
+    pdf       page count (pdfinfo, or a scan of the file), first-page
+              preview (pdftoppm)
+
+Missing tools just leave the matching artifact out. Rows still pending
+after a restart (or failed ones) are picked up by `flask process-media`.
+"""
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.database import pooled_connection
+from app.utils.metrics import Gauge
+from app.utils.response_cache import invalidate
+from app.utils.uploads import UPLOAD_DIR, blob_path, blob_url
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', '2'))  # 0 disables in-process processing
+MEDIA_TRANSCODE = os.getenv('MEDIA_TRANSCODE', '0') == '1'
+MEDIA_TOOL_TIMEOUT = int(os.getenv('MEDIA_TOOL_TIMEOUT', '600'))
+THUMBNAIL_WIDTH = 480
+
+DERIVED_DIR = os.path.join(UPLOAD_DIR, 'derived')
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?!s)')
+PDF_SCAN_MAX_BYTES = 64 * 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+QUEUE_DEPTH = Gauge('media_processing_queue_depth', 'Media blobs queued or being processed in this process')
+
+
+def derived_dir(name):
+    return os.path.join(DERIVED_DIR, os.path.splitext(name)[0])
+
+
+def derived_url(name, filename):
+    return blob_url(f"derived/{os.path.splitext(name)[0]}/{filename}")
+
+
+def remove_derived(name):
+    """Delete a blob's derived artifacts (after the blob itself is gone)"""
+    shutil.rmtree(derived_dir(name), ignore_errors=True)
+
+
+def media_kind(name):
+    mimetype = mimetypes.guess_type(name)[0] or ''
+    if mimetype.startswith('video/'):
+        return 'video'
+    if mimetype == 'application/pdf':
+        return 'pdf'
+    return None
+
+
+def _run(*args):
+    """Run an external tool, returning stdout (None if it isn't installed)"""
+    if not shutil.which(args[0]):
+        return None
+    result = subprocess.run(args, capture_output=True, timeout=MEDIA_TOOL_TIMEOUT, check=True)
+    return result.stdout
+
+
+def probe_video(path):
+    out = _run('ffprobe', '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'format=duration:stream=width,height,codec_name', '-of', 'json', path)
+    if out is None:
+        return {}
+    probe = json.loads(out)
+    stream = (probe.get('streams') or [{}])[0]
+    info = {
+        'width': stream.get('width'),
+        'height': stream.get('height'),
+        'codec': stream.get('codec_name'),
+    }
+    if probe.get('format', {}).get('duration'):
+        info['duration'] = round(float(probe['format']['duration']), 3)
+    return {key: value for key, value in info.items() if value is not None}
+
+
+def count_pdf_pages(path):
+    out = _run('pdfinfo', path)
+    if out is not None:
+        match = re.search(rb'^Pages:\s+(\d+)', out, re.MULTILINE)
+        if match:
+            return int(match.group(1))
+    # No poppler: count page objects (good enough for uncompressed xrefs)
+    if os.path.getsize(path) > PDF_SCAN_MAX_BYTES:
+        return None
+    with open(path, 'rb') as f:
+        return len(PDF_PAGE_RE.findall(f.read())) or None
+
+
+def process_file(name, path, out_dir):
+    """Extract metadata and derived artifacts for one stored file.
+
+    Returns (media_info, {column: url}).
+    """
+    info = {'size': os.path.getsize(path), 'kind': media_kind(name)}
+    artifacts = {}
+    os.makedirs(out_dir, exist_ok=True)
+
+    if info['kind'] == 'video':
+        info.update(probe_video(path))
+        thumbnail = os.path.join(out_dir, 'thumbnail.jpg')
+        seek = '1' if info.get('duration', 2) > 1 else '0'
+        if _run('ffmpeg', '-y', '-v', 'error', '-ss', seek, '-i', path, '-frames:v', '1',
+                '-vf', f'scale={THUMBNAIL_WIDTH}:-2', thumbnail) is not None:
+            artifacts['thumbnail_url'] = derived_url(name, 'thumbnail.jpg')
+        if MEDIA_TRANSCODE:
+            rendition = os.path.join(out_dir, '720p.mp4')
+            if _run('ffmpeg', '-y', '-v', 'error', '-i', path, '-vf', 'scale=-2:min(720\\,ih)',
+                    '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+                    '-c:a', 'aac', '-movflags', '+faststart', rendition) is not None:
+                artifacts['transcoded_url'] = derived_url(name, '720p.mp4')
+
+    elif info['kind'] == 'pdf':
+        pages = count_pdf_pages(path)
+        if pages:
+            info['pages'] = pages
+        prefix = os.path.join(out_dir, 'preview')
+        if _run('pdftoppm', '-png', '-f', '1', '-l', '1', '-scale-to', str(THUMBNAIL_WIDTH * 2),
+                '-singlefile', path, prefix) is not None:
+            artifacts['preview_url'] = derived_url(name, 'preview.png')
+
+    return info, artifacts
+
+
+def process_blob(name, retry_failed=False):
+    """Claim and process one blob. Returns the final status (None if not claimed)"""
+    claimable = ('pending', 'failed') if retry_failed else ('pending',)
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE media_blobs SET processing_status = 'processing'
+                WHERE name = %s AND processing_status = ANY(%s)
+                RETURNING name
+            """, (name, list(claimable)))
+            claimed = cur.fetchone()
+        conn.commit()
+    if not claimed:
+        return None
+
+    status, info, artifacts, error = 'ready', None, {}, None
+    try:
+        path = blob_path(name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        info, artifacts = process_file(name, path, derived_dir(name))
+        if not info['kind']:
+            status = 'skipped'
+    except Exception as e:
+        logger.exception("Processing media blob %s failed", name)
+        status, error = 'failed', str(e)[:1000]
+
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE media_blobs SET processing_status = %s, media_info = %s, thumbnail_url = %s,
+                    preview_url = %s, transcoded_url = %s, processing_error = %s,
+                    processed_at = CURRENT_TIMESTAMP
+                WHERE name = %s
+            """, (status, json.dumps(info) if info else None, artifacts.get('thumbnail_url'),
+                  artifacts.get('preview_url'), artifacts.get('transcoded_url'), error, name))
+        conn.commit()
+    # File listings show processing results
+    invalidate('media')
+    return status
+
+
+def _process_quietly(name):
+    try:
+        process_blob(name)
+    except Exception:
+        logger.exception("Media worker crashed on %s", name)
+    finally:
+        QUEUE_DEPTH.dec()
+
+
+def enqueue_processing(name):
+    """Queue a newly stored blob for processing (no-op with MEDIA_WORKERS=0)"""
+    global _executor
+    if MEDIA_WORKERS <= 0:
+        return
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix='media')
+    QUEUE_DEPTH.inc()
+    _executor.submit(_process_quietly, name)
@@ -0,0 +1,340 @@
+"""
+Opt-in sampling profiler for live requests.
+
+A sampled request registers its thread with a shared sampler thread, which
+records the thread's Python stack every PROFILE_INTERVAL_MS. Between
+requests the sampler sleeps, and requests that aren't sampled pay for one
+dict lookup. Each profile is written to PROFILE_DIR as JSON. The directory
+is a ring buffer: once it holds PROFILE_KEEP profiles, the oldest are
+deleted.
+
+Which requests are sampled is set by PROFILE_ENDPOINTS (rates per
+endpoint, e.g. "courses.get_courses=0.05,get_comments") and
+PROFILE_SAMPLE_RATE (every other endpoint). Admins can change both at run
+time through /api/profiles/config. The change is saved to PROFILE_DIR, and
+every worker process picks it up within PROFILE_CONFIG_CHECK seconds.
+
+Profiles download as collapsed stacks (flamegraph.pl, speedscope) or as a
+pstats file (snakeviz, python -m pstats). Both are built from the samples,
+so pstats "calls" count samples rather than calls.
+"""
+import json
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'app/profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))                  # profiles kept on disk
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+PROFILE_CONFIG_CHECK = float(os.getenv('PROFILE_CONFIG_CHECK', '2'))  # seconds between config file checks
+PROFILE_MAX_DEPTH = 128
+CONFIG_FILE = 'config.json'
+
+
+def parse_endpoints(value):
+    """"courses.get_courses=0.1,get_comments" -> {name: rate}"""
+    rates = {}
+    for item in value.split(','):
+        name, _, rate = item.strip().partition('=')
+        if name:
+            rates[name] = float(rate) if rate else 1.0
+    return rates
+
+
+class ProfileConfig:
+    """Sampling rates, from the environment or the admin-edited config file"""
+
+    def __init__(self):
+        self.endpoints = parse_endpoints(os.getenv('PROFILE_ENDPOINTS', ''))
+        self.sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+        self._mtime = None
+        self._checked = 0.0
+
+    @property
+    def active(self):
+        return self.sample_rate > 0 or bool(self.endpoints)
+
+    def as_dict(self):
+        return {'endpoints': self.endpoints, 'sample_rate': self.sample_rate}
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked < PROFILE_CONFIG_CHECK:
+            return
+        self._checked = now
+        path = os.path.join(PROFILE_DIR, CONFIG_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.endpoints = {str(k): float(v) for k, v in data.get('endpoints', {}).items()}
+            self.sample_rate = float(data.get('sample_rate', 0))
+            self._mtime = mtime
+        except (OSError, ValueError, AttributeError):
+            logger.exception("Ignoring unreadable profiler config %s", path)
+
+    def save(self, endpoints, sample_rate):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, CONFIG_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'endpoints': endpoints, 'sample_rate': sample_rate}, f)
+        os.replace(tmp, path)
+        self.endpoints, self.sample_rate = endpoints, sample_rate
+        self._mtime = os.stat(path).st_mtime
+
+    def rate_for(self, endpoint):
+        if endpoint is None:
+            return 0.0
+        rate = self.endpoints.get(endpoint)
+        if rate is None:
+            rate = self.endpoints.get(endpoint.rpartition('.')[2], self.sample_rate)
+        return rate
+
+
+class Sampler:
+    """One background thread sampling the stacks of registered threads"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}   # thread ident -> {stack of code objects: samples}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, ident):
+        with self._lock:
+            self._targets[ident] = {}
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def stop(self, ident):
+        with self._lock:
+            return self._targets.pop(ident, None)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                if not self._targets:
+                    self._wake.clear()
+                    continue
+                for ident, samples in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stack = walk(frame)
+                        samples[stack] = samples.get(stack, 0) + 1
+            del frames
+
+
+def walk(frame):
+    """Code objects from the outermost frame to ``frame``"""
+    codes = []
+    while frame is not None and len(codes) < PROFILE_MAX_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    codes.reverse()
+    return tuple(codes)
+
+
+config = ProfileConfig()
+sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+# -- storage ------------------------------------------------------------------
+
+def profile_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.json")
+
+
+def valid_profile_id(profile_id):
+    name = profile_id.replace('-', '')
+    return bool(name) and name.isalnum()
+
+
+def save_profile(meta, samples):
+    """Write a profile and trim the directory to PROFILE_KEEP profiles"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    frames, index = [], {}
+    stacks = []
+    for stack, count in samples.items():
+        ids = []
+        for code in stack:
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if key not in index:
+                index[key] = len(frames)
+                frames.append(list(key))
+            ids.append(index[key])
+        stacks.append([ids, count])
+    profile = dict(meta, interval_ms=PROFILE_INTERVAL_MS, samples=sum(samples.values()),
+                   frames=frames, stacks=stacks)
+    tmp = profile_path(meta['id']) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(profile, f)
+    os.replace(tmp, profile_path(meta['id']))
+    trim()
+
+
+def profile_names():
+    """Stored profile file names, oldest first (ids start with a timestamp)"""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(n for n in names if n.endswith('.json') and n != CONFIG_FILE)
+
+
+def trim():
+    names = profile_names()
+    for name in names[:max(len(names) - PROFILE_KEEP, 0)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass  # another worker got there first
+
+
+def load_profile(profile_id):
+    """The stored profile, or None"""
+    if not valid_profile_id(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def list_profiles():
+    """Metadata of stored profiles, newest first"""
+    profiles = []
+    for name in reversed(profile_names()):
+        profile = load_profile(name[:-len('.json')])
+        if profile is not None:
+            for key in ('frames', 'stacks'):
+                profile.pop(key, None)
+            profiles.append(profile)
+    return profiles
+
+
+# -- export formats -----------------------------------------------------------
+
+def frame_label(frame):
+    filename, line, name = frame
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        filename = filename[len(cwd):]
+    return f"{name} ({filename}:{line})"
+
+
+def to_collapsed(profile):
+    """Brendan Gregg's collapsed stack format: "outer;inner count" per line"""
+    labels = [frame_label(frame) for frame in profile['frames']]
+    lines = [';'.join(labels[i] for i in ids) + f" {count}" for ids, count in profile['stacks']]
+    return '\n'.join(sorted(lines)) + '\n'
+
+
+def to_pstats(profile):
+    """marshal'd stats dict that pstats.Stats can load; times are
+    samples x interval, call counts are sample counts"""
+    interval = profile['interval_ms'] / 1000
+    frames = [(f[0], f[1], f[2]) for f in profile['frames']]
+    stats = {}   # func -> [cc, nc, tt, ct, {caller: [nc, cc, tt, ct]}]
+    for ids, count in profile['stacks']:
+        elapsed = count * interval
+        seen = set()
+        for depth, i in enumerate(ids):
+            func = frames[i]
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            leaf = depth == len(ids) - 1
+            first = func not in seen
+            seen.add(func)
+            entry[1] += count
+            if first:
+                entry[0] += count
+                entry[3] += elapsed
+            if leaf:
+                entry[2] += elapsed
+            if depth:
+                edge = entry[4].setdefault(frames[ids[depth - 1]], [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += elapsed
+                if leaf:
+                    edge[2] += elapsed
+    return marshal.dumps({
+        func: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+        for func, (cc, nc, tt, ct, callers) in stats.items()
+    })
+
+
+# -- request hooks ------------------------------------------------------------
+
+def start_profile():
+    config.refresh()
+    if not config.active:
+        return
+    rate = config.rate_for(request.endpoint)
+    if rate > 0 and random.random() < rate:
+        g.profile_started = (time.perf_counter(), datetime.now(timezone.utc))
+        sampler.start(threading.get_ident())
+
+
+def finish_profile(response):
+    started = g.pop('profile_started', None)
+    if started is None:
+        return response
+    samples = sampler.stop(threading.get_ident())
+    if not samples:
+        return response   # finished between two samples
+    began, started_at = started
+    profile_id = f"{started_at:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    meta = {
+        'id': profile_id,
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'started_at': started_at.isoformat(),
+        'duration_ms': round((time.perf_counter() - began) * 1000, 2),
+        'pid': os.getpid(),
+    }
+    response.headers['X-Profile-Id'] = profile_id
+
+    def write():
+        try:
+            save_profile(meta, samples)
+        except OSError:
+            logger.exception("Could not save profile %s", profile_id)
+
+    # Written after the response has gone out
+    response.call_on_close(write)
+    return response
+
+
+def abandon_profile(exception=None):
+    if g.pop('profile_started', None) is not None:
+        sampler.stop(threading.get_ident())
+
+
+def init_app(app):
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(abandon_profile)
@@ -0,0 +1,192 @@
+"""
+Real-time notification fan-out.
+
+create_notification sends `NOTIFY notifications, '{"id": ..., "user_id": ...}'`
+in the inserting transaction, so the event goes out on commit. Each process
+runs one NotificationHub: a single LISTEN connection read by a background
+thread. The thread loads the new rows with one query per batch, and only
+for users that have a stream open here, then hands them to every
+subscribed stream's queue.
+
+If the LISTEN connection drops, events may have been missed, so every
+subscriber gets RESYNC. Its stream then ends, and the client reconnects
+with Last-Event-ID and replays what it missed from the table.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import threading
+from collections import defaultdict
+import psycopg2
+from psycopg2 import extensions
+from app.database import pooled_connection
+from app.database.index import get_dsn_kwargs
+from app.models.notification import NOTIFY_CHANNEL
+from app.utils.serialization import encode_default
+
+logger = logging.getLogger(__name__)
+
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', '100'))          # buffered events per stream
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))            # seconds between keep-alive comments
+SSE_MAX_DURATION = float(os.getenv('SSE_MAX_DURATION', '300'))     # streams end (and clients reconnect) after this
+SSE_REPLAY_LIMIT = int(os.getenv('SSE_REPLAY_LIMIT', '100'))       # events replayed from Last-Event-ID
+SSE_RETRY_MS = 3000
+
+# Put on a subscriber queue when it can no longer be trusted to be complete
+RESYNC = object()
+
+
+class NotificationHub:
+    """One LISTEN connection per process, fanned out to many subscribers"""
+
+    def __init__(self, channel=NOTIFY_CHANNEL, poll_interval=5.0):
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._subscribers = defaultdict(set)  # user_id -> {queue.Queue}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.delivered = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+    def subscribe(self, user_id):
+        """Register a stream for ``user_id`` and return its queue"""
+        q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[str(user_id)].add(q)
+        self._ensure_started()
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            queues = self._subscribers.get(str(user_id))
+            if queues:
+                queues.discard(q)
+                if not queues:
+                    del self._subscribers[str(user_id)]
+
+    def stats(self):
+        with self._lock:
+            streams = sum(len(queues) for queues in self._subscribers.values())
+            users = len(self._subscribers)
+        return {
+            'listening': bool(self._thread and self._thread.is_alive()),
+            'streams': streams,
+            'users': users,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'reconnects': self.reconnects,
+        }
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name='notification-hub', daemon=True)
+                    self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**get_dsn_kwargs())
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                backoff = 1.0
+                self._listen(conn)
+            except Exception:
+                logger.exception("Notification listener failed; reconnecting in %.0fs", backoff)
+                self.reconnects += 1
+                self._broadcast_resync()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                continue
+            conn.poll()
+            events = []
+            while conn.notifies:
+                note = conn.notifies.pop(0)
+                try:
+                    events.append(json.loads(note.payload))
+                except ValueError:
+                    logger.warning("Ignoring malformed notification payload: %r", note.payload)
+            if events:
+                self._dispatch(events)
+
+    def _dispatch(self, events):
+        with self._lock:
+            wanted = [e['id'] for e in events if str(e.get('user_id')) in self._subscribers]
+        if not wanted:
+            return
+        # One query per batch, however many streams are open
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, user_id, title, message, is_read, created_at
+                    FROM notifications WHERE id = ANY(%s::uuid[])
+                    ORDER BY created_at, id
+                """, (wanted,))
+                rows = cur.fetchall()
+            conn.commit()
+        for row in rows:
+            with self._lock:
+                queues = list(self._subscribers.get(str(row[1]), ()))
+            for q in queues:
+                self._offer(q, row)
+
+    def _offer(self, q, item):
+        try:
+            q.put_nowait(item)
+            self.delivered += 1
+        except queue.Full:
+            # A stalled client: make it reconnect and replay instead of
+            # buffering without bound
+            self.dropped += 1
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+            q.put_nowait(RESYNC)
+
+    def _broadcast_resync(self):
+        with self._lock:
+            queues = [q for qs in self._subscribers.values() for q in qs]
+        for q in queues:
+            self._offer(q, RESYNC)
+
+
+hub = NotificationHub()
+
+
+def sse_event(data, event_id=None, event=None):
+    """Format one Server-Sent Events frame"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in json.dumps(data, default=encode_default).splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+def wait_for(q, timeout):
+    """Next item from a subscriber queue, or None after ``timeout`` seconds"""
+    try:
+        return q.get(timeout=timeout)
+    except queue.Empty:
+        return None
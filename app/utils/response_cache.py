@@ -0,0 +1,282 @@
+"""
+Cached JSON responses with ETag / If-None-Match revalidation.
+
+Read endpoints wrapped in @cached_response get a content ETag on every
+200 response and answer a matching If-None-Match with 304. With
+RESPONSE_CACHE_TTL > 0 the body is also cached, keyed by:
+
+    endpoint | audience | tag generations | query string + view args
+
+The audience is whatever makes the response differ between users (a
+student's own enrollment flags, a teacher's drafts), supplied per endpoint.
+Invalidation is by tag: writes call invalidate('course:<id>', ...), which
+bumps each tag's generation so every key built from the old one is never
+looked up again and simply ages out.
+
+Backends: an in-process LRU (default), or any server speaking the Redis
+protocol (RESPONSE_CACHE_URL=redis://host:port/db) so generations, and
+therefore invalidations, are shared by all worker processes.
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+from functools import wraps
+from urllib.parse import urlparse
+from flask import g, make_response, request
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '0'))      # 0 disables caching (ETags still sent)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '2048'))   # entries kept by the LRU backend
+RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL', '')              # redis://host:port/db, empty for LRU
+RESPONSE_CACHE_PREFIX = os.getenv('RESPONSE_CACHE_PREFIX', 'rc:')
+
+
+class LRUBackend:
+    """Entries in a per-process TTL/LRU cache, generations in a dict"""
+
+    name = 'lru'
+
+    def __init__(self, ttl, maxsize):
+        self.entries = TTLCache(ttl=ttl, maxsize=maxsize)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generations(self, tags):
+        with self._lock:
+            return [self._generations.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def stats(self):
+        stats = self.entries.stats()
+        with self._lock:
+            stats['tags'] = len(self._generations)
+        return stats
+
+
+class RespError(Exception):
+    pass
+
+
+class RespConnection:
+    """Minimal client for the Redis serialization protocol (RESP2)"""
+
+    def __init__(self, host, port, db=0, password=None, timeout=0.5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.command('AUTH', password)
+        if db:
+            self.command('SELECT', db)
+
+    def command(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        self.sock.sendall(b''.join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RespError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise RespError(f'Unexpected reply: {line!r}')
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """Entries and generations on a Redis-protocol server, shared by all
+    processes. Errors are logged and treated as misses so the cache can
+    never take a request down with it.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, ttl, prefix=RESPONSE_CACHE_PREFIX):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or 'localhost', parsed.port or 6379)
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self.ttl = ttl
+        self.prefix = prefix
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _command(self, *args):
+        conn = getattr(self._local, 'conn', None)
+        try:
+            if conn is None:
+                conn = self._local.conn = RespConnection(*self.address, db=self.db, password=self.password)
+            return conn.command(*args)
+        except (OSError, RespError):
+            self.errors += 1
+            if conn is not None:
+                conn.close()
+            self._local.conn = None
+            raise
+
+    def generations(self, tags):
+        try:
+            values = self._command('MGET', *(f"{self.prefix}gen:{tag}" for tag in tags))
+        except (OSError, RespError):
+            logger.warning("Response cache unavailable; serving uncached", exc_info=True)
+            return None
+        return [int(value) if value else 0 for value in values]
+
+    def bump(self, tags):
+        for tag in tags:
+            try:
+                self._command('INCR', f"{self.prefix}gen:{tag}")
+            except (OSError, RespError):
+                # Entries built on the old generation expire after the TTL
+                logger.error("Could not invalidate response cache tag %s", tag, exc_info=True)
+
+    def get(self, key):
+        try:
+            value = self._command('GET', self.prefix + key)
+        except (OSError, RespError):
+            return None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        etag, _, body = value.partition(b'\n')
+        return etag.decode(), body
+
+    def set(self, key, value):
+        etag, body = value
+        try:
+            self._command('SET', self.prefix + key, etag.encode() + b'\n' + body, 'EX', max(int(self.ttl), 1))
+        except (OSError, RespError):
+            pass
+
+    def stats(self):
+        return {
+            'enabled': True,
+            'ttl': self.ttl,
+            'server': f"{self.address[0]}:{self.address[1]}/{self.db}",
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+def make_backend():
+    if RESPONSE_CACHE_TTL <= 0:
+        return None
+    if RESPONSE_CACHE_URL:
+        return RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL)
+    return LRUBackend(RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE)
+
+
+backend = make_backend()
+
+
+def cache_enabled():
+    return backend is not None
+
+
+def invalidate(*tags):
+    """Expire every cached response built on any of ``tags`` (call after commit)"""
+    if backend is not None and tags:
+        backend.bump(sorted({str(tag) for tag in tags}))
+
+
+def cache_stats():
+    if backend is None:
+        return {'enabled': False}
+    return dict(backend.stats(), backend=backend.name)
+
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def revalidated(response, etag):
+    """Attach validators and turn the response into a 304 when the client
+    already has this version"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.update(('Authorization', 'Cookie'))
+    return response.make_conditional(request)
+
+
+def request_key(name, audience, generations, view_args):
+    args = sorted(request.args.items(multi=True)) + sorted((k, str(v)) for k, v in view_args.items())
+    digest = hashlib.blake2b(repr(args).encode(), digest_size=16).hexdigest()
+    return f"{name}|{audience}|{'.'.join(map(str, generations))}|{digest}"
+
+
+def cached_response(name, tags, audience=lambda user: 'all'):
+    """Cache a JSON read endpoint and serve it with ETag revalidation.
+
+    ``tags(args, view_args)`` names what the response is built from;
+    ``audience(user)`` distinguishes users who would see different output.
+    Apply inside the auth decorator so g.current_user is set.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = None
+            if backend is not None:
+                entry_tags = [str(tag) for tag in tags(request.args, kwargs)]
+                generations = backend.generations(entry_tags)
+                if generations is not None:
+                    key = request_key(name, audience(g.current_user), generations, kwargs)
+                    cached = backend.get(key)
+                    if cached is not None:
+                        etag, body = cached
+                        response = make_response(body)
+                        response.mimetype = 'application/json'
+                        response.headers['X-Cache'] = 'hit'
+                        return revalidated(response, etag)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or not response.is_json:
+                return response
+            body = response.get_data()
+            etag = make_etag(body)
+            if key is not None:
+                backend.set(key, (etag, body))
+                response.headers['X-Cache'] = 'miss'
+            return revalidated(response, etag)
+        return wrapper
+    return decorator
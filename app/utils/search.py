@@ -0,0 +1,36 @@
+"""
+Course and user search: full-text (tsvector + GIN) with a pg_trgm fallback
+for fuzzy / misspelled terms. Requires seed/migrations/003.
+"""
+from collections import namedtuple
+
+# Must match the text search configuration of courses.search_vector
+TS_CONFIG = 'english'
+
+# condition/rank are SQL fragments; their params go in the same order
+SearchClause = namedtuple('SearchClause', ['condition', 'params', 'rank', 'rank_params'])
+
+def course_search(term):
+    """Full-text match on title/description, or a fuzzy match on the title.
+
+    `<%` is pg_trgm's word-similarity operator (GIN-indexable); it catches
+    typos and partial words that the stemmed tsquery misses.
+    """
+    term = term.strip()
+    return SearchClause(
+        condition=f"(c.search_vector @@ websearch_to_tsquery('{TS_CONFIG}', %s) OR %s <%% c.title)",
+        params=[term, term],
+        rank=f"(ts_rank_cd(c.search_vector, websearch_to_tsquery('{TS_CONFIG}', %s)) + word_similarity(%s, c.title))",
+        rank_params=[term, term],
+    )
+
+def user_search(term):
+    """Substring match on name/email (trigram-indexed) plus fuzzy name match"""
+    term = term.strip()
+    pattern = f"%{term}%"
+    return SearchClause(
+        condition="(name ILIKE %s OR email ILIKE %s OR %s <%% name)",
+        params=[pattern, pattern, term],
+        rank="GREATEST(word_similarity(%s, name), word_similarity(%s, email))",
+        rank_params=[term, term],
+    )
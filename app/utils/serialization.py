@@ -0,0 +1,144 @@
+"""
+JSON encoding and row shaping shared by the API blueprints.
+
+Routes shape query rows with rows_to_dicts(COLUMNS, rows) and hand the raw
+values (UUIDs, datetimes, Decimals) to jsonify. The app's JSON provider
+converts them while encoding instead of each route calling str() and
+.isoformat() value by value in Python:
+
+    UUID                   "3f2b..."           (str)
+    datetime / date / time "2024-01-31T12:00:00"  (ISO 8601)
+    Decimal                "12.50"             (str, lossless)
+
+JSON_PROVIDER picks the encoder: 'fast' (default) encodes with orjson;
+'flask' keeps Flask's default provider (which formats datetimes as HTTP
+dates).
+
+Endpoints listed in DB_JSON_ENDPOINTS skip Python shaping altogether:
+json_rows_sql() has Postgres aggregate the rows into one JSON array text,
+which raw_json_response() splices into the response body unchanged.
+"""
+import dataclasses
+import datetime
+import decimal
+import json
+import os
+import uuid
+import orjson
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'fast')
+# e.g. "courses,comments,my_courses", or "all"
+DB_JSON_ENDPOINTS = {name.strip() for name in os.getenv('DB_JSON_ENDPOINTS', '').split(',') if name.strip()}
+
+
+def rows_to_dicts(columns, rows):
+    """Zip every row with ``columns`` (values are left for the encoder)"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def row_to_dict(columns, row):
+    return dict(zip(columns, row))
+
+
+def db_json(endpoint):
+    """Whether ``endpoint`` should have Postgres build its JSON"""
+    return endpoint in DB_JSON_ENDPOINTS or 'all' in DB_JSON_ENDPOINTS
+
+
+class RawJSON(str):
+    """Already-encoded JSON text, embedded in a response as is"""
+
+
+def row_number_sql(order_by):
+    """First select column of a query passed to json_rows_sql()"""
+    return f"row_number() OVER ({order_by}) AS _n"
+
+
+def json_rows_sql(query, columns, page_size=None, keys=()):
+    """Wrap a row query so Postgres returns its rows as one JSON array.
+
+    ``query`` must select row_number_sql(<its ORDER BY>) first, then
+    ``columns``. Postgres doesn't promise to keep a subquery's order, so
+    the rows are numbered inside the query and everything here orders and
+    filters by that number.
+
+    The wrapped query selects (json array text, row count, *keys): the
+    objects use ``columns`` as keys, in the query's order. With
+    ``page_size`` only the first page_size rows go into the array (the
+    query may fetch one more to detect a next page). row_number() counts
+    rows before OFFSET, so don't pass it for offset queries. ``keys`` names
+    the columns of the last row on the page, returned as typed values for
+    building a cursor.
+    """
+    aliases = ', '.join(f'"{column}"' for column in columns)
+    fields = ', '.join(f"'{column}', page.\"{column}\"" for column in columns)
+    page_filter = f" FILTER (WHERE page._n <= {int(page_size)})" if page_size else ""
+    last_keys = ''.join(
+        f', (SELECT last."{key}" FROM page last WHERE last._n = {int(page_size)})' for key in keys)
+    return f"""
+        WITH page AS (
+            SELECT * FROM ({query}) AS r(_n, {aliases})
+        )
+        SELECT COALESCE(json_agg(json_build_object({fields}) ORDER BY page._n){page_filter}, '[]')::text,
+               COUNT(*){last_keys}
+        FROM page
+    """
+
+
+def raw_json_response(document):
+    """JSON response for ``document`` (a dict or RawJSON) that copies
+    RawJSON values into the body without decoding them"""
+    if isinstance(document, RawJSON):
+        body = document
+    else:
+        body = '{' + ','.join(
+            f"{json.dumps(key)}:{value if isinstance(value, RawJSON) else current_app.json.dumps(value)}"
+            for key, value in document.items()) + '}'
+    return current_app.response_class(body.encode(), mimetype='application/json')
+
+
+def encode_default(o):
+    """Types the encoders don't handle on their own"""
+    if isinstance(o, (datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Encodes with orjson (keys unsorted, compact output)"""
+
+    sort_keys = False
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', encode_default)
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Install the JSON provider selected by JSON_PROVIDER"""
+    if JSON_PROVIDER == 'fast':
+        app.json = FastJSONProvider(app)
@@ -0,0 +1,269 @@
+"""
+Chunked, resumable upload storage.
+
+Chunks are streamed straight from the request body into a part file
+(UPLOAD_TMP_DIR/<upload_id>.part) and hashed as they are written. Once all
+bytes are in, the part file is moved into UPLOAD_DIR with an atomic rename.
+Both directories sit outside app/static: finished uploads are only served
+through the access-checked /api/files/<id>/media endpoint.
+
+Stored files are content-addressed: a file is named after its SHA-256
+(``<sha256><ext>``), so the same video uploaded to several courses is kept
+and served once. The media_blobs table counts the course_files rows that
+point at each blob.
+"""
+import base64
+import fcntl
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from app.utils.metrics import Counter
+
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'app/uploads')
+# course_files.file_url of stored uploads is UPLOAD_URL_PREFIX/<name>. It is
+# a storage key, not a public URL: requests for it are answered with a 404.
+UPLOAD_URL_PREFIX = '/static/uploads'
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR', 'app/uploads_tmp')
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_MAX = int(os.getenv('UPLOAD_CHUNK_MAX', str(16 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(5 * 1024 * 1024 * 1024)))
+# Cap for the single-request multipart endpoint (POST /api/files/upload)
+UPLOAD_FORM_MAX_BYTES = int(os.getenv('UPLOAD_FORM_MAX_BYTES', str(100 * 1024 * 1024)))
+UPLOAD_FILE_TYPES = ('video', 'pdf', 'document')
+
+BLOCK_SIZE = 64 * 1024
+
+UPLOAD_BYTES = Counter('upload_bytes_total', 'Bytes received by the upload endpoints', ('kind',))
+
+
+class UploadError(Exception):
+    """A chunk was rejected; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload_id):
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}.part")
+
+
+# upload_id -> (offset, running sha256). Lets each chunk extend the
+# whole-file hash instead of re-reading the file; a worker that did not see
+# the earlier chunks rebuilds it from the part file once.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+MAX_TRACKED_HASHERS = 256
+
+
+def _take_hasher(upload_id, offset):
+    with _hashers_lock:
+        entry = _hashers.pop(upload_id, None)
+    if entry and entry[0] == offset:
+        return entry[1]
+    hasher = hashlib.sha256()
+    with open(part_path(upload_id), 'rb') as f:
+        remaining = offset
+        while remaining:
+            block = f.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _keep_hasher(upload_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[upload_id] = (offset, hasher)
+        _hashers.move_to_end(upload_id)
+        while len(_hashers) > MAX_TRACKED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def forget_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+
+def parse_checksum_header(value):
+    """Parse `Upload-Checksum: sha256 <base64 digest>` (None if absent)"""
+    if not value:
+        return None
+    algorithm, _, digest = value.partition(' ')
+    if algorithm.lower() != 'sha256' or not digest:
+        raise UploadError('Upload-Checksum must be "sha256 <base64 digest>"')
+    try:
+        return base64.b64decode(digest.strip(), validate=True)
+    except ValueError:
+        raise UploadError('Upload-Checksum digest is not valid base64')
+
+
+def create_part(upload_id):
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    open(part_path(upload_id), 'wb').close()
+
+
+@contextmanager
+def locked_part(upload_id):
+    """Exclusive lock on a part file so two requests can't write one upload"""
+    try:
+        f = open(part_path(upload_id), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Upload data is missing; start a new upload', 410)
+    try:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError('Another chunk for this upload is in progress', 409)
+        yield f
+    finally:
+        f.close()
+
+
+def write_chunk(part, upload_id, offset, total_size, stream, length, checksum=None):
+    """Write one chunk at ``offset`` into a locked part file, streaming from ``stream``.
+
+    Bytes past ``offset`` left by an interrupted request are discarded
+    first. Returns the new offset.
+    """
+    if length is None:
+        raise UploadError('Content-Length is required', 411)
+    if length > UPLOAD_CHUNK_MAX:
+        raise UploadError(f'Chunk exceeds {UPLOAD_CHUNK_MAX} bytes', 413)
+    if offset + length > total_size:
+        raise UploadError('Chunk runs past the declared upload size', 413)
+
+    part.truncate(offset)
+    part.seek(offset)
+    hasher = _take_hasher(upload_id, offset)
+    chunk_hasher = hashlib.sha256() if checksum is not None else None
+
+    received = 0
+    while received < length:
+        block = stream.read(min(BLOCK_SIZE, length - received))
+        if not block:
+            break
+        part.write(block)
+        hasher.update(block)
+        if chunk_hasher:
+            chunk_hasher.update(block)
+        received += len(block)
+    UPLOAD_BYTES.inc('chunk', amount=received)
+
+    if received != length or (chunk_hasher and chunk_hasher.digest() != checksum):
+        # Roll the part file back so the client can resend the chunk
+        rollback_chunk(part, upload_id, offset)
+        if received != length:
+            raise UploadError('Chunk body ended early', 400)
+        raise UploadError('Chunk checksum mismatch', 422)
+
+    part.flush()
+    _keep_hasher(upload_id, offset + received, hasher)
+    return offset + received
+
+
+def rollback_chunk(part, upload_id, offset):
+    """Drop everything after ``offset`` (e.g. when recording the chunk failed)"""
+    part.truncate(offset)
+    forget_hasher(upload_id)
+
+
+def verify_part(part, upload_id, size, expected_sha256=None):
+    """Check a locked part file is complete and return its sha256 hex digest"""
+    part.seek(0, os.SEEK_END)
+    if part.tell() != size:
+        raise UploadError('Upload is incomplete', 409)
+    digest = _take_hasher(upload_id, size).hexdigest()
+    if expected_sha256 and digest != expected_sha256.lower():
+        raise UploadError('File checksum does not match sha256', 422)
+    return digest
+
+
+def save_stream(stream, path):
+    """Copy a file-like object to ``path``, hashing as it goes.
+
+    Returns (sha256 hex digest, size).
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                break
+            f.write(block)
+            hasher.update(block)
+            size += len(block)
+    return hasher.hexdigest(), size
+
+
+def blob_name(digest, filename):
+    """Stored name for content with ``digest``: <sha256><ext>"""
+    ext = os.path.splitext(filename)[1].lower()
+    if not (1 < len(ext) <= 16 and ext[1:].isalnum()):
+        ext = ''
+    return f"{digest}{ext}"
+
+
+def blob_path(name):
+    return os.path.join(UPLOAD_DIR, name)
+
+
+def blob_url(name):
+    return f"{UPLOAD_URL_PREFIX}/{name}"
+
+
+def place_blob(src_path, name):
+    """Move ``src_path`` into UPLOAD_DIR as ``name`` unless the blob is already there.
+
+    Returns True if the file was moved (undo with unplace_blob), False if an
+    identical blob already existed and ``src_path`` was left alone.
+    """
+    if os.path.exists(blob_path(name)):
+        return False
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.replace(src_path, blob_path(name))
+    return True
+
+
+def unplace_blob(src_path, name):
+    os.replace(blob_path(name), src_path)
+
+
+def trash_blob(name):
+    """Move a blob whose last reference is going away out of UPLOAD_DIR.
+
+    Returns the trash path (None if the file was already gone). Until
+    purge_trash() runs, restore_blob() can put it back.
+    """
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    trash = os.path.join(UPLOAD_TMP_DIR, f"{name}.deleted")
+    try:
+        os.replace(blob_path(name), trash)
+    except FileNotFoundError:
+        return None
+    return trash
+
+
+def restore_blob(trash, name):
+    if trash:
+        os.replace(trash, blob_path(name))
+
+
+def purge_trash(trash):
+    if trash:
+        try:
+            os.remove(trash)
+        except FileNotFoundError:
+            pass
+
+
+def discard(upload_id):
+    forget_hasher(upload_id)
+    try:
+        os.remove(part_path(upload_id))
+    except FileNotFoundError:
+        pass
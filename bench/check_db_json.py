@@ -0,0 +1,140 @@
+"""
+Check that database-built JSON matches Python row shaping.
+
+    python bench/check_db_json.py [--pages 5] [--per-page 25]
+
+Runs against the database configured in .env (seed it first, e.g. with
+bench/seed_scale.py). Every endpoint that DB_JSON_ENDPOINTS can switch is
+requested through the app twice, once per mode, and the decoded documents
+must be identical:
+
+    courses     each sort, as an admin and as a student, walking --pages
+                pages with cursors (so next_cursor must match too), plus
+                offset pages 1, 2, the last one and one past the end, and
+                a search ranked by relevance
+    comments    the busiest course's discussion
+    my_courses  the student with the most enrollments
+
+Timestamps are compared as values: Postgres drops trailing zeros from
+fractional seconds, Python's isoformat() keeps six digits. Exits 1 on the
+first difference. The response cache is turned off.
+"""
+import argparse
+import os
+import re
+import sys
+from datetime import datetime
+
+os.environ['RESPONSE_CACHE_TTL'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import pooled_connection
+from app.main import app
+from app.routes.auth import create_access_token
+from app.routes.courses import COURSE_SORTS
+from app.utils import serialization
+
+TIMESTAMP_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,6})?$')
+
+
+def normalize(value):
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    if isinstance(value, str) and TIMESTAMP_RE.match(value):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def pick(cur, sql):
+    cur.execute(sql)
+    row = cur.fetchone()
+    return str(row[0]) if row else None
+
+
+def pick_subjects():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            admin = pick(cur, "SELECT id FROM users WHERE role = 'admin' ORDER BY created_at LIMIT 1")
+            student = pick(cur, """
+                SELECT student_id FROM enrollments GROUP BY student_id ORDER BY COUNT(*) DESC LIMIT 1
+            """)
+            course = pick(cur, """
+                SELECT f.course_id FROM comments c JOIN course_files f ON f.id = c.file_id
+                GROUP BY f.course_id ORDER BY COUNT(*) DESC LIMIT 1
+            """)
+            search = pick(cur, "SELECT split_part(title, ' ', 1) FROM courses ORDER BY created_at LIMIT 1")
+        conn.commit()
+    return admin, student, course, search
+
+
+def fetch(client, user_id, path, params, endpoint, use_db):
+    serialization.DB_JSON_ENDPOINTS.clear()
+    if use_db:
+        serialization.DB_JSON_ENDPOINTS.add(endpoint)
+    response = client.get(path, query_string=params,
+                          headers={'Authorization': f'Bearer {create_access_token(user_id)}'})
+    if response.status_code != 200:
+        sys.exit(f"{path} {params} ({'db' if use_db else 'python'}): HTTP {response.status_code} "
+                 f"{response.get_data(as_text=True)[:200]}")
+    return normalize(response.get_json())
+
+
+def compare(client, user_id, path, params, endpoint, label):
+    python_doc = fetch(client, user_id, path, params, endpoint, False)
+    db_doc = fetch(client, user_id, path, params, endpoint, True)
+    if python_doc != db_doc:
+        print(f"MISMATCH {label}: {path} {params}")
+        for key in sorted(set(python_doc) | set(db_doc)) if isinstance(python_doc, dict) else ():
+            if python_doc.get(key) != db_doc.get(key):
+                print(f"  {key}: python={str(python_doc.get(key))[:300]}")
+                print(f"  {key}: db    ={str(db_doc.get(key))[:300]}")
+        sys.exit(1)
+    print(f"ok {label}")
+    return python_doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--per-page', type=int, default=25)
+    args = parser.parse_args()
+
+    admin, student, course, search = pick_subjects()
+    if not admin or not student:
+        sys.exit('Need an admin and a student with enrollments; seed the database first')
+
+    client = app.test_client()
+    saved = set(serialization.DB_JSON_ENDPOINTS)
+    try:
+        for role, user_id in (('admin', admin), ('student', student)):
+            for sort in COURSE_SORTS:
+                params = {'pagination': 'cursor', 'sort': sort, 'per_page': args.per_page}
+                for page in range(1, args.pages + 1):
+                    doc = compare(client, user_id, '/api/courses/', params, 'courses',
+                                  f"courses {role} sort={sort} page {page}")
+                    cursor = doc['pagination']['next_cursor']
+                    if not cursor:
+                        break
+                    params = {'cursor': cursor, 'sort': sort, 'per_page': args.per_page}
+            doc = compare(client, user_id, '/api/courses/', {'page': 1, 'per_page': args.per_page}, 'courses',
+                          f"courses {role} offset page 1")
+            last = doc['pagination']['total_pages'] or 1
+            for page in sorted({2, last, last + 1} - {1}):
+                compare(client, user_id, '/api/courses/', {'page': page, 'per_page': args.per_page}, 'courses',
+                        f"courses {role} offset page {page}")
+            if search:
+                compare(client, user_id, '/api/courses/', {'search': search, 'per_page': args.per_page}, 'courses',
+                        f"courses {role} search={search!r}")
+        if course:
+            compare(client, admin, '/api/comments/', {'course_id': course}, 'comments', 'comments busiest course')
+        compare(client, student, '/api/enrollments/my-courses', {}, 'my_courses', 'my_courses')
+    finally:
+        serialization.DB_JSON_ENDPOINTS.clear()
+        serialization.DB_JSON_ENDPOINTS.update(saved)
+    print('db-side JSON matches Python shaping')
+
+
+if __name__ == '__main__':
+    main()
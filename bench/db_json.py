@@ -0,0 +1,99 @@
+"""
+Python row shaping vs Postgres-built JSON for the heavy listings.
+
+    python bench/db_json.py [--sizes 100,1000,10000] [--repeat 10]
+
+Runs against the database configured in .env (seed it with enough
+courses and comments first). For each size, the course listing and the
+flat comment listing are fetched both ways and encoded into a response
+body:
+
+    python  fetch tuples, rows_to_dicts(), FastJSONProvider
+    db      json_rows_sql() + raw_json_response()
+
+Reports the median wall time and the CPU time spent in this process
+(the cost a web worker pays) per request.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from app.database import pooled_connection
+from app.routes.comments import COMMENT_COLUMNS, COMMENT_SELECT
+from app.routes.courses import COURSE_COLUMNS, COURSE_FIELDS
+from app.utils.serialization import (
+    FastJSONProvider, RawJSON, json_rows_sql, raw_json_response, row_number_sql, rows_to_dicts,
+)
+
+# name -> (select list and FROM, ORDER BY, columns, params)
+LISTINGS = {
+    'courses': (f"{COURSE_FIELDS} FROM courses c LEFT JOIN users u ON c.teacher_id = u.id",
+                "ORDER BY c.created_at DESC, c.id DESC", COURSE_COLUMNS, []),
+    # is_liked is bound to a user id; nobody matches the nil uuid
+    'comments': (COMMENT_SELECT, "ORDER BY c.created_at ASC, c.id ASC", COMMENT_COLUMNS,
+                 ['00000000-0000-0000-0000-000000000000']),
+}
+
+
+def listing_query(name, numbered=False):
+    select, order_by, columns, params = LISTINGS[name]
+    row_number = f"{row_number_sql(order_by)}," if numbered else ""
+    return f"SELECT {row_number} {select} {order_by} LIMIT %s", columns, params
+
+
+def python_mode(conn, app, name, size):
+    query, columns, params = listing_query(name)
+    with conn.cursor() as cur:
+        cur.execute(query, params + [size])
+        rows = cur.fetchall()
+    conn.commit()
+    return app.json.response({name: rows_to_dicts(columns, rows)}).get_data(), len(rows)
+
+
+def db_mode(conn, app, name, size):
+    query, columns, params = listing_query(name, numbered=True)
+    with conn.cursor() as cur:
+        cur.execute(json_rows_sql(query, columns), params + [size])
+        rows_json, count = cur.fetchone()
+    conn.commit()
+    return raw_json_response({name: RawJSON(rows_json)}).get_data(), count
+
+
+def measure(fn, repeat):
+    wall, cpu = [], []
+    for _ in range(repeat):
+        started, started_cpu = time.perf_counter(), time.process_time()
+        body, count = fn()
+        wall.append((time.perf_counter() - started) * 1000)
+        cpu.append((time.process_time() - started_cpu) * 1000)
+    return statistics.median(wall), statistics.median(cpu), len(body), count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--listing', choices=sorted(LISTINGS), action='append')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"{'listing':<9} {'rows':>6} {'mode':<7} {'wall ms':>9} {'cpu ms':>9} {'KiB':>8}")
+    with app.app_context(), pooled_connection() as conn:
+        for name in args.listing or sorted(LISTINGS):
+            for size in sizes:
+                for mode, fn in (('python', python_mode), ('db', db_mode)):
+                    fn(conn, app, name, size)  # warm up caches and plans
+                    wall, cpu, length, count = measure(lambda: fn(conn, app, name, size), args.repeat)
+                    print(f"{name:<9} {count:>6} {mode:<7} {wall:>9.2f} {cpu:>9.2f} {length / 1024:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare JSON response encoding for large course listings.
+
+    python bench/json_encoding.py [--rows 10000] [--repeat 20]
+
+"legacy" is the old route code: a dict built per row with str() and
+.isoformat(), encoded by Flask's default provider. "fast" is
+rows_to_dicts() plus FastJSONProvider (orjson), and "flask" is
+rows_to_dicts() with JSON_PROVIDER=flask. Rows are shaped like what psycopg2 returns for
+GET /api/courses; no database is needed.
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from app.utils.serialization import FastJSONProvider, rows_to_dicts
+
+COURSE_COLUMNS = ['id', 'teacher_id', 'title', 'description', 'video_url', 'is_published', 'created_at',
+                  'category', 'level', 'teacher_name', 'enrolled_count']
+
+
+def make_rows(count):
+    start = datetime.datetime(2024, 1, 1, 9, 30)
+    return [
+        (str(uuid.uuid4()), str(uuid.uuid4()), f"Course {i}", "An introduction to the topic " * 4,
+         None, i % 3 != 0, start + datetime.timedelta(minutes=i, microseconds=i),
+         'programming', 'beginner', f"Teacher {i % 50}", i % 200)
+        for i in range(count)
+    ]
+
+
+def legacy_shape(rows):
+    return [{
+        'id': str(row[0]),
+        'teacher_id': str(row[1]),
+        'title': row[2],
+        'description': row[3],
+        'video_url': row[4],
+        'is_published': row[5],
+        'created_at': row[6].isoformat() if row[6] else None,
+        'category': row[7],
+        'level': row[8],
+        'teacher_name': row[9],
+        'enrolled_count': row[10] or 0,
+    } for row in rows]
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), len(fn())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+
+    def legacy():
+        return default.response({'courses': legacy_shape(rows)}).get_data()
+
+    def fast_encode():
+        return fast.response({'courses': rows_to_dicts(COURSE_COLUMNS, rows)}).get_data()
+
+    def flask_encode():
+        return default.response({'courses': rows_to_dicts(COURSE_COLUMNS, rows)}).get_data()
+
+    cases = [
+        ('legacy (per-row str/isoformat, Flask provider)', legacy),
+        ('fast (rows_to_dicts, orjson)', fast_encode),
+        ('flask (rows_to_dicts, Flask provider)', flask_encode),
+    ]
+
+    with app.app_context():
+        print(f"{args.rows} rows, median of {args.repeat} runs")
+        baseline = None
+        for label, fn in cases:
+            ms, size = timed(fn, args.repeat)
+            baseline = baseline or ms
+            print(f"  {label:<50} {ms:8.2f} ms  {size / 1024:8.0f} KiB  {baseline / ms:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""
+Load test the API: latency percentiles, throughput and SQL statements per request.
+
+    python bench/load_test.py [--url http://localhost:5001] [--duration 60] [--concurrency 16]
+                              [--mix courses=30,comments=20,comment_tree=10,my_courses=20,login=15,upload=5]
+                              [--output bench/results/run.json] [--compare bench/results/baseline.json]
+
+Run it against a server whose database was seeded with bench/seed_scale.py
+(pass the same --users). Each worker thread keeps one HTTP connection open
+and sends requests back to back, choosing scenarios by weight from --mix:
+
+    courses       GET  /api/courses/?page=&per_page=12          (student)
+    comments      GET  /api/comments/?course_id=                (student)
+    comment_tree  GET  /api/comments/tree?course_id=&limit=20   (student)
+    my_courses    GET  /api/enrollments/my-courses              (student)
+    login         POST /api/auth/login                          (student)
+    upload        POST /api/files/upload, --upload-kb of random bytes (admin)
+
+Statement counts and SQL time come from the Server-Timing header. The
+report is printed and written as JSON. With --compare, the run is
+checked against an earlier result, and the script exits with status 1
+when a scenario's p95 latency or throughput is worse than --tolerance.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlparse
+
+BENCH_DOMAIN = 'bench.local'
+BENCH_PASSWORD = 'loadtest'
+TEACHER_EVERY = 50
+DEFAULT_MIX = 'courses=30,comments=20,comment_tree=10,my_courses=20,login=15,upload=5'
+SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+class Client:
+    """One keep-alive HTTP connection"""
+
+    def __init__(self, url, timeout=30):
+        parsed = urlparse(url)
+        cls = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self.conn = cls(parsed.hostname, parsed.port, timeout=timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        try:
+            self.conn.request(method, path, body=body, headers=headers or {})
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()   # reconnects on the next request
+            raise
+        return response.status, response.getheader('Server-Timing', ''), data
+
+
+def bench_email(n):
+    return f"bench{n}@{BENCH_DOMAIN}"
+
+
+def student_numbers(users):
+    return [n for n in range(2, users) if n % TEACHER_EVERY != 1]
+
+
+def login(client, email):
+    body = json.dumps({'email': email, 'password': BENCH_PASSWORD})
+    status, _, data = client.request('POST', '/api/auth/login', body, {'Content-Type': 'application/json'})
+    if status != 200:
+        sys.exit(f"Login as {email} failed ({status}); seed the database with bench/seed_scale.py")
+    return json.loads(data)['access_token']
+
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def prepare(args):
+    """Log in the bench accounts and collect course ids to request"""
+    client = Client(args.url)
+    rng = random.Random(args.seed)
+    students = student_numbers(args.users)
+    if not students:
+        sys.exit('--users is too small to contain bench students')
+    tokens = [login(client, bench_email(n)) for n in rng.sample(students, min(args.sessions, len(students)))]
+    admin = login(client, bench_email(0))
+
+    course_ids = []
+    for page in range(1, args.course_pages + 1):
+        status, _, data = client.request('GET', f'/api/courses/?page={page}&per_page=50', headers=auth(admin))
+        if status != 200:
+            break
+        course_ids += [course['id'] for course in json.loads(data)['courses']]
+    if not course_ids:
+        sys.exit('No courses found; seed the database with bench/seed_scale.py')
+    return {'students': students, 'tokens': tokens, 'admin': admin, 'course_ids': course_ids}
+
+
+def multipart(fields, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# Each scenario returns (method, path, body, headers)
+
+def courses_request(ctx, rng, args):
+    query = urlencode({'page': rng.randint(1, 20), 'per_page': 12})
+    return 'GET', f'/api/courses/?{query}', None, auth(rng.choice(ctx['tokens']))
+
+
+def comments_request(ctx, rng, args):
+    query = urlencode({'course_id': rng.choice(ctx['course_ids'])})
+    return 'GET', f'/api/comments/?{query}', None, auth(rng.choice(ctx['tokens']))
+
+
+def comment_tree_request(ctx, rng, args):
+    query = urlencode({'course_id': rng.choice(ctx['course_ids']), 'limit': 20})
+    return 'GET', f'/api/comments/tree?{query}', None, auth(rng.choice(ctx['tokens']))
+
+
+def my_courses_request(ctx, rng, args):
+    return 'GET', '/api/enrollments/my-courses', None, auth(rng.choice(ctx['tokens']))
+
+
+def login_request(ctx, rng, args):
+    body = json.dumps({'email': bench_email(rng.choice(ctx['students'])), 'password': BENCH_PASSWORD})
+    return 'POST', '/api/auth/login', body, {'Content-Type': 'application/json'}
+
+
+def upload_request(ctx, rng, args):
+    fields = {'course_id': rng.choice(ctx['course_ids']), 'title': 'Load test upload', 'file_type': 'document'}
+    body, content_type = multipart(fields, 'load-test.bin', rng.randbytes(args.upload_kb * 1024))
+    return 'POST', '/api/files/upload', body, dict(auth(ctx['admin']), **{'Content-Type': content_type})
+
+
+SCENARIOS = {
+    'courses': courses_request,
+    'comments': comments_request,
+    'comment_tree': comment_tree_request,
+    'my_courses': my_courses_request,
+    'login': login_request,
+    'upload': upload_request,
+}
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name not in SCENARIOS:
+            sys.exit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def worker(index, args, ctx, mix, started, deadline, samples):
+    rng = random.Random(f"{args.seed}:{index}")
+    client = Client(args.url)
+    names, weights = list(mix), list(mix.values())
+    warm_until = started + args.warmup
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, body, headers = SCENARIOS[name](ctx, rng, args)
+        began = time.perf_counter()
+        try:
+            status, timing, _ = client.request(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            status, timing = 0, ''
+        elapsed = time.perf_counter() - began
+        if began < warm_until:
+            continue
+        match = SERVER_TIMING_DB.search(timing)
+        statements, db_ms = (int(match.group(2)), float(match.group(1))) if match else (None, None)
+        samples.append((name, status, elapsed * 1000, statements, db_ms))
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(s[2] for s in samples)
+    statements = [s[3] for s in samples if s[3] is not None]
+    db_times = [s[4] for s in samples if s[4] is not None]
+    errors = sum(1 for s in samples if not 200 <= s[1] < 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'rps': round(len(samples) / seconds, 2),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'statements_per_request': round(sum(statements) / len(statements), 2) if statements else None,
+        'db_ms_per_request': round(sum(db_times) / len(db_times), 2) if db_times else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"{'scenario':<13} {'reqs':>7} {'rps':>8} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'stmts':>6} {'db ms':>7}")
+    rows = sorted(report['scenarios'].items()) + [('total', report['total'])]
+    for name, s in rows:
+        def ms(value):
+            return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+        stmts = f"{s['statements_per_request']:>6.1f}" if s['statements_per_request'] is not None else f"{'-':>6}"
+        db = f"{s['db_ms_per_request']:>7.1f}" if s['db_ms_per_request'] is not None else f"{'-':>7}"
+        print(f"{name:<13} {s['requests']:>7} {s['rps']:>8.1f} {s['error_rate'] * 100:>6.1f} "
+              f"{ms(s['p50_ms'])} {ms(s['p95_ms'])} {ms(s['p99_ms'])} {stmts} {db}")
+
+
+def compare(report, baseline, tolerance):
+    """Print changes against ``baseline``; returns the regressions found"""
+    regressions = []
+    print(f"\nagainst {baseline.get('commit') or '?'} ({baseline.get('started_at', '?')}):")
+    for name, current in sorted(report['scenarios'].items()):
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+            if before.get(key) and current.get(key) is not None:
+                change = (current[key] - before[key]) / before[key]
+                changes.append(f"{key} {change * 100:+.1f}%")
+                worse = change > tolerance if key == 'p95_ms' else (key == 'rps' and change < -tolerance)
+                if worse:
+                    regressions.append(f"{name} {key} {before[key]} -> {current[key]}")
+        print(f"  {name:<13} {', '.join(changes)}")
+    for regression in regressions:
+        print(f"  REGRESSION {regression}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--duration', type=float, default=60, help='seconds measured (after --warmup)')
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='scenario=weight,...')
+    parser.add_argument('--users', type=int, default=100_000, help='--users given to seed_scale.py')
+    parser.add_argument('--sessions', type=int, default=50, help='student accounts logged in up front')
+    parser.add_argument('--course-pages', type=int, default=20, help='pages of 50 course ids to sample from')
+    parser.add_argument('--upload-kb', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON report path (default bench/results/load-<time>.json)')
+    parser.add_argument('--compare', help='earlier JSON report to check against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed p95/rps change before failing')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    ctx = prepare(args)
+    started_at = datetime.now(timezone.utc)
+    print(f"{args.concurrency} workers, {args.warmup:g}s warm-up + {args.duration:g}s against {args.url}")
+
+    samples = []   # list.append is atomic; one shared list is enough
+    started = time.perf_counter()
+    deadline = started + args.warmup + args.duration
+    threads = [threading.Thread(target=worker, args=(i, args, ctx, mix, started, deadline, samples))
+               for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    measured = max(time.perf_counter() - started - args.warmup, 1e-9)
+
+    by_scenario = {}
+    for sample in samples:
+        by_scenario.setdefault(sample[0], []).append(sample)
+    report = {
+        'started_at': started_at.isoformat(),
+        'commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'duration_s': round(measured, 2),
+        'scenarios': {name: summarize(group, measured) for name, group in by_scenario.items()},
+        'total': summarize(samples, measured),
+    }
+    print_report(report)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{started_at:%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+"""
+Seed the configured database with bench data at a chosen scale.
+
+    python bench/seed_scale.py [--users 100000] [--courses 10000] [--enrollments 1000000]
+                               [--comments 5000000] [--likes 1000000] [--notifications 2000000]
+                               [--seed 1] [--skew 1.0] [--jobs 3] [--reset]
+
+Rows are generated in Python and streamed with COPY FROM STDIN, one stream
+per table. Popularity follows a Zipf-like law (--skew, 0 for uniform):
+
+    enrollments    a few courses take most of the students
+    comments       popular courses get the busy discussions, and
+                   replies pile onto a few hot threads
+    likes          a few comments collect most of the likes
+    notifications  a few heavy recipients get most of the notifications
+
+Output is deterministic: every table has its own random stream derived
+from --seed, and ids are derived from the seed and the row number. The
+same arguments and --anchor (the "now" used for timestamps, default
+today) give the same rows, also with --jobs > 1, which loads enrollments,
+comments and notifications in parallel processes. Denormalized counters
+(enrolled_count, likes, unread counts) are reconciled at the end.
+
+Bench rows are recognisable and can be removed with --reset:
+
+    users    bench<n>@bench.local, password "loadtest"; bench0 is an admin,
+             one in TEACHER_EVERY is a teacher, the rest students
+    courses  "Bench course <n> ...", each with its discussion file
+
+Only point this at a local or throwaway database.
+"""
+import argparse
+import hashlib
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import pooled_connection
+from app.database.maintenance import (
+    reconcile_comment_likes, reconcile_enrollment_counts, reconcile_notification_counts,
+)
+
+BENCH_DOMAIN = 'bench.local'
+BENCH_PASSWORD = 'loadtest'
+TEACHER_EVERY = 50
+COPY_READ_SIZE = 1 << 20
+
+CATEGORIES = ['web-dev', 'mobile', 'data-science', 'design', 'general', 'programming', 'database', 'devops']
+LEVELS = ['beginner', 'intermediate', 'advanced']
+TOPICS = ['HTML', 'CSS', 'JavaScript', 'React', 'Python', 'SQL', 'Postgres', 'Docker', 'Kubernetes',
+          'Flutter', 'Swift', 'Figma', 'Pandas', 'Machine Learning', 'Linux', 'Git', 'TypeScript', 'Go']
+FORMATS = ['Fundamentals', 'Masterclass', 'Crash Course', 'in Practice', 'for Beginners', 'Deep Dive']
+FIRST_NAMES = ['Amina', 'Youssef', 'Sara', 'Mehdi', 'Lina', 'Omar', 'Nora', 'Karim', 'Hana', 'Adam',
+               'Ines', 'Rayan', 'Salma', 'Ilyas', 'Maya', 'Zak', 'Leila', 'Sami', 'Yara', 'Anis']
+LAST_NAMES = ['Alaoui', 'Benali', 'Chraibi', 'Dahbi', 'El Idrissi', 'Fassi', 'Ghali', 'Haddad',
+              'Idrissi', 'Jabri', 'Kettani', 'Lahlou', 'Mansouri', 'Naciri', 'Ouazzani', 'Rami']
+COMMENT_OPENERS = ['Great explanation of', 'I am stuck on', 'Can someone clarify', 'Thanks for covering',
+                   'Is there a follow-up on', 'Quick question about', 'Loved the part on']
+REPLY_OPENERS = ['Same here with', 'Try re-watching', 'This helped me with', 'Check the notes on',
+                 '+1 on', 'I solved it by revisiting']
+NOTIFICATIONS = [('New Comment on Your Course', 'Someone commented on "{topic}"'),
+                 ('Reply to Your Question', 'Your question about {topic} has a new answer'),
+                 ('Course Update', 'New material was added to {topic}'),
+                 ('Enrollment Confirmed', 'You are now enrolled in {topic}')]
+
+# Row-number spaces for derived ids
+ID_SPACES = {'users': 1, 'courses': 2, 'files': 3, 'enrollments': 4, 'comments': 5, 'likes': 6,
+             'notifications': 7}
+
+
+class Ids:
+    """Deterministic UUIDs: seed prefix | table | row number"""
+
+    def __init__(self, seed):
+        self.prefix = int.from_bytes(hashlib.blake2b(str(seed).encode(), digest_size=6).digest(), 'big') << 80
+
+    def __call__(self, table, n):
+        return str(uuid.UUID(int=self.prefix | (ID_SPACES[table] << 64) | n, version=4))
+
+
+class Skewed:
+    """Draws indexes in [0, n) with P(rank r) roughly proportional to
+    1/(r+1)**s, then scatters the ranks with a fixed permutation so the
+    popular rows aren't simply the first ones. s=0 is uniform."""
+
+    def __init__(self, rng, n, s):
+        self.rng, self.n, self.s = rng, n, s
+        self.offset = rng.randrange(n)
+        self.step = 1
+        if n > 2:
+            while True:
+                self.step = rng.randrange(1, n)
+                if math.gcd(self.step, n) == 1:
+                    break
+        self.a = 1 - s
+        self.top = (n + 1) ** self.a if s != 1 else math.log(n + 1)
+
+    def rank(self):
+        u = self.rng.random()
+        if self.s == 1:
+            x = math.exp(u * self.top)
+        else:
+            x = ((self.top - 1) * u + 1) ** (1 / self.a)
+        return min(int(x) - 1, self.n - 1)
+
+    def __call__(self):
+        return (self.rank() * self.step + self.offset) % self.n
+
+
+class CopyStream:
+    """File-like object that copy_expert() reads COPY text rows from"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = b''
+        self.count = 0
+
+    def read(self, size=-1):
+        chunks, length = [self.buffer], len(self.buffer)
+        for row in self.rows:
+            line = ('\t'.join(row) + '\n').encode()
+            chunks.append(line)
+            length += len(line)
+            self.count += 1
+            if 0 <= size <= length:
+                break
+        data = b''.join(chunks)
+        if size < 0:
+            self.buffer = b''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(conn, table, columns, rows):
+    """COPY ``rows`` (tuples of str) into ``table``; returns the row count"""
+    stream = CopyStream(rows)
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream, COPY_READ_SIZE)
+    conn.commit()
+    return stream.count
+
+
+def timed(label, fn, *args):
+    started = time.perf_counter()
+    rows = fn(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {rows:>11,} rows {elapsed:>8.1f}s {rows / elapsed if elapsed else 0:>11,.0f} rows/s",
+          flush=True)
+    return rows
+
+
+class Scale:
+    """The arguments that shape the data, shared by every loader process"""
+
+    def __init__(self, args):
+        self.seed = args.seed
+        self.skew = args.skew
+        self.users = args.users
+        self.courses = args.courses
+        self.enrollments = args.enrollments
+        self.comments = args.comments
+        self.reply_share = args.reply_share
+        self.likes = args.likes
+        self.notifications = args.notifications
+        self.anchor = datetime.combine(args.anchor, datetime.min.time())
+
+    def rng(self, table):
+        return random.Random(f"{self.seed}:{table}")
+
+    def ago(self, seconds):
+        return (self.anchor - timedelta(seconds=seconds)).isoformat(' ')
+
+    def teachers(self):
+        return array('i', range(1, self.users, TEACHER_EVERY))
+
+    def students(self):
+        return array('i', (n for n in range(2, self.users) if n % TEACHER_EVERY != 1))
+
+
+def connect_fast(conn):
+    with conn.cursor() as cur:
+        cur.execute("SET synchronous_commit = off")
+    conn.commit()
+
+
+# -- loaders (each can run in its own process) --------------------------------
+
+def load_users(scale):
+    rng, ids = scale.rng('users'), Ids(scale.seed)
+    password_hash = hashlib.sha256(BENCH_PASSWORD.encode()).hexdigest()
+
+    def rows():
+        for n in range(scale.users):
+            role = 'admin' if n == 0 else 'teacher' if n % TEACHER_EVERY == 1 else 'student'
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            yield (ids('users', n), f"bench{n}@{BENCH_DOMAIN}", password_hash, name, role,
+                   scale.ago(rng.randrange(730 * 86400)))
+    with pooled_connection() as conn:
+        connect_fast(conn)
+        return copy_rows(conn, 'users', ['id', 'email', 'password_hash', 'name', 'role', 'created_at'], rows())
+
+
+def load_courses(scale):
+    rng, ids = scale.rng('courses'), Ids(scale.seed)
+    teachers = scale.teachers()
+    teacher = Skewed(rng, len(teachers), scale.skew)   # a few teachers run many courses
+
+    def rows():
+        for i in range(scale.courses):
+            topic = rng.choice(TOPICS)
+            category = rng.choice(CATEGORIES)
+            yield (ids('courses', i), ids('users', teachers[teacher()]),
+                   f"Bench course {i}: {topic} {rng.choice(FORMATS)}",
+                   f"Learn {topic} step by step with hands-on {category} projects",
+                   category, rng.choice(LEVELS), 't' if rng.random() < 0.9 else 'f',
+                   scale.ago(rng.randrange(365 * 86400)))
+
+    def files():
+        extra = scale.courses
+        for i in range(scale.courses):
+            course_id = ids('courses', i)
+            yield ids('files', i), course_id, 'Course Discussion', 'discussion', '/course-discussion', '999'
+            for order in range(1, rng.randrange(6)):
+                file_type = rng.choice(['video', 'video', 'pdf', 'document'])
+                ext = {'video': 'mp4', 'pdf': 'pdf', 'document': 'docx'}[file_type]
+                yield (ids('files', extra), course_id, f"Lesson {order}", file_type,
+                       f"/static/uploads/bench-{i}-{order}.{ext}", str(order))
+                extra += 1
+
+    with pooled_connection() as conn:
+        connect_fast(conn)
+        count = copy_rows(conn, 'courses', ['id', 'teacher_id', 'title', 'description', 'category', 'level',
+                                            'is_published', 'created_at'], rows())
+        timed('course files', copy_rows, conn, 'course_files',
+              ['id', 'course_id', 'title', 'file_type', 'file_url', 'file_order'], files())
+        return count
+
+
+def load_enrollments(scale):
+    rng, ids = scale.rng('enrollments'), Ids(scale.seed)
+    students = scale.students()
+    course = Skewed(rng, scale.courses, scale.skew)
+    mean = scale.enrollments / len(students)
+    cap = max(scale.courses // 2, 1)
+
+    def rows():
+        n = 0
+        for student in students:
+            wanted = min(int(rng.expovariate(1 / mean) + 0.5) if mean else 0, cap)
+            taken = set()
+            draws = 0
+            while len(taken) < wanted:
+                # Fall back to uniform picks once the popular courses are taken
+                c = course() if draws < wanted * 4 else rng.randrange(scale.courses)
+                draws += 1
+                if c in taken:
+                    continue
+                taken.add(c)
+                yield (ids('enrollments', n), ids('users', student), ids('courses', c),
+                       scale.ago(rng.randrange(365 * 86400)))
+                n += 1
+
+    with pooled_connection() as conn:
+        connect_fast(conn)
+        return copy_rows(conn, 'enrollments', ['id', 'student_id', 'course_id', 'enrolled_at'], rows())
+
+
+def load_comments(scale):
+    rng, ids = scale.rng('comments'), Ids(scale.seed)
+    students = scale.students()
+    replies = int(scale.comments * scale.reply_share)
+    threads = scale.comments - replies
+    course = Skewed(rng, scale.courses, scale.skew)
+    author = Skewed(rng, len(students), scale.skew)
+    thread_course = array('i', bytes(4 * threads))
+    thread_age = array('i', bytes(4 * threads))
+
+    def rows():
+        for k in range(threads):
+            c = course()
+            age = rng.randrange(365 * 86400)
+            thread_course[k], thread_age[k] = c, age
+            yield (ids('comments', k), ids('files', c), ids('users', students[author()]), r'\N', r'\N',
+                   f"{rng.choice(COMMENT_OPENERS)} {rng.choice(TOPICS)}?", '0', scale.ago(age))
+        if not threads:
+            return
+        hot = Skewed(rng, threads, scale.skew)   # replies pile onto a few threads
+        for k in range(threads, threads + replies):
+            t = hot()
+            root = ids('comments', t)
+            yield (ids('comments', k), ids('files', thread_course[t]), ids('users', students[author()]),
+                   root, root, f"{rng.choice(REPLY_OPENERS)} {rng.choice(TOPICS)}", '0',
+                   scale.ago(max(thread_age[t] - rng.randrange(3 * 86400), 0)))
+
+    with pooled_connection() as conn:
+        connect_fast(conn)
+        return copy_rows(conn, 'comments', ['id', 'file_id', 'user_id', 'parent_id', 'root_id', 'comment',
+                                            'likes', 'created_at'], rows())
+
+
+def load_likes(scale):
+    rng, ids = scale.rng('likes'), Ids(scale.seed)
+    students = scale.students()
+    comment = Skewed(rng, scale.comments, scale.skew)
+    likes = min(scale.likes, scale.comments * len(students) // 2)
+
+    def rows():
+        seen = set()
+        n = 0
+        while n < likes:
+            c, s = comment(), rng.randrange(len(students))
+            if (c, s) in seen:
+                continue
+            seen.add((c, s))
+            yield ids('likes', n), ids('comments', c), ids('users', students[s])
+            n += 1
+
+    with pooled_connection() as conn:
+        connect_fast(conn)
+        return copy_rows(conn, 'comment_likes', ['id', 'comment_id', 'user_id'], rows())
+
+
+def load_notifications(scale):
+    rng, ids = scale.rng('notifications'), Ids(scale.seed)
+    recipient = Skewed(rng, scale.users, scale.skew)
+
+    def rows():
+        for n in range(scale.notifications):
+            title, message = rng.choice(NOTIFICATIONS)
+            age = rng.randrange(180 * 86400)
+            # Older notifications are mostly read
+            read = rng.random() < (0.9 if age > 14 * 86400 else 0.3)
+            yield (ids('notifications', n), ids('users', recipient()), title,
+                   message.format(topic=rng.choice(TOPICS)), 't' if read else 'f', scale.ago(age))
+
+    with pooled_connection() as conn:
+        connect_fast(conn)
+        return copy_rows(conn, 'notifications', ['id', 'user_id', 'title', 'message', 'is_read', 'created_at'],
+                         rows())
+
+
+def run_loader(name, scale):
+    """Process entry point: load one table and report it"""
+    return timed(name, LOADERS[name], scale)
+
+
+LOADERS = {
+    'enrollments': load_enrollments,
+    'comments': load_comments,
+    'notifications': load_notifications,
+}
+
+
+# -- reset and reconcile ------------------------------------------------------
+
+def step(conn, label, sql):
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        rows = cur.rowcount
+    conn.commit()
+    print(f"{label:<28} {max(rows, 0):>11,} rows {time.perf_counter() - started:>8.1f}s", flush=True)
+
+
+def reset(conn):
+    """Delete every bench row (and what the load test created on bench courses)"""
+    bench_users = f"SELECT id FROM users WHERE email LIKE '%@{BENCH_DOMAIN}'"
+    bench_courses = "SELECT id FROM courses WHERE title LIKE 'Bench course %'"
+    bench_files = f"SELECT id FROM course_files WHERE course_id IN ({bench_courses})"
+    step(conn, 'delete comment likes', f"""
+        DELETE FROM comment_likes WHERE user_id IN ({bench_users})
+           OR comment_id IN (SELECT id FROM comments WHERE file_id IN ({bench_files}))
+    """)
+    step(conn, 'delete comments', f"""
+        DELETE FROM comments WHERE file_id IN ({bench_files}) OR user_id IN ({bench_users})
+    """)
+    step(conn, 'delete upload sessions', f"DELETE FROM upload_sessions WHERE created_by IN ({bench_users})")
+    step(conn, 'delete course files', f"DELETE FROM course_files WHERE course_id IN ({bench_courses})")
+    step(conn, 'delete enrollments', f"""
+        DELETE FROM enrollments WHERE student_id IN ({bench_users}) OR course_id IN ({bench_courses})
+    """)
+    step(conn, 'delete courses', f"DELETE FROM courses WHERE title LIKE 'Bench course %'")
+    step(conn, 'delete notifications', f"DELETE FROM notifications WHERE user_id IN ({bench_users})")
+    step(conn, 'delete notification jobs', f"DELETE FROM notification_jobs WHERE created_by IN ({bench_users})")
+    step(conn, 'delete users', f"DELETE FROM users WHERE email LIKE '%@{BENCH_DOMAIN}'")
+
+
+def reconcile(conn):
+    for label, fn in (('enrolled_count', reconcile_enrollment_counts),
+                      ('comment likes', reconcile_comment_likes),
+                      ('unread counts', reconcile_notification_counts)):
+        started = time.perf_counter()
+        fixed = fn(conn)
+        print(f"{label:<28} {fixed:>11,} rows {time.perf_counter() - started:>8.1f}s", flush=True)
+    step(conn, 'analyze', "ANALYZE users, courses, course_files, enrollments, comments, comment_likes, notifications")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--courses', type=int, default=10_000)
+    parser.add_argument('--enrollments', type=int, default=1_000_000, help='approximate')
+    parser.add_argument('--comments', type=int, default=5_000_000)
+    parser.add_argument('--reply-share', type=float, default=0.3)
+    parser.add_argument('--likes', type=int, default=1_000_000)
+    parser.add_argument('--notifications', type=int, default=2_000_000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent; 0 spreads rows evenly')
+    parser.add_argument('--anchor', type=date.fromisoformat, default=date.today(),
+                        help='date timestamps count back from (YYYY-MM-DD)')
+    parser.add_argument('--jobs', type=int, default=3, help='tables loaded in parallel')
+    parser.add_argument('--reset', action='store_true', help='Delete existing bench rows first')
+    parser.add_argument('--reset-only', action='store_true', help='Delete bench rows and stop')
+    args = parser.parse_args()
+    if args.users < 3 or args.courses < 1:
+        sys.exit('Need --users >= 3 (an admin, a teacher and a student) and --courses >= 1')
+
+    started = time.perf_counter()
+    if args.reset or args.reset_only:
+        with pooled_connection() as conn:
+            reset(conn)
+        if args.reset_only:
+            return
+
+    scale = Scale(args)
+    timed('users', load_users, scale)
+    timed('courses', load_courses, scale)
+    if args.jobs > 1:
+        # spawn: children open their own connections instead of sharing the parent's
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=args.jobs, mp_context=context) as pool:
+            for future in [pool.submit(run_loader, name, scale) for name in LOADERS]:
+                future.result()
+    else:
+        for name in LOADERS:
+            run_loader(name, scale)
+    if scale.likes and scale.comments:
+        timed('comment likes', load_likes, scale)
+
+    with pooled_connection() as conn:
+        reconcile(conn)
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
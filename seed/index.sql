@@ -5,6 +5,9 @@
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 
+-- Trigram matching for fuzzy search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- =============================================
 -- 1. Users Table (teachers, students, admin)
 -- =============================================
@@ -29,7 +32,12 @@ CREATE TABLE courses (
     category VARCHAR(50) DEFAULT 'general',
     level VARCHAR(20) DEFAULT 'beginner',
     is_published BOOLEAN DEFAULT FALSE,
+    enrolled_count INTEGER NOT NULL DEFAULT 0, -- maintained by the enrollment routes
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED,
     CONSTRAINT check_category CHECK (category IN ('web-dev', 'mobile', 'data-science', 'design', 'general', 'programming', 'database', 'devops')),
     CONSTRAINT check_level CHECK (level IN ('beginner', 'intermediate', 'advanced'))
 );
@@ -66,6 +74,7 @@ CREATE TABLE comments (
     file_id UUID REFERENCES course_files(id),
     user_id UUID REFERENCES users(id),
     parent_id UUID REFERENCES comments(id),
+    root_id UUID REFERENCES comments(id), -- thread's top-level comment, NULL for top-level
     comment TEXT NOT NULL,
     likes INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -93,6 +102,84 @@ CREATE TABLE notifications (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Unread counter per user, maintained with every notifications write
+CREATE TABLE notification_counts (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    unread INTEGER NOT NULL DEFAULT 0
+);
+
+-- Old notifications moved out by `flask archive-notifications`, one
+-- partition per month so expired months are dropped, not deleted row by row
+CREATE TABLE notifications_archive (
+    id UUID NOT NULL,
+    user_id UUID,
+    title VARCHAR(200) NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN,
+    created_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE notifications_archive_default PARTITION OF notifications_archive DEFAULT;
+
+-- Bulk sends (POST /api/notifications/bulk), run in the background
+CREATE TABLE notification_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    created_by UUID REFERENCES users(id),
+    target_type VARCHAR(10) NOT NULL CHECK (target_type IN ('course', 'role', 'users')),
+    target JSONB NOT NULL, -- course id, role name or list of user ids
+    title VARCHAR(200) NOT NULL, -- rendered once for every recipient
+    message TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    last_user_id UUID, -- resume point: recipients are sent in user id order
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- =============================================
+-- 8. Upload Sessions Table (chunked uploads)
+-- =============================================
+CREATE TABLE upload_sessions (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    course_id UUID REFERENCES courses(id) ON DELETE CASCADE,
+    created_by UUID REFERENCES users(id),
+    filename VARCHAR(255) NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    file_type VARCHAR(10) CHECK (file_type IN ('video', 'pdf', 'document', 'discussion')),
+    file_order INTEGER DEFAULT 0,
+    total_size BIGINT NOT NULL CHECK (total_size >= 0),
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    expected_sha256 CHAR(64),
+    sha256 CHAR(64),
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'complete', 'aborted')),
+    file_id UUID REFERENCES course_files(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- =============================================
+-- 9. Media Blobs Table (content-addressed uploads)
+-- =============================================
+CREATE TABLE media_blobs (
+    name VARCHAR(100) PRIMARY KEY, -- <sha256><ext> under UPLOAD_DIR
+    sha256 CHAR(64),
+    size BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0, -- course_files rows pointing at it
+    processing_status VARCHAR(12) NOT NULL DEFAULT 'pending'
+        CHECK (processing_status IN ('pending', 'processing', 'ready', 'skipped', 'failed')),
+    media_info JSONB, -- size, duration, resolution, page count...
+    thumbnail_url TEXT,
+    preview_url TEXT,
+    transcoded_url TEXT,
+    processing_error TEXT,
+    processed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- =============================================
 -- Create Indexes for Performance
 -- =============================================
@@ -101,13 +188,39 @@ CREATE INDEX idx_courses_category ON courses(category);
 CREATE INDEX idx_courses_level ON courses(level);
 CREATE INDEX idx_courses_published ON courses(is_published);
 CREATE INDEX idx_files_course ON course_files(course_id);
+CREATE UNIQUE INDEX uq_course_files_discussion ON course_files(course_id) WHERE file_type = 'discussion';
 CREATE INDEX idx_enrollments_student ON enrollments(student_id);
-CREATE INDEX idx_enrollments_course ON enrollments(course_id);
+CREATE INDEX idx_enrollments_course_student ON enrollments(course_id, student_id);
 CREATE INDEX idx_comments_file ON comments(file_id);
 CREATE INDEX idx_comments_parent ON comments(parent_id);
 CREATE INDEX idx_comment_likes_comment ON comment_likes(comment_id);
-CREATE INDEX idx_notifications_user ON notifications(user_id);
-CREATE INDEX idx_notifications_unread ON notifications(user_id, is_read) WHERE is_read = false;
+CREATE INDEX idx_notifications_user_created_id ON notifications(user_id, created_at, id);
+CREATE INDEX idx_notifications_unread_created_id ON notifications(user_id, created_at, id) WHERE is_read = false;
+CREATE INDEX idx_notifications_created ON notifications(created_at);
+CREATE INDEX idx_upload_sessions_pending ON upload_sessions(updated_at) WHERE status = 'pending';
+CREATE INDEX idx_media_blobs_unprocessed ON media_blobs(created_at) WHERE processing_status IN ('pending', 'failed');
+
+-- Keyset pagination: one composite index per sort order (see seed/migrations/001)
+CREATE INDEX idx_courses_created_id ON courses(created_at, id);
+CREATE INDEX idx_courses_title_id ON courses(title, id);
+CREATE INDEX idx_courses_published_created_id ON courses(is_published, created_at, id);
+CREATE INDEX idx_users_created_id ON users(created_at, id);
+CREATE INDEX idx_users_role_id ON users(role, id);
+
+-- Popular sort served from the maintained counter (see seed/migrations/002)
+CREATE INDEX idx_courses_popular ON courses(enrolled_count, created_at, id);
+CREATE INDEX idx_courses_published_popular ON courses(is_published, enrolled_count, created_at, id);
+
+-- Search: full-text on courses, trigram for fuzzy/substring matches (see seed/migrations/003)
+CREATE INDEX idx_courses_search ON courses USING GIN (search_vector);
+CREATE INDEX idx_courses_title_trgm ON courses USING GIN (title gin_trgm_ops);
+CREATE INDEX idx_users_name_trgm ON users USING GIN (name gin_trgm_ops);
+CREATE INDEX idx_users_email_trgm ON users USING GIN (email gin_trgm_ops);
+
+-- Threaded comments: top-level pages per sort, replies per thread (see seed/migrations/004)
+CREATE INDEX idx_comments_threads_created ON comments(file_id, created_at, id) WHERE parent_id IS NULL;
+CREATE INDEX idx_comments_threads_likes ON comments(file_id, likes, created_at, id) WHERE parent_id IS NULL;
+CREATE INDEX idx_comments_root ON comments(root_id, created_at, id) WHERE root_id IS NOT NULL;
 
 -- =============================================
 -- Sample Data for Testing
@@ -234,6 +347,9 @@ INSERT INTO enrollments (student_id, course_id) VALUES
     (SELECT id FROM courses WHERE title = 'React.js Masterclass')
 );
 
+-- Sync the denormalized enrollment counters with the rows above
+UPDATE courses c SET enrolled_count = (SELECT COUNT(*) FROM enrollments e WHERE e.course_id = c.id);
+
 -- Insert sample comments
 INSERT INTO comments (file_id, user_id, comment, likes) VALUES
 (
@@ -250,11 +366,12 @@ INSERT INTO comments (file_id, user_id, comment, likes) VALUES
 );
 
 -- Insert sample comment replies
-INSERT INTO comments (file_id, user_id, parent_id, comment, likes) VALUES
+INSERT INTO comments (file_id, user_id, parent_id, root_id, comment, likes) VALUES
 (
     (SELECT id FROM course_files WHERE title = 'Introduction to HTML'),
     (SELECT id FROM users WHERE email = 'tom.student@school.com'),
     (SELECT id FROM comments WHERE comment LIKE '%div and span%'),
+    (SELECT id FROM comments WHERE comment LIKE '%div and span%'),
     'div is block-level, span is inline. Hope that helps!',
     1
 );
@@ -283,6 +400,10 @@ INSERT INTO notifications (user_id, title, message) VALUES
     'Tom Davis answered your question about div and span'
 );
 
+-- Sync the unread counters with the rows above
+INSERT INTO notification_counts (user_id, unread)
+SELECT user_id, COUNT(*) FILTER (WHERE is_read = false) FROM notifications GROUP BY user_id;
+
 -- =============================================
 -- Display sample data counts (optional)
 -- =============================================
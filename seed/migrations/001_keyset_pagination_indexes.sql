@@ -0,0 +1,18 @@
+-- =============================================
+-- 001 - Composite indexes for keyset (cursor) pagination
+-- =============================================
+-- Each course/user sort order ends in id so it is a total order, and each
+-- has a matching btree index (scanned backwards for DESC sorts).
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/001_keyset_pagination_indexes.sql
+
+-- sort=newest / sort=oldest
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_created_id ON courses(created_at, id);
+
+-- sort=title
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_title_id ON courses(title, id);
+
+-- students only see published courses
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_published_created_id ON courses(is_published, created_at, id);
+
+-- users listing (newest first)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_created_id ON users(created_at, id);
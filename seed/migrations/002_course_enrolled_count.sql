@@ -0,0 +1,20 @@
+-- =============================================
+-- 002 - Denormalized enrollment counter on courses
+-- =============================================
+-- courses.enrolled_count is kept in step by create/update/delete_enrollment
+-- in the same transaction as the enrollment row. If it ever drifts, run:
+--   flask --app app.main reconcile-enrollment-counts
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/002_course_enrolled_count.sql
+
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS enrolled_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from the current enrollments
+UPDATE courses c SET enrolled_count = s.actual
+FROM (
+    SELECT course_id, COUNT(*) AS actual FROM enrollments GROUP BY course_id
+) s
+WHERE c.id = s.course_id;
+
+-- sort=popular (enrolled_count DESC, created_at DESC, id DESC)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_popular ON courses(enrolled_count, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_published_popular ON courses(is_published, enrolled_count, created_at, id);
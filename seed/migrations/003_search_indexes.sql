@@ -0,0 +1,20 @@
+-- =============================================
+-- 003 - Full-text and trigram search
+-- =============================================
+-- courses.search_vector is a generated column, so Postgres keeps it in
+-- step with title/description on every write. The trigram indexes serve
+-- fuzzy title matches (<% operator) and the users name/email ILIKE search.
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/003_search_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Rewrites the courses table once to fill the column
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_search ON courses USING GIN (search_vector);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_courses_title_trgm ON courses USING GIN (title gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_name_trgm ON users USING GIN (name gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_email_trgm ON users USING GIN (email gin_trgm_ops);
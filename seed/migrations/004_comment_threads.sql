@@ -0,0 +1,25 @@
+-- =============================================
+-- 004 - Threaded comments
+-- =============================================
+-- comments.root_id materializes the top-level comment of each thread so a
+-- thread's replies can be paged from one index, whatever their depth.
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/004_comment_threads.sql
+
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS root_id UUID REFERENCES comments(id);
+
+-- Backfill: walk every thread down from its top-level comment
+WITH RECURSIVE thread AS (
+    SELECT id, id AS root FROM comments WHERE parent_id IS NULL
+    UNION ALL
+    SELECT c.id, thread.root FROM comments c JOIN thread ON c.parent_id = thread.id
+)
+UPDATE comments c SET root_id = thread.root
+FROM thread
+WHERE c.id = thread.id AND c.parent_id IS NOT NULL AND c.root_id IS DISTINCT FROM thread.root;
+
+-- Top-level comments of a file, sort=newest|oldest and sort=likes
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comments_threads_created ON comments(file_id, created_at, id) WHERE parent_id IS NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comments_threads_likes ON comments(file_id, likes, created_at, id) WHERE parent_id IS NULL;
+
+-- Replies of a thread in order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_comments_root ON comments(root_id, created_at, id) WHERE root_id IS NOT NULL;
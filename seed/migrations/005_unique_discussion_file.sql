@@ -0,0 +1,29 @@
+-- =============================================
+-- 005 - One discussion file per course
+-- =============================================
+-- create_comment used to check-then-insert the course discussion file, so
+-- concurrent first comments could create duplicates. Merge any duplicates
+-- into the oldest one, then enforce uniqueness so the upsert in
+-- CourseFileModel.get_discussion_file_id is atomic.
+-- Run: psql -d sm_db -f seed/migrations/005_unique_discussion_file.sql
+
+BEGIN;
+
+CREATE TEMP TABLE discussion_dupes ON COMMIT DROP AS
+SELECT id, keep_id FROM (
+    SELECT id,
+           first_value(id) OVER (PARTITION BY course_id ORDER BY created_at, id) AS keep_id
+    FROM course_files
+    WHERE file_type = 'discussion'
+) ranked
+WHERE id <> keep_id;
+
+UPDATE comments c SET file_id = d.keep_id
+FROM discussion_dupes d
+WHERE c.file_id = d.id;
+
+DELETE FROM course_files WHERE id IN (SELECT id FROM discussion_dupes);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_course_files_discussion ON course_files(course_id) WHERE file_type = 'discussion';
+
+COMMIT;
@@ -0,0 +1,28 @@
+-- =============================================
+-- 006 - Chunked upload sessions
+-- =============================================
+-- Tracks resumable uploads (POST/PUT /api/files/uploads) until the final
+-- chunk is in and the course_files row is created. received_bytes is the
+-- resume offset; stale pending sessions are cleaned up by
+-- `flask --app app.main purge-stale-uploads`.
+-- Run: psql -d sm_db -f seed/migrations/006_upload_sessions.sql
+
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    course_id UUID REFERENCES courses(id) ON DELETE CASCADE,
+    created_by UUID REFERENCES users(id),
+    filename VARCHAR(255) NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    file_type VARCHAR(10) CHECK (file_type IN ('video', 'pdf', 'document', 'discussion')),
+    file_order INTEGER DEFAULT 0,
+    total_size BIGINT NOT NULL CHECK (total_size >= 0),
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    expected_sha256 CHAR(64),
+    sha256 CHAR(64),
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'complete', 'aborted')),
+    file_id UUID REFERENCES course_files(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_sessions_pending ON upload_sessions(updated_at) WHERE status = 'pending';
@@ -0,0 +1,28 @@
+-- =============================================
+-- 007 - Content-addressed upload storage
+-- =============================================
+-- Uploads are now stored once per content hash (<sha256><ext>) and shared
+-- by every course_files row that points at them. media_blobs counts those
+-- references so delete_file can remove a blob with its last reference.
+-- Files uploaded before this migration keep their uuid names; they are
+-- tracked here too (without a digest) so deleting them frees the disk.
+-- Run: psql -d sm_db -f seed/migrations/007_media_blobs.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS media_blobs (
+    name VARCHAR(100) PRIMARY KEY,
+    sha256 CHAR(64),
+    size BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO media_blobs (name, ref_count)
+SELECT substr(file_url, length('/static/uploads/') + 1), COUNT(*)
+FROM course_files
+WHERE file_url LIKE '/static/uploads/%'
+GROUP BY 1
+ON CONFLICT (name) DO UPDATE SET ref_count = EXCLUDED.ref_count;
+
+COMMIT;
@@ -0,0 +1,22 @@
+-- =============================================
+-- 008 - Background media processing results
+-- =============================================
+-- Uploaded blobs are processed after upload (metadata, thumbnails, PDF
+-- previews, optional transcode) by the in-process worker pool. Results are
+-- stored per blob, so identical uploads are processed once, and get_files
+-- joins them onto each course file. Existing blobs start as pending; run
+-- `flask --app app.main process-media` to process them.
+-- Run: psql -d sm_db -f seed/migrations/008_media_processing.sql
+
+ALTER TABLE media_blobs
+    ADD COLUMN IF NOT EXISTS processing_status VARCHAR(12) NOT NULL DEFAULT 'pending'
+        CHECK (processing_status IN ('pending', 'processing', 'ready', 'skipped', 'failed')),
+    ADD COLUMN IF NOT EXISTS media_info JSONB,
+    ADD COLUMN IF NOT EXISTS thumbnail_url TEXT,
+    ADD COLUMN IF NOT EXISTS preview_url TEXT,
+    ADD COLUMN IF NOT EXISTS transcoded_url TEXT,
+    ADD COLUMN IF NOT EXISTS processing_error TEXT,
+    ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_media_blobs_unprocessed
+    ON media_blobs(created_at) WHERE processing_status IN ('pending', 'failed');
@@ -0,0 +1,30 @@
+-- =============================================
+-- 009 - Per-user notification feed
+-- =============================================
+-- GET /api/notifications/ now pages one user's feed newest first on
+-- (created_at, id), so both notification indexes lead with user_id and end
+-- with the sort key. notification_counts.unread backs the O(1)
+-- /unread-count endpoint; it is kept in step by every notifications write.
+-- If it ever drifts, run:
+--   flask --app app.main reconcile-notification-counts
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/009_notification_feed.sql
+
+CREATE TABLE IF NOT EXISTS notification_counts (
+    user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    unread INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO notification_counts (user_id, unread)
+SELECT user_id, COUNT(*) FILTER (WHERE is_read = false)
+FROM notifications
+WHERE user_id IS NOT NULL
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET unread = EXCLUDED.unread;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_user_created_id ON notifications(user_id, created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_unread_created_id
+    ON notifications(user_id, created_at, id) WHERE is_read = false;
+
+-- Superseded by the two indexes above
+DROP INDEX CONCURRENTLY IF EXISTS idx_notifications_user;
+DROP INDEX CONCURRENTLY IF EXISTS idx_notifications_unread;
@@ -0,0 +1,32 @@
+-- =============================================
+-- 010 - Bulk notification jobs
+-- =============================================
+-- POST /api/notifications/bulk records a job here and sends it in batches
+-- of INSERT ... SELECT, walking recipients in user id order. The indexes
+-- below serve those keyset walks (enrolled students of a course, users of
+-- a role). Jobs interrupted by a restart are resumed with:
+--   flask --app app.main run-notification-jobs --resume
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/010_notification_jobs.sql
+
+CREATE TABLE IF NOT EXISTS notification_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    created_by UUID REFERENCES users(id),
+    target_type VARCHAR(10) NOT NULL CHECK (target_type IN ('course', 'role', 'users')),
+    target JSONB NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    message TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    total INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    last_user_id UUID,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_enrollments_course_student ON enrollments(course_id, student_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_role_id ON users(role, id);
+
+-- Superseded by idx_enrollments_course_student
+DROP INDEX CONCURRENTLY IF EXISTS idx_enrollments_course;
@@ -0,0 +1,24 @@
+-- =============================================
+-- 011 - Notification retention and archive
+-- =============================================
+-- `flask --app app.main archive-notifications` moves notifications past
+-- their retention period (read ones after NOTIFICATION_READ_RETENTION_DAYS)
+-- into notifications_archive in batches, and drops archive partitions once
+-- they are older than NOTIFICATION_ARCHIVE_RETENTION_DAYS. The archive is
+-- range-partitioned by month; the command creates the partitions it needs.
+-- Run outside a transaction: psql -d sm_db -f seed/migrations/011_notification_archive.sql
+
+CREATE TABLE IF NOT EXISTS notifications_archive (
+    id UUID NOT NULL,
+    user_id UUID,
+    title VARCHAR(200) NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN,
+    created_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE IF NOT EXISTS notifications_archive_default PARTITION OF notifications_archive DEFAULT;
+
+-- Lets each archive batch find the oldest rows without a scan
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_notifications_created ON notifications(created_at);